@@ -52,4 +52,24 @@ def boot_wifi(ssid, password):
 
     print(">> boot.py: END")
 
-boot_wifi(config.WIFI_SSID, config.WIFI_PASSWORD)
+def boot_wifi_fast(ssid, password):
+    """ Start connecting and NTP in the background, main.py runs right away """
+    import machine
+    import network
+
+    print(">> boot.py: FAST START")
+
+    wlan = network.WLAN(mode=network.WLAN.STA)
+
+    if not wlan.isconnected():
+        wlan.connect(ssid, auth=(network.WLAN.WPA2, password), timeout=10000)
+
+    # Syncs once the network is up
+    machine.RTC().ntp_sync("pool.ntp.org", 3600)
+
+    print(">> boot.py: END")
+
+if getattr(config, "FAST_BOOT", False):
+    boot_wifi_fast(config.WIFI_SSID, config.WIFI_PASSWORD)
+else:
+    boot_wifi(config.WIFI_SSID, config.WIFI_PASSWORD)
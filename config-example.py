@@ -1,2 +1,8 @@
 WIFI_SSID = "MyWifi"
 WIFI_PASSWORD = "MyPassword"
+
+# Start polling the GPS right away, WiFi and NTP come up in the background
+FAST_BOOT = False
+
+# Ship fixes off the device, "udp://host:port" or "mqtt://host:port/topic", None to disable
+UPLINK_URL = None
@@ -0,0 +1,109 @@
+import array
+import gps_hal
+
+class Battery_Monitor:
+    """
+    Battery voltage sampled on its own schedule
+
+    poll() is called from the GPS loop between reads. Every sample_interval
+    seconds it starts an ADC conversion and collects the result on a later
+    poll, so the loop never waits for the ADC and the sampling cost does not
+    depend on how often the state is logged. The last samples readings are
+    kept in a ring for min/mean/max and a discharge rate estimate, readers
+    (logger, uplink) only look at the cache.
+    """
+
+    def __init__(self, battery, sample_interval=60, samples=16):
+        self.battery = battery
+        self.sample_interval_ms = int(sample_interval * 1000)
+        self.volts = array.array("f", [0.0] * samples)
+        self.ticks = array.array("l", [0] * samples)
+        self.size = samples
+        self.count = 0
+        self.next_idx = 0
+        self.last_start = None
+        self.pending = False
+        self.voltage = None
+        self.sample_count = 0
+        self.errors = 0
+
+    def poll(self):
+        now = gps_hal.ticks_ms()
+
+        try:
+            if self.pending:
+                voltage = self.battery.adc_collect()
+
+                if voltage is not None:
+                    self.pending = False
+                    self.add_sample(voltage, now)
+                    return
+
+            # A conversion that never completes is restarted on the next interval
+            if self.last_start is None or gps_hal.ticks_diff(now, self.last_start) >= self.sample_interval_ms:
+                self.last_start = now
+                self.battery.adc_start()
+                self.pending = True
+        except Exception:
+            self.pending = False
+            self.errors += 1
+
+    def add_sample(self, voltage, now):
+        self.voltage = voltage
+        self.volts[self.next_idx] = voltage
+        self.ticks[self.next_idx] = now
+        self.next_idx = (self.next_idx + 1) % self.size
+        self.sample_count += 1
+
+        if self.count < self.size:
+            self.count += 1
+
+    def rate_vph(self):
+        """ Volts per hour between the oldest and newest cached sample, negative while discharging """
+        if self.count < 2:
+            return None
+
+        newest = (self.next_idx - 1) % self.size
+        oldest = (self.next_idx - self.count) % self.size
+        elapsed_ms = gps_hal.ticks_diff(self.ticks[newest], self.ticks[oldest])
+
+        if elapsed_ms <= 0:
+            return None
+
+        return (self.volts[newest] - self.volts[oldest]) * 3600000 / elapsed_ms
+
+    def stats(self):
+        stats = {
+            "battery_samples": self.sample_count,
+            "battery_errors": self.errors,
+        }
+
+        if not self.count:
+            return stats
+
+        v_min = v_max = self.volts[0]
+        v_total = 0.0
+        idx = 0
+
+        while idx < self.count:
+            voltage = self.volts[idx]
+            v_total += voltage
+
+            if voltage < v_min:
+                v_min = voltage
+
+            if voltage > v_max:
+                v_max = voltage
+
+            idx += 1
+
+        stats["battery_min"] = round(v_min, 3)
+        stats["battery_mean"] = round(v_total / self.count, 3)
+        stats["battery_max"] = round(v_max, 3)
+
+        rate = self.rate_vph()
+
+        if rate is not None:
+            stats["battery_rate_vph"] = round(rate, 4)
+
+        return stats
@@ -0,0 +1,116 @@
+import gps_hal
+
+class Buffered_Writer:
+    """
+    Write-behind buffer for the SD card log file
+
+    Records are collected in a preallocated bytearray of max_bytes and
+    written out in one go when flush_records records are buffered, when
+    flush_interval seconds passed since the last flush, when the buffer
+    would overflow, and on close(). With fsync the file system is synced
+    after every flush. A record can be written in parts with write_part()
+    followed by end_record().
+    """
+
+    def __init__(self, max_bytes=4096, flush_records=6, flush_interval=60, fsync=False):
+        self.buf = bytearray(max_bytes)
+        self.buf_len = 0
+        self.records = 0
+        self.flush_records = flush_records
+        self.flush_interval_ms = int(flush_interval * 1000)
+        self.fsync = fsync
+        self.fh = None
+        self.last_flush = gps_hal.ticks_ms()
+        self.flush_count = 0
+        self.flush_bytes = 0
+        self.flush_us_last = 0
+        self.flush_us_max = 0
+        self.flush_us_total = 0
+
+    def __str__(self):
+        return str(self.stats())
+
+    def stats(self):
+        return {
+            "flush_count": self.flush_count,
+            "flush_bytes": self.flush_bytes,
+            "flush_us_last": self.flush_us_last,
+            "flush_us_max": self.flush_us_max,
+            "flush_us_avg": self.flush_us_total // self.flush_count if self.flush_count else 0,
+            "buffered": self.buf_len,
+        }
+
+    def open(self, filename):
+        self.close()
+        self.fh = open(filename, "ab")
+        self.last_flush = gps_hal.ticks_ms()
+        return self.fh
+
+    def close(self):
+        if not self.fh:
+            return
+
+        self.flush()
+        self.fh.close()
+        self.fh = None
+
+    def write(self, data):
+        self.write_part(data)
+        self.end_record()
+
+    def write_part(self, data):
+        """ Append data to the current record, see end_record() """
+        if isinstance(data, str):
+            data = data.encode("ascii")
+
+        data_len = len(data)
+
+        if self.buf_len + data_len > len(self.buf):
+            self.flush()
+
+        if data_len > len(self.buf):
+            self.flush(data)
+            return
+
+        self.buf[self.buf_len:self.buf_len + data_len] = data
+        self.buf_len += data_len
+
+    def end_record(self):
+        self.records += 1
+
+        if self.records >= self.flush_records or gps_hal.ticks_diff(gps_hal.ticks_ms(), self.last_flush) >= self.flush_interval_ms:
+            self.flush()
+
+    def flush(self, data=None):
+        """ Write out the buffer, followed by data if given """
+        self.last_flush = gps_hal.ticks_ms()
+
+        if not self.fh or (self.buf_len == 0 and data is None):
+            return
+
+        start = gps_hal.ticks_us()
+        nbytes = self.buf_len
+
+        if self.buf_len:
+            self.fh.write(memoryview(self.buf)[:self.buf_len])
+
+        if data is not None:
+            self.fh.write(data)
+            nbytes += len(data)
+
+        self.fh.flush()
+
+        if self.fsync:
+            gps_hal.fsync(self.fh)
+
+        elapsed = gps_hal.ticks_diff(gps_hal.ticks_us(), start)
+
+        self.buf_len = 0
+        self.records = 0
+        self.flush_count += 1
+        self.flush_bytes += nbytes
+        self.flush_us_last = elapsed
+        self.flush_us_total += elapsed
+
+        if elapsed > self.flush_us_max:
+            self.flush_us_max = elapsed
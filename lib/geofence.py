@@ -0,0 +1,222 @@
+"""
+Geofences with a grid index
+
+Fences are read from a text file on the SD card, one polygon per line:
+
+    name,lat1,lon1,lat2,lon2,lat3,lon3[,...]
+
+Blank lines and lines starting with # are skipped, the polygon closes back
+to its first vertex. Malformed lines are skipped and counted in
+geofence_bad_lines. All vertices go into one float array, each fence is a
+start/count pair plus a bounding box. The index maps every grid cell of
+cell_size degrees that a fence's bounding box touches to the fences in it,
+so a fix is only tested against the fences of its own cell. Fences covering
+more than max_cells cells are kept in a short list tested on every fix
+instead, a bounding box test rules most of them out.
+"""
+import array
+import gps_hal
+
+class Geofence_Index:
+    def __init__(self, cell_size=0.01, max_cells=64, max_events=32):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cols = int(360 / cell_size) + 1
+        self.max_events = max_events
+        self.names = []
+        self.points = array.array("f")
+        self.starts = array.array("I")
+        self.counts = array.array("H")
+        self.bbox = array.array("f")
+        self.cells = {}
+        self.large = array.array("H")
+        self.inside = []
+        self.events = []
+        self.checks = 0
+        self.candidates = 0
+        self.us_last = 0
+        self.us_max = 0
+        self.us_total = 0
+        self.dropped = 0
+        self.bad_lines = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def stats(self):
+        return {
+            "geofence_count": len(self.names),
+            "geofence_cells": len(self.cells),
+            "geofence_large": len(self.large),
+            "geofence_inside": len(self.inside),
+            "geofence_candidates": self.candidates,
+            "geofence_us_last": self.us_last,
+            "geofence_us_max": self.us_max,
+            "geofence_us_avg": self.us_total // self.checks if self.checks else 0,
+            "geofence_dropped": self.dropped,
+            "geofence_bad_lines": self.bad_lines,
+        }
+
+    def cell_key(self, lat, lon):
+        return int((lat + 90) / self.cell_size) * self.cols + int((lon + 180) / self.cell_size)
+
+    def add(self, name, vertices):
+        """ vertices is a flat sequence lat1, lon1, lat2, lon2, ... """
+        count = len(vertices) // 2
+
+        if count < 3 or len(vertices) % 2:
+            raise ValueError("Fence {} needs at least 3 lat,lon vertices".format(name))
+
+        fence_id = len(self.names)
+        self.names.append(name)
+        self.starts.append(len(self.points))
+        self.counts.append(count)
+
+        lat_min = lat_max = vertices[0]
+        lon_min = lon_max = vertices[1]
+        idx = 0
+
+        while idx < count * 2:
+            lat = vertices[idx]
+            lon = vertices[idx + 1]
+            self.points.append(lat)
+            self.points.append(lon)
+            lat_min = min(lat_min, lat)
+            lat_max = max(lat_max, lat)
+            lon_min = min(lon_min, lon)
+            lon_max = max(lon_max, lon)
+            idx += 2
+
+        self.bbox.extend((lat_min, lon_min, lat_max, lon_max))
+
+        row = int((lat_min + 90) / self.cell_size)
+        row_end = int((lat_max + 90) / self.cell_size)
+        col_start = int((lon_min + 180) / self.cell_size)
+        col_end = int((lon_max + 180) / self.cell_size)
+
+        if (row_end - row + 1) * (col_end - col_start + 1) > self.max_cells:
+            self.large.append(fence_id)
+            return
+
+        while row <= row_end:
+            col = col_start
+
+            while col <= col_end:
+                key = row * self.cols + col
+                bucket = self.cells.get(key)
+
+                if bucket is None:
+                    bucket = self.cells[key] = array.array("H")
+
+                bucket.append(fence_id)
+                col += 1
+
+            row += 1
+
+    def load(self, filename):
+        """ Add the fences in filename, returns the number added """
+        added = 0
+
+        with open(filename, "r") as fh:
+            for line in fh:
+                line = line.strip()
+
+                if not line or line[0] == "#":
+                    continue
+
+                fields = line.split(",")
+
+                try:
+                    self.add(fields[0], [float(value) for value in fields[1:]])
+                except ValueError:
+                    self.bad_lines += 1
+                    continue
+
+                added += 1
+
+        return added
+
+    def contains(self, fence_id, lat, lon):
+        """ Ray casting point in polygon test """
+        box = fence_id * 4
+
+        if lat < self.bbox[box] or lon < self.bbox[box + 1] or lat > self.bbox[box + 2] or lon > self.bbox[box + 3]:
+            return False
+
+        pts = self.points
+        idx = self.starts[fence_id]
+        end = idx + self.counts[fence_id] * 2
+        prev = end - 2
+        inside = False
+
+        while idx < end:
+            lat_i = pts[idx]
+            lat_j = pts[prev]
+
+            if (lat_i > lat) != (lat_j > lat):
+                lon_i = pts[idx + 1]
+
+                if lon < (pts[prev + 1] - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                    inside = not inside
+
+            prev = idx
+            idx += 2
+
+        return inside
+
+    def check(self, lat, lon, tod=None):
+        """ Test a fix, record enter/exit events for fences whose state changed """
+        start = gps_hal.ticks_us()
+        bucket = self.cells.get(self.cell_key(lat, lon), ())
+        now_inside = []
+
+        for fence_id in bucket:
+            self.check_fence(fence_id, lat, lon, tod, now_inside)
+
+        for fence_id in self.large:
+            self.check_fence(fence_id, lat, lon, tod, now_inside)
+
+        for fence_id in self.inside:
+            if fence_id not in now_inside:
+                self.event("exit", fence_id, tod)
+
+        self.inside = now_inside
+
+        elapsed = gps_hal.ticks_diff(gps_hal.ticks_us(), start)
+        self.checks += 1
+        self.candidates = len(bucket) + len(self.large)
+        self.us_last = elapsed
+        self.us_total += elapsed
+
+        if elapsed > self.us_max:
+            self.us_max = elapsed
+
+    def check_fence(self, fence_id, lat, lon, tod, now_inside):
+        if self.contains(fence_id, lat, lon):
+            now_inside.append(fence_id)
+
+            if fence_id not in self.inside:
+                self.event("enter", fence_id, tod)
+
+    def event(self, kind, fence_id, tod):
+        if len(self.events) >= self.max_events:
+            self.events.pop(0)
+            self.dropped += 1
+
+        self.events.append((kind, self.names[fence_id], tod))
+
+    def take_events(self):
+        events = self.events
+        self.events = []
+        return events
+
+def load(filename, cell_size=0.01):
+    """ Geofence_Index for filename, None if there is no such file """
+    index = Geofence_Index(cell_size)
+
+    try:
+        index.load(filename)
+    except OSError:
+        return None
+
+    return index
@@ -0,0 +1,120 @@
+"""
+Hot start aiding for the L76
+
+The last good fix is saved to a small JSON file (flash on the Pytrack) at
+most every save_interval seconds, and only when it moved at least
+min_move_m meters from the saved position so a parked tracker does not keep
+rewriting flash. On start up startup_cmds() returns the
+commands to queue ahead of the configuration:
+
+    $PMTK741,lat,lon,alt,YYYY,MM,DD,hh,mm,ss   reference position and time
+    $PMTK740,YYYY,MM,DD,hh,mm,ss               time only, no saved position
+    $PMTK869,0                                 query the EASY (self generated
+                                               orbit prediction) state
+
+The time injected must be the current UTC, so it is only sent when the RTC
+holds a valid time or the file says when the board is due to wake up (a
+duty cycle sleep), never the time of the saved fix itself.
+"""
+import json
+import math
+import time
+import gps_hal
+
+METERS_PER_DEGREE = 111320
+
+class GPS_Aiding:
+    def __init__(self, filename, save_interval=300, min_move_m=100):
+        self.filename = filename
+        self.save_interval_ms = int(save_interval * 1000)
+        self.min_move_m = min_move_m
+        self.last_save = None
+        self.saved = self.load()
+        self.saved_ll = None
+        self.skipped = 0
+
+        if self.saved and "lat" in self.saved and "lon" in self.saved:
+            self.saved_ll = (self.saved["lat"], self.saved["lon"])
+
+    def load(self):
+        try:
+            with open(self.filename, "r") as fh:
+                return json.loads(fh.read())
+        except (OSError, ValueError):
+            return None
+
+    def save(self, fix, resume_in=None, force=False):
+        """ Save fix if it is valid and due, resume_in is the seconds until the next wake if going to sleep """
+        if not fix.valid or fix.lat is None:
+            return False
+
+        now = gps_hal.ticks_ms()
+
+        if not force and self.last_save is not None and gps_hal.ticks_diff(now, self.last_save) < self.save_interval_ms:
+            return False
+
+        # A forced save before a sleep still goes out for the new resume time
+        if not force and not self.moved(fix.lat, fix.lon):
+            self.last_save = now
+            self.skipped += 1
+            return False
+
+        saved = {
+            "lat": fix.lat,
+            "lon": fix.lon,
+            "alt": fix.alt if fix.alt is not None else 0.0,
+        }
+
+        if resume_in is not None and self.clock_valid():
+            saved["resume_utc"] = int(time.time()) + resume_in
+
+        try:
+            with open(self.filename, "w") as fh:
+                fh.write(json.dumps(saved))
+        except OSError:
+            return False
+
+        self.last_save = now
+        self.saved_ll = (fix.lat, fix.lon)
+        return True
+
+    def moved(self, lat, lon):
+        """ True if lat, lon is at least min_move_m from the saved position """
+        if self.saved_ll is None:
+            return True
+
+        dlat = (lat - self.saved_ll[0]) * METERS_PER_DEGREE
+        dlon = (lon - self.saved_ll[1]) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+
+        return dlat * dlat + dlon * dlon >= self.min_move_m * self.min_move_m
+
+    @staticmethod
+    def clock_valid():
+        return time.localtime()[0] > 2010
+
+    def current_utc(self):
+        """ Best guess of the current time as a localtime() tuple, None if unknown """
+        if self.clock_valid():
+            return time.localtime()
+
+        if self.saved and "resume_utc" in self.saved:
+            return time.localtime(self.saved["resume_utc"] + gps_hal.uptime_ms() // 1000)
+
+        return None
+
+    def startup_cmds(self):
+        """ [(cmd, wait_for)] to queue before the L76 configuration """
+        cmds = []
+        utc = self.current_utc()
+
+        if utc is not None:
+            utc_fields = "%04d,%02d,%02d,%02d,%02d,%02d" % tuple(utc[:6])
+
+            if self.saved and "lat" in self.saved:
+                cmds.append(("$PMTK741,%.6f,%.6f,%.1f,%s" % (self.saved["lat"], self.saved["lon"], self.saved["alt"], utc_fields), None))
+            else:
+                cmds.append(("$PMTK740," + utc_fields, None))
+
+        cmds.append(("$PMTK869,0", "$PMTK869,2"))
+
+        return cmds
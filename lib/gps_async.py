@@ -0,0 +1,130 @@
+"""
+Cooperative task mode for GPS_Poller
+
+The I2C reader, sentence parser, PMTK command sender and logger run as
+separate tasks (uasyncio on the device, asyncio on CPython). The reader only
+drains the L76 and queues complete sentences, so parsing and logging no
+longer decide when the next read happens. Start with GPS_Poller.run(use_async=True).
+"""
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+import time
+
+try:
+    sleep_ms = asyncio.sleep_ms # pylint: disable=E1101
+except AttributeError:
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+class Async_Queue:
+    """ Bounded FIFO between tasks, put_nowait() drops and counts when full """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = []
+        self.event = asyncio.Event()
+        self.drops = 0
+        self.max_len = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put_nowait(self, item):
+        if len(self.items) >= self.maxsize:
+            self.drops += 1
+            return False
+
+        self.items.append(item)
+
+        if len(self.items) > self.max_len:
+            self.max_len = len(self.items)
+
+        self.event.set()
+        return True
+
+    async def get(self):
+        while not self.items:
+            self.event.clear()
+            await self.event.wait()
+
+        return self.items.pop(0)
+
+class GPS_Async_Runner:
+    def __init__(self, poller, log_interval=10, queue_size=64):
+        self.poller = poller
+        self.log_interval = log_interval
+        self.sentences = Async_Queue(queue_size)
+        self.last_read_len = 0
+
+    def stats(self):
+        return {
+            "async_queue_max": self.sentences.max_len,
+            "async_queue_drops": self.sentences.drops,
+        }
+
+    def queue_sentence(self, buf, start, end):
+        self.sentences.put_nowait(buf[start:end])
+
+    async def reader(self):
+        poller = self.poller
+        on_sentence = self.queue_sentence
+        poller.start_polling()
+
+        while True:
+            buf_len = poller.read_gps(on_sentence)
+            self.last_read_len = buf_len
+
+            delay_ms = poller.sched.next_delay_ms(buf_len, poller.cmds.pending() > 0)
+
+            if poller.mem is not None:
+                poller.mem.idle(delay_ms)
+
+            await sleep_ms(delay_ms)
+
+    async def parser(self):
+        while True:
+            pkt = await self.sentences.get()
+            self.poller.handle_sentence(pkt, 0, len(pkt))
+
+    async def commander(self):
+        poller = self.poller
+
+        while True:
+            # Only write while the L76 is not handing us a full buffer
+            poller.cmds.poll(can_write=self.last_read_len < 254)
+
+            poller.bus.run_idle(self.last_read_len)
+
+            await sleep_ms(poller.sched.cmd_delay_ms if poller.cmds.pending() else poller.sched.max_delay_ms)
+
+    async def logger(self):
+        poller = self.poller
+        poller.next_log_time = time.time() + self.log_interval
+
+        while True:
+            await sleep_ms(int(max(0, poller.next_log_time - time.time()) * 1000))
+            poller.next_log_time = time.time() + self.log_interval
+            poller.update_stats()
+            poller.state.update(self.stats())
+            poller.gps_log.log_state()
+
+    async def run(self):
+        tasks = [
+            asyncio.create_task(self.reader()),
+            asyncio.create_task(self.parser()),
+            asyncio.create_task(self.commander()),
+            asyncio.create_task(self.logger()),
+        ]
+
+        # The tasks only return by raising, surface the first failure
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+def run(poller, log_interval=10):
+    asyncio.run(GPS_Async_Runner(poller, log_interval).run())
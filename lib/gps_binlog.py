@@ -0,0 +1,165 @@
+"""
+Fixed width binary log records
+
+A file starts with a header:
+    magic "GPSB", version, flags, record size (little endian "<4sBBH")
+followed by records packed with RECORD_FORMAT and a trailing CRC32 of the
+record bytes. Numbers are scaled to integers, fields without a value are
+stored as the sentinel of their type. decode_record() is shared with the host
+side decoder in tools/gpslog.
+"""
+import struct
+
+try:
+    from ubinascii import crc32
+except ImportError:
+    from binascii import crc32
+
+MAGIC = b"GPSB"
+VERSION = 1
+HEADER_FORMAT = "<4sBBH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+FLAG_VALID = 0x01
+FLAG_BATTERY_OK = 0x02
+
+# (name, struct type, scale), values are stored as round(value * scale)
+RECORD_FIELDS = (
+    ("log_year", "H", 1),
+    ("log_month", "B", 1),
+    ("log_day", "B", 1),
+    ("log_hour", "B", 1),
+    ("log_minute", "B", 1),
+    ("log_second", "B", 1),
+    ("year", "H", 1),
+    ("month", "B", 1),
+    ("day", "B", 1),
+    ("hour", "B", 1),
+    ("minute", "B", 1),
+    ("second", "H", 1000),
+    ("lat", "i", 10000000),
+    ("lon", "i", 10000000),
+    ("alt", "i", 100),
+    ("speed", "H", 100),
+    ("course", "H", 100),
+    ("hdop", "H", 100),
+    ("pdop", "H", 100),
+    ("vdop", "H", 100),
+    ("sats", "B", 1),
+    ("quality", "B", 1),
+    ("fix_type", "B", 1),
+    ("vel_e", "h", 100),
+    ("vel_n", "h", 100),
+    ("vel_u", "h", 100),
+    ("flags", "B", 1),
+    ("battery", "H", 1000),
+    ("count", "I", 1),
+    ("mem_free", "I", 1),
+    ("epoch", "I", 1),
+)
+
+RECORD_FORMAT = "<" + "".join([field[1] for field in RECORD_FIELDS])
+RECORD_DATA_SIZE = struct.calcsize(RECORD_FORMAT)
+RECORD_SIZE = RECORD_DATA_SIZE + 4
+
+SENTINEL = {
+    "B": 0xFF,
+    "H": 0xFFFF,
+    "I": 0xFFFFFFFF,
+    "h": -0x8000,
+    "i": -0x80000000,
+}
+
+def header():
+    return struct.pack(HEADER_FORMAT, MAGIC, VERSION, 0, RECORD_SIZE)
+
+def check_header(data):
+    """ Returns the record size of a file header, raises ValueError if not a binary log """
+    magic, version, _, record_size = struct.unpack(HEADER_FORMAT, data)
+
+    if magic != MAGIC:
+        raise ValueError("Not a binary GPS log")
+
+    if version > VERSION:
+        raise ValueError("Unsupported binary GPS log version %d" % version)
+
+    return record_size
+
+class Binlog_Encoder:
+    """ Packs log records into one preallocated buffer """
+
+    def __init__(self):
+        self.buf = bytearray(RECORD_SIZE)
+        self.values = [0] * len(RECORD_FIELDS)
+
+    def encode(self, tm, fix, battery, battery_ok, count, mem_free):
+        """
+        tm is the time.localtime() of the record, fix a GPS_Fix. Returns the
+        internal buffer, valid until the next call.
+        """
+        flags = 0
+
+        if fix.valid:
+            flags |= FLAG_VALID
+
+        if battery_ok:
+            flags |= FLAG_BATTERY_OK
+
+        src = {
+            "log_year": tm[0],
+            "log_month": tm[1],
+            "log_day": tm[2],
+            "log_hour": tm[3],
+            "log_minute": tm[4],
+            "log_second": tm[5],
+            "flags": flags,
+            "battery": battery,
+            "count": count,
+            "mem_free": mem_free,
+        }
+
+        values = self.values
+
+        for idx, (name, typ, scale) in enumerate(RECORD_FIELDS):
+            if name in src:
+                value = src[name]
+            else:
+                value = getattr(fix, name)
+
+            if value is None:
+                values[idx] = SENTINEL[typ]
+            elif scale == 1:
+                values[idx] = int(value)
+            else:
+                values[idx] = int(round(value * scale))
+
+        struct.pack_into(RECORD_FORMAT, self.buf, 0, *values)
+        struct.pack_into("<I", self.buf, RECORD_DATA_SIZE, crc32(memoryview(self.buf)[:RECORD_DATA_SIZE]) & 0xFFFFFFFF)
+
+        return self.buf
+
+def decode_record(data):
+    """ Returns a dict of the record in data, None if the CRC does not match """
+    if len(data) < RECORD_SIZE:
+        return None
+
+    chksum = struct.unpack_from("<I", data, RECORD_DATA_SIZE)[0]
+
+    if crc32(data[:RECORD_DATA_SIZE]) & 0xFFFFFFFF != chksum:
+        return None
+
+    record = {}
+
+    for (name, typ, scale), value in zip(RECORD_FIELDS, struct.unpack_from(RECORD_FORMAT, data, 0)):
+        if value == SENTINEL[typ]:
+            record[name] = None
+        elif scale == 1:
+            record[name] = value
+        else:
+            record[name] = value / scale
+
+    flags = record.pop("flags")
+    record["valid"] = bool(flags & FLAG_VALID)
+    record["battery_status"] = "OK" if flags & FLAG_BATTERY_OK else "ERROR"
+
+    return record
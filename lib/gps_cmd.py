@@ -0,0 +1,181 @@
+import gps_hal
+import nmea
+
+class GPS_Cmd:
+    """ One queued L76 command and its retry state """
+
+    def __init__(self, cmd, wait_for, timeout_ms, retries, backoff_ms):
+        data = cmd.encode("ascii")
+        self.cmd = cmd
+        self.frame = (cmd + "*%02X\r\n" % nmea.checksum(data, 1, len(data))).encode("ascii")
+        self.wait_for = wait_for
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self.backoff_ms = backoff_ms
+        self.attempts = 0
+        self.sent_ms = None
+        self.next_try_ms = None
+
+        # By default expect a $PMTK001,<cmd>,3 (success) and match acks by command id
+        self.ack_id = None
+        if wait_for is None and cmd.startswith("$PMTK"):
+            self.ack_id = cmd[5:8]
+
+    def match_key(self):
+        return self.ack_id if self.ack_id else self.wait_for
+
+class Cmd_Engine:
+    """
+    Pipelined command sender for the L76
+
+    Up to max_inflight queued commands are written in a single I2C write as
+    long as their acknowledgements can be told apart. $PMTK commands are
+    matched by the command id in $PMTK001,<cmd>,<flag>: 3 is success, 0
+    (invalid) and 1 (unsupported) fail the command, 2 (failed) retries it.
+    Other commands complete when a sentence starting with wait_for arrives,
+    an empty wait_for sends without waiting. Timeouts and failed acks are
+    retried up to retries times with exponential backoff.
+    """
+
+    ACK_PREFIX = "$PMTK001,"
+
+    def __init__(self, write, errlog, max_inflight=4, max_batch=255):
+        self.write = write
+        self.errlog = errlog
+        self.max_inflight = max_inflight
+        self.max_batch = max_batch
+        self.queue = []
+        self.inflight = []
+        self.start_ms = None
+        self.config_ms = None
+        self.sent = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+
+    def stats(self):
+        stats = {
+            "cmd_sent": self.sent,
+            "cmd_batches": self.batches,
+            "cmd_retries": self.retried,
+            "cmd_failed": self.failed,
+        }
+
+        if self.config_ms is not None:
+            stats["cmd_config_ms"] = self.config_ms
+
+        return stats
+
+    def pending(self):
+        return len(self.queue) + len(self.inflight)
+
+    def add(self, cmd, wait_for=None, timeout=10, retries=3, backoff=1):
+        if self.start_ms is None:
+            self.start_ms = gps_hal.ticks_ms()
+
+        self.queue.append(GPS_Cmd(cmd, wait_for, int(timeout * 1000), retries, int(backoff * 1000)))
+
+    def done(self, gps_cmd):
+        self.inflight.remove(gps_cmd)
+        self.check_configured()
+
+    def check_configured(self):
+        # Time from the first queued command until everything was acknowledged
+        if self.config_ms is None and self.start_ms is not None and not self.pending():
+            self.config_ms = gps_hal.ticks_diff(gps_hal.ticks_ms(), self.start_ms)
+
+    def retry(self, gps_cmd, now, reason):
+        self.inflight.remove(gps_cmd)
+
+        if gps_cmd.attempts > gps_cmd.retries:
+            self.failed += 1
+            self.errlog("cmd_fail", "Giving up on {} after {} attempts: {}", gps_cmd.cmd, gps_cmd.attempts, reason)
+            self.check_configured()
+            return
+
+        self.retried += 1
+        gps_cmd.next_try_ms = gps_hal.ticks_add(now, gps_cmd.backoff_ms << (gps_cmd.attempts - 1))
+
+        # Retries go ahead of the commands not sent yet
+        self.queue.insert(0, gps_cmd)
+
+    def poll(self, can_write=True):
+        """ Expire timed out commands and, if can_write, send the next batch """
+        now = gps_hal.ticks_ms()
+
+        for gps_cmd in list(self.inflight):
+            if gps_hal.ticks_diff(now, gps_cmd.sent_ms) > gps_cmd.timeout_ms:
+                self.errlog("cmd_timeout", "Timeout sending {}", gps_cmd.cmd)
+                self.retry(gps_cmd, now, "timeout")
+
+        if not can_write or not self.queue:
+            return
+
+        batch = []
+        batch_len = 0
+        busy = [gps_cmd.match_key() for gps_cmd in self.inflight]
+
+        # Send in queue order, stop at the first command that has to wait
+        while self.queue and len(self.inflight) + len(batch) < self.max_inflight:
+            gps_cmd = self.queue[0]
+            key = gps_cmd.match_key()
+
+            if gps_cmd.next_try_ms is not None and gps_hal.ticks_diff(gps_cmd.next_try_ms, now) > 0:
+                break
+
+            if key and key in busy:
+                break
+
+            if batch_len + len(gps_cmd.frame) > self.max_batch and batch:
+                break
+
+            self.queue.pop(0)
+            batch.append(gps_cmd)
+            batch_len += len(gps_cmd.frame)
+
+            if key:
+                busy.append(key)
+
+        if not batch:
+            return
+
+        self.write(b"".join([gps_cmd.frame for gps_cmd in batch]))
+        self.batches += 1
+
+        for gps_cmd in batch:
+            gps_cmd.attempts += 1
+            gps_cmd.sent_ms = now
+            self.sent += 1
+
+            if gps_cmd.match_key():
+                self.inflight.append(gps_cmd)
+
+        self.check_configured()
+
+    def response(self, pkt):
+        """ Match a received sentence against the commands waiting for an ack """
+        if not self.inflight:
+            return
+
+        if pkt.startswith(self.ACK_PREFIX):
+            fields = pkt[:pkt.find("*")].split(",")
+
+            if len(fields) >= 3:
+                for gps_cmd in self.inflight:
+                    if gps_cmd.ack_id == fields[1]:
+                        if fields[2] == "3":
+                            self.done(gps_cmd)
+                        elif fields[2] == "2":
+                            self.retry(gps_cmd, gps_hal.ticks_ms(), "failed")
+                        else:
+                            # Invalid or unsupported, retrying will not help
+                            self.inflight.remove(gps_cmd)
+                            self.failed += 1
+                            self.errlog("cmd_fail", "{} rejected with flag {}", gps_cmd.cmd, fields[2])
+                            self.check_configured()
+                        return
+
+        for gps_cmd in self.inflight:
+            if gps_cmd.wait_for and pkt.startswith(gps_cmd.wait_for):
+                self.done(gps_cmd)
+                return
@@ -0,0 +1,113 @@
+"""
+Delta encoded JSON log records
+
+A keyframe is the full log record with "_keyframe": true. The records that
+follow only carry the keys whose values changed since the previous record,
+one level deep into nested dicts such as "state" and "fix". Keys that
+disappeared are listed in "_removed" as [key] or [key, subkey] paths.
+Delta_Reader rebuilds the full records.
+"""
+
+KEYFRAME = "_keyframe"
+REMOVED = "_removed"
+
+class Delta_Encoder:
+    def __init__(self, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval
+        self.prev = None
+        self.since_keyframe = 0
+
+    def reset(self):
+        """ Force a keyframe on the next record, eg. when a new file is started """
+        self.prev = None
+
+    def encode(self, entry):
+        """ Returns the dict to log for entry """
+        if self.prev is None or self.since_keyframe >= self.keyframe_interval:
+            out = dict(entry)
+            out[KEYFRAME] = True
+            self.since_keyframe = 0
+        else:
+            out = self.diff(self.prev, entry)
+            self.since_keyframe += 1
+
+        self.prev = self.snapshot(entry)
+
+        return out
+
+    @staticmethod
+    def snapshot(entry):
+        snap = {}
+
+        for key, value in entry.items():
+            snap[key] = dict(value) if isinstance(value, dict) else value
+
+        return snap
+
+    @staticmethod
+    def diff(prev, entry):
+        out = {}
+        removed = []
+
+        for key, value in entry.items():
+            prev_value = prev.get(key, REMOVED)
+
+            if isinstance(value, dict) and isinstance(prev_value, dict):
+                changed = {}
+
+                for sub_key, sub_value in value.items():
+                    if prev_value.get(sub_key, REMOVED) != sub_value:
+                        changed[sub_key] = sub_value
+
+                for sub_key in prev_value:
+                    if sub_key not in value:
+                        removed.append([key, sub_key])
+
+                if changed:
+                    out[key] = changed
+            elif prev_value != value:
+                out[key] = value
+
+        for key in prev:
+            if key not in entry:
+                removed.append([key])
+
+        if removed:
+            out[REMOVED] = removed
+
+        return out
+
+class Delta_Reader:
+    """ Feed decoded delta records in order, get full records back """
+
+    def __init__(self):
+        self.current = None
+
+    def apply(self, record):
+        """ Returns the full record, None until the first keyframe is seen """
+        if record.get(KEYFRAME):
+            self.current = Delta_Encoder.snapshot(record)
+            del self.current[KEYFRAME]
+            return Delta_Encoder.snapshot(self.current)
+
+        if self.current is None:
+            return None
+
+        for key, value in record.items():
+            if key == REMOVED:
+                continue
+
+            current_value = self.current.get(key)
+
+            if isinstance(value, dict) and isinstance(current_value, dict):
+                current_value.update(value)
+            else:
+                self.current[key] = value
+
+        for path in record.get(REMOVED, ()):
+            if len(path) == 1:
+                self.current.pop(path[0], None)
+            else:
+                self.current.get(path[0], {}).pop(path[1], None)
+
+        return Delta_Encoder.snapshot(self.current)
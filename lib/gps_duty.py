@@ -0,0 +1,142 @@
+"""
+Duty cycled mode for GPS_Poller
+
+Each cycle polls the L76 until a fix of acceptable quality (valid, hdop at
+most max_hdop, at least min_sats satellites, from an epoch after the cycle
+started) or until fix_timeout seconds passed, logs one entry, saves a small
+state file and puts the board to sleep for sleep_interval seconds through
+Pycoproc with the L76 backup domain kept powered so the next wake is a hot
+start. On a Pytrack the board resets on wake and main.py starts the next
+cycle, on the simulated backend go_to_sleep() returns and the loop carries
+on. Start with GPS_Poller.run(sleep_interval=...).
+
+Logged per cycle: duty_cycle, duty_ttf_ms (time to fix, None on timeout),
+duty_awake_ms (so far this cycle), duty_last_awake_ms (the whole previous
+cycle), duty_fixes / duty_timeouts and wake_reason.
+"""
+import json
+import gps_hal
+
+class Duty_Cycle:
+    def __init__(self, poller, sleep_interval=300, fix_timeout=120, max_hdop=5.0, min_sats=4, state_file="duty.json"):
+        self.poller = poller
+        self.sleep_interval = sleep_interval
+        self.fix_timeout_ms = int(fix_timeout * 1000)
+        self.max_hdop = max_hdop
+        self.min_sats = min_sats
+        self.state_file = None
+
+        if poller.backend.state_root:
+            self.state_file = poller.backend.state_root + "/" + state_file
+
+        self.saved = self.load_state()
+
+    def load_state(self):
+        saved = {"cycle": 0, "fixes": 0, "timeouts": 0, "awake_ms": None, "last_fix": None}
+
+        if not self.state_file:
+            return saved
+
+        try:
+            with open(self.state_file, "r") as fh:
+                saved.update(json.loads(fh.read()))
+        except (OSError, ValueError):
+            pass
+
+        return saved
+
+    def save_state(self):
+        if not self.state_file:
+            return
+
+        try:
+            with open(self.state_file, "w") as fh:
+                fh.write(json.dumps(self.saved))
+        except OSError as e:
+            self.poller.errlog("duty_state", "Saving {} failed: {}", self.state_file, e)
+
+    def good_fix(self, start_epoch):
+        fix = self.poller.fix
+
+        if not fix.valid or fix.epoch == start_epoch:
+            return False
+
+        if fix.hdop is not None and fix.hdop > self.max_hdop:
+            return False
+
+        if fix.sats is not None and fix.sats < self.min_sats:
+            return False
+
+        return True
+
+    def run_cycle(self):
+        """ Poll until a good fix or the timeout, log and save the state, returns True on a fix """
+        poller = self.poller
+        state = poller.state
+        start = gps_hal.ticks_ms()
+        start_epoch = poller.fix.epoch
+        ttf_ms = None
+
+        self.saved["cycle"] += 1
+
+        try:
+            state["wake_reason"] = poller.py.get_wake_reason()
+        except Exception:
+            pass
+
+        while True:
+            delay_ms = poller.poll_once()
+            elapsed = gps_hal.ticks_diff(gps_hal.ticks_ms(), start)
+
+            if self.good_fix(start_epoch):
+                ttf_ms = elapsed
+                break
+
+            if elapsed >= self.fix_timeout_ms:
+                break
+
+            if delay_ms:
+                gps_hal.sleep_ms(delay_ms)
+
+        if ttf_ms is None:
+            self.saved["timeouts"] += 1
+        else:
+            self.saved["fixes"] += 1
+            self.saved["last_fix"] = [poller.fix.lat, poller.fix.lon, poller.fix.hour, poller.fix.minute, poller.fix.second]
+
+        state["duty_cycle"] = self.saved["cycle"]
+        state["duty_ttf_ms"] = ttf_ms
+        state["duty_fixes"] = self.saved["fixes"]
+        state["duty_timeouts"] = self.saved["timeouts"]
+        state["duty_last_awake_ms"] = self.saved["awake_ms"]
+        state["duty_awake_ms"] = gps_hal.ticks_diff(gps_hal.ticks_ms(), start)
+
+        poller.update_stats()
+        poller.gps_log.log_state()
+
+        self.saved["awake_ms"] = gps_hal.ticks_diff(gps_hal.ticks_ms(), start)
+        self.save_state()
+
+        return ttf_ms is not None
+
+    def sleep(self):
+        """ Flush the log and sleep with the GPS backup domain powered """
+        if self.poller.aiding:
+            self.poller.aiding.save(self.poller.fix, resume_in=self.sleep_interval, force=True)
+
+        if self.poller.uplink is not None:
+            self.poller.uplink.close()
+
+        self.poller.gps_log.log_stop(None)
+        self.poller.py.setup_sleep(self.sleep_interval)
+        self.poller.py.go_to_sleep(gps=True)
+
+    def run(self):
+        self.poller.start_polling()
+
+        while True:
+            self.run_cycle()
+            self.sleep()
+
+def run(poller, sleep_interval=300, fix_timeout=120):
+    Duty_Cycle(poller, sleep_interval, fix_timeout).run()
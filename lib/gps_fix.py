@@ -0,0 +1,66 @@
+class GPS_Fix:
+    """
+    Latest navigation solution, updated in place as sentences arrive
+
+    A fixed set of slots so the footprint does not grow with the number of
+    sentences seen. Fields are None until a sentence reporting them arrives.
+        year, month, day, hour, minute, second   UTC of the last fix
+        lat, lon    degrees, negative south/west
+        alt         meters above mean sea level
+        speed       meters per second over ground
+        course      degrees true
+        hdop, pdop, vdop
+        sats        satellites used in the solution
+        quality     GGA fix quality, 0 = invalid, 1 = GPS, 2 = DGPS, 6 = estimated
+        fix_type    GSA fix type, 1 = none, 2 = 2D, 3 = 3D
+        vel_e, vel_n, vel_u   velocity vector in m/s ($PQVEL)
+        valid       RMC/GLL report an active fix
+        epoch       number of position updates
+    """
+
+    __slots__ = (
+        "year", "month", "day", "hour", "minute", "second",
+        "lat", "lon", "alt", "speed", "course",
+        "hdop", "pdop", "vdop", "sats", "quality", "fix_type",
+        "vel_e", "vel_n", "vel_u",
+        "valid", "epoch",
+    )
+
+    KNOTS_TO_MS = 0.514444
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+
+        self.valid = False
+        self.epoch = 0
+
+    def __str__(self):
+        return str(self.as_dict())
+
+    def as_dict(self):
+        fix = {}
+
+        for name in self.__slots__:
+            fix[name] = getattr(self, name)
+
+        return fix
+
+    def set_date(self, year, month, day):
+        self.year = year
+        self.month = month
+        self.day = day
+
+    def set_position(self, fix_time, fix_ll):
+        """ fix_time is (hh, mm, ss), fix_ll is (lat, lon) """
+        hour, minute, second = fix_time
+
+        # RMC and GLL both report each epoch
+        if second != self.second or minute != self.minute or hour != self.hour:
+            self.epoch += 1
+
+        self.hour = hour
+        self.minute = minute
+        self.second = second
+        self.lat, self.lon = fix_ll
+        self.valid = True
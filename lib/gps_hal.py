@@ -0,0 +1,493 @@
+"""
+Hardware abstraction for the poller.
+
+A backend bundles everything GPS_Poller and GPS_SD_Logger touch outside of
+the interpreter: the I2C bus, RTC, RGB LED, SD card mount and the battery
+source. Pycom_Backend drives a real Pytrack, Sim_Backend runs the same code
+on the MicroPython unix port or CPython against a simulated L76.
+"""
+import time
+import sys
+import gc
+import os
+
+try:
+    import uio as io
+except ImportError:
+    import io
+
+StringIO = io.StringIO
+
+try:
+    ticks_ms = time.ticks_ms # pylint: disable=E1101
+    ticks_us = time.ticks_us # pylint: disable=E1101
+    ticks_diff = time.ticks_diff # pylint: disable=E1101
+    ticks_add = time.ticks_add # pylint: disable=E1101
+except AttributeError:
+    def ticks_ms():
+        return time.monotonic_ns() // 1000000
+
+    def ticks_us():
+        return time.monotonic_ns() // 1000
+
+    def ticks_diff(new, old):
+        return new - old
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+try:
+    sleep_ms = time.sleep_ms # pylint: disable=E1101
+except AttributeError:
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+# MicroPython ticks start at reset, elsewhere count from the first import
+BOOT_TICKS = 0 if hasattr(time, "ticks_ms") else ticks_ms()
+
+def uptime_ms():
+    """ Milliseconds since reset (since start up off the board) """
+    return ticks_diff(ticks_ms(), BOOT_TICKS)
+
+def print_exception(e, file=None):
+    if file is None:
+        file = sys.stdout
+
+    try:
+        sys.print_exception(e, file) # pylint: disable=E1101
+    except AttributeError:
+        import traceback
+        traceback.print_exception(type(e), e, e.__traceback__, file=file)
+
+def stdout_write(data):
+    """ Write bytes to stdout, in order with print() output """
+    # CPython's text stdout has a separate binary buffer underneath
+    buffer = getattr(sys.stdout, "buffer", None)
+
+    if buffer is None:
+        sys.stdout.write(data)
+        return
+
+    if hasattr(sys.stdout, "flush"):
+        sys.stdout.flush()
+
+    buffer.write(data)
+
+    if hasattr(buffer, "flush"):
+        buffer.flush()
+
+def mktime(tm):
+    """ time.mktime() accepting the 8-tuple MicroPython uses """
+    try:
+        return time.mktime(tm)
+    except TypeError:
+        return time.mktime(tuple(tm[:8]) + (0,) * (8 - len(tm)) + (-1,))
+
+try:
+    mem_free = gc.mem_free # pylint: disable=E1101
+    mem_alloc = gc.mem_alloc # pylint: disable=E1101
+except AttributeError:
+    def mem_free():
+        return None
+
+    def mem_alloc():
+        return None
+
+try:
+    import zlib
+    compress = zlib.compress
+except (ImportError, AttributeError):
+    try:
+        import deflate # MicroPython 1.21+
+
+        def compress(data):
+            out = io.BytesIO()
+            stream = deflate.DeflateIO(out, deflate.ZLIB)
+            stream.write(data)
+            stream.close()
+            return out.getvalue()
+    except ImportError:
+        def compress(data):
+            """ No compression on this port """
+            return None
+
+def gc_threshold(nbytes):
+    """ gc.threshold() where the port has it, returns True if it was set """
+    try:
+        gc.threshold(nbytes) # pylint: disable=E1101
+        return True
+    except AttributeError:
+        return False
+
+def file_exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+def fsync(fh):
+    """ Push a flushed file to the storage device """
+    try:
+        os.fsync(fh.fileno())
+    except AttributeError:
+        try:
+            os.sync() # pylint: disable=E1101
+        except AttributeError:
+            pass
+
+def nmea_checksum(msg, ofs=1):
+    """ XOR of all characters after the leading $ """
+    chksum = 0
+    for ch in msg[ofs:]:
+        chksum ^= ord(ch)
+    return chksum
+
+def default_backend():
+    try:
+        return Pycom_Backend()
+    except ImportError:
+        print(">> No pycom hardware, using simulated backend")
+        return Sim_Backend()
+
+class Pycom_Backend:
+    """ Pytrack on a pycom board """
+
+    I2C_PINS = ('P22', 'P21')
+
+    def __init__(self):
+        import machine
+        import pycom
+        self.machine = machine
+        self.pycom = pycom
+        self.sd_root = "/sd"
+        self.state_root = "/flash"
+        self.wlan = None
+
+    def i2c(self):
+        return self.machine.I2C(0, mode=self.machine.I2C.MASTER, pins=self.I2C_PINS)
+
+    def rtc(self):
+        return self.machine.RTC()
+
+    def heartbeat(self, enable):
+        self.pycom.heartbeat(enable)
+
+    def rgbled(self, color):
+        self.pycom.rgbled(color)
+
+    def sd_mounted(self):
+        try:
+            os.listdir(self.sd_root)
+            return True
+        except:
+            return False
+
+    def mount_sd(self):
+        sd = self.machine.SD()
+        os.mount(sd, self.sd_root) # pylint: disable=E1101
+
+    def unmount_sd(self):
+        os.unmount(self.sd_root) # pylint: disable=E1101
+
+    def battery(self, i2c=None):
+        """ i2c is the shared bus, without it Pytrack opens its own I2C(0) """
+        import pytrack
+        return pytrack.Pytrack(i2c=i2c)
+
+    def network_up(self):
+        """ WiFi connected, boot.py brings it up """
+        if self.wlan is None:
+            import network
+            self.wlan = network.WLAN()
+
+        return self.wlan.isconnected()
+
+class Sim_Backend:
+    """
+    Simulated Pytrack
+
+    sd_root is a host directory standing in for the SD card (None for no card),
+    it also stands in for the flash file system holding state across sleeps.
+    """
+
+    def __init__(self, l76=None, sd_root=None, battery_voltage=4.2):
+        self.l76 = l76 if l76 else Sim_L76()
+        self.sd_root = sd_root
+        self.state_root = sd_root
+        self.led = Sim_LED()
+        self.sim_rtc = Sim_RTC()
+        self.sim_battery = Sim_Battery(battery_voltage)
+        self.online = True
+
+    def i2c(self):
+        return Sim_I2C({self.l76.I2C_ADDR: self.l76})
+
+    def rtc(self):
+        return self.sim_rtc
+
+    def heartbeat(self, enable):
+        self.led.heartbeat = enable
+
+    def rgbled(self, color):
+        self.led.color = color
+
+    def sd_mounted(self):
+        return self.sd_root is not None
+
+    def mount_sd(self):
+        raise OSError("No simulated SD card")
+
+    def unmount_sd(self):
+        pass
+
+    def battery(self, i2c=None):
+        return self.sim_battery
+
+    def network_up(self):
+        return self.online
+
+class Sim_I2C:
+    """ machine.I2C stand-in dispatching to simulated devices by address """
+
+    def __init__(self, devices):
+        self.devices = devices
+
+    def _device(self, addr):
+        try:
+            return self.devices[addr]
+        except KeyError:
+            raise OSError("I2C bus error: no device at 0x%02x" % addr)
+
+    def readfrom(self, addr, nbytes):
+        buf = bytearray(nbytes)
+        self._device(addr).read_into(buf)
+        return bytes(buf)
+
+    def readfrom_into(self, addr, buf):
+        self._device(addr).read_into(buf)
+
+    def writeto(self, addr, buf):
+        self._device(addr).write(bytes(buf))
+        return len(buf)
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+class Sim_RTC:
+    def __init__(self, synced=True):
+        self.is_synced = synced
+        self.init_time = None
+
+    def ntp_sync(self, server, update_period=None):
+        pass
+
+    def synced(self):
+        return self.is_synced
+
+    def init(self, datetime):
+        self.init_time = datetime
+
+class Sim_LED:
+    def __init__(self):
+        self.heartbeat = True
+        self.color = 0
+
+class Sim_Battery:
+    """ Battery ADC and sleep control of a simulated Pycoproc, sleeping returns at once """
+
+    WAKE_REASON_TIMER = 4
+
+    def __init__(self, voltage):
+        self.voltage = voltage
+        self.adc_pending = False
+        self.wake_reason = 0
+        self.sleep_time = None
+        self.sleeps = []
+        self.calibrations = 0
+
+    def get_wake_reason(self):
+        return self.wake_reason
+
+    def calibrate_rtc(self):
+        self.calibrations += 1
+
+    def setup_sleep(self, time_s):
+        self.sleep_time = time_s
+
+    def go_to_sleep(self, gps=True):
+        self.sleeps.append((self.sleep_time, gps))
+        self.wake_reason = self.WAKE_REASON_TIMER
+
+    def read_battery_voltage(self):
+        return self.voltage
+
+    def adc_start(self):
+        self.adc_pending = True
+
+    def adc_collect(self):
+        if not self.adc_pending:
+            return None
+
+        self.adc_pending = False
+        return self.voltage
+
+class Sim_L76:
+    """
+    Simulated Quectel L76 on the I2C bus
+
+    Replays an NMEA capture one epoch at a time. An epoch starts at each
+    sentence with the same type as the first sentence of the capture. Epochs
+    are released every 1 / rate seconds, divided by speed for accelerated
+    replay. Like the chip, each read returns at most read_size - 1 bytes of
+    data and pads the rest of the buffer with newlines. Commands written to
+    the chip are checksum verified and acknowledged.
+    """
+
+    I2C_ADDR = 0x10
+
+    # $PMTK514 reply to a $PMTK414 query with the chip defaults
+    DEFAULT_314 = "1,1,1,1,1,5,0,0,0,0,0,0,0,0,0,0,0,1,0"
+
+    DEFAULT_CAPTURE = (
+        "$GNRMC,100057.000,A,3446.4447,N,11145.9536,W,9.45,137.90,130318,,,A",
+        "$GPVTG,139.09,T,,M,9.75,N,18.07,K,A",
+        "$GPGGA,100057.000,3446.4447,N,11145.9536,W,1,9,0.92,1520.4,M,-26.5,M,,",
+        "$GNGSA,A,3,10,20,21,27,32,08,,,,,,,1.21,0.92,0.79",
+        "$GNGSA,A,3,71,73,80,,,,,,,,,,1.21,0.92,0.79",
+        "$GPGSV,3,1,11,10,63,139,38,20,55,270,41,21,42,061,36,27,20,042,33",
+        "$GPGSV,3,2,11,32,29,311,40,08,17,168,29,16,07,118,,18,05,225,",
+        "$GPGSV,3,3,11,26,03,313,,15,02,067,,24,01,181,",
+        "$GLGSV,2,1,06,71,54,039,30,73,32,312,34,80,26,245,28,72,12,093,",
+        "$GLGSV,2,2,06,70,10,352,,79,04,170,",
+        "$GNGLL,3446.4447,N,11145.9536,W,100057.000,A,A",
+        "$GNZDA,100057.000,13,03,2018,,",
+        "$PQVEL,-3.844606,3.321756,-0.130539",
+    )
+
+    def __init__(self, lines=None, rate=1.0, speed=1.0, loop=True, buffer_size=4096, read_size=255):
+        self.epochs = self.split_epochs(lines if lines else self.DEFAULT_CAPTURE)
+        self.interval = 1.0 / (rate * speed)
+        self.loop = loop
+        self.buffer_size = buffer_size
+        self.max_data = read_size - 1
+        self.out = bytearray()
+        self.epoch_idx = 0
+        self.next_epoch = None
+        self.set_314 = self.DEFAULT_314
+        self.commands = []
+        self.dropped = 0
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        with open(filename) as fh:
+            return cls([line for line in fh], **kwargs)
+
+    @staticmethod
+    def frame(msg):
+        if "*" in msg:
+            return msg + "\r\n"
+
+        return "%s*%02X\r\n" % (msg, nmea_checksum(msg))
+
+    def split_epochs(self, lines):
+        epochs = []
+        first_key = None
+
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode("ascii")
+
+            line = line.strip()
+
+            if not line.startswith("$"):
+                continue
+
+            key = line[:line.find(",")]
+
+            if first_key is None:
+                first_key = key
+
+            if key == first_key or not epochs:
+                epochs.append("")
+
+            epochs[-1] += self.frame(line)
+
+        return [epoch.encode("ascii") for epoch in epochs]
+
+    def emit(self, data):
+        room = self.buffer_size - len(self.out)
+
+        if len(data) > room:
+            self.dropped += len(data) - room
+            data = data[:room]
+
+        self.out.extend(data)
+
+    def produce(self):
+        now = time.time()
+
+        if self.next_epoch is None:
+            self.next_epoch = now
+
+        while now >= self.next_epoch:
+            self.next_epoch += self.interval
+
+            if self.epoch_idx >= len(self.epochs):
+                if not self.loop or not self.epochs:
+                    return
+                self.epoch_idx = 0
+
+            self.emit(self.epochs[self.epoch_idx])
+            self.epoch_idx += 1
+
+    def read_into(self, buf):
+        self.produce()
+
+        nbytes = min(len(buf), len(self.out), self.max_data)
+        buf[:nbytes] = self.out[:nbytes]
+        self.out = self.out[nbytes:]
+
+        for i in range(nbytes, len(buf)):
+            buf[i] = 0x0A
+
+    def write(self, data):
+        for cmd in data.decode("ascii").split("\n"):
+            cmd = cmd.strip()
+
+            if not cmd.startswith("$") or cmd.find("*") < 0:
+                continue
+
+            msg, chksum = cmd.split("*")
+
+            try:
+                if int(chksum, 16) != nmea_checksum(msg):
+                    continue
+            except ValueError:
+                continue
+
+            self.commands.append(msg)
+            self.emit(self.frame(self.response(msg)).encode("ascii"))
+
+    def response(self, msg):
+        fields = msg.split(",")
+
+        if msg.startswith("$PMTK"):
+            cmd = fields[0][5:]
+
+            if cmd == "414":
+                return "$PMTK514," + self.set_314 + ",0"
+
+            if cmd == "314":
+                self.set_314 = ",".join(fields[1:])
+
+            if cmd == "869" and len(fields) > 1 and fields[1] == "0":
+                return "$PMTK869,2,1,3"
+
+            return "$PMTK001,%s,3" % cmd
+
+        # $PQxxx,W,... commands are acknowledged with $PQxxx,W,OK
+        return "%s,%s,OK" % (fields[0], fields[1] if len(fields) > 1 else "W")
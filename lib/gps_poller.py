@@ -1,13 +1,15 @@
-import machine
 import time
-import json
-import machine
-import pycom
-import pytrack
 import gc
-import sys
-import os
-import uio
+import gps_hal
+import nmea_buffer
+import poll_scheduler
+import nmea
+import gps_fix
+import gps_sats
+import gps_cmd
+import buffered_writer
+import battery_monitor
+import i2c_bus
 
 class GPS_Poller:
     GPS_I2CADDR = 0x10
@@ -15,28 +17,106 @@ class GPS_Poller:
     TIME_MODE_GPS_SEARCH = "GPS_SEARCH"
     TIME_MODE_GPS_INSYNC = "GPS_INSYNC"
 
-    def __init__(self, gps_logger=None, init_cmds=None):
-        pycom.heartbeat(False)
-        pycom.rgbled(0x100000)
+    FRAME_ERR_KEYS = {
+        nmea.FRAME_BAD: "errcnt_split_err",
+        nmea.FRAME_BAD_CHKSUM: "errcnt_chkerr",
+    }
+
+    def __init__(self, gps_logger=None, init_cmds=None, backend=None, keep_raw=False, log_format="json", fence_file="fences.txt", profile=False, mem_manage=False, aiding=True, uplink_url=None):
+        self.backend = backend if backend else gps_hal.default_backend()
+        self.backend.heartbeat(False)
+        self.backend.rgbled(0x100000)
 
         self.gps_log = gps_logger
 
         if not self.gps_log:
-            self.gps_log = GPS_SD_Logger(self, stdout_echo=True)
+            self.gps_log = GPS_SD_Logger(self, stdout_echo=True, log_format=log_format)
 
         self.state = {}
-        self.i2c = machine.I2C(0, mode=machine.I2C.MASTER, pins=('P22','P21'))
-        self.cmd_queue = []
+        self.bus = i2c_bus.I2C_Bus(self.backend.i2c())
+        self.i2c = self.bus.device("gps")
+        self.py = self.backend.battery(self.bus.device("pycoproc"))
+        self.battery = battery_monitor.Battery_Monitor(self.py)
+        self.bus.add_idle_task(self.battery.poll)
+        self.ring = nmea_buffer.NMEA_Ring_Buffer()
+        self.sched = poll_scheduler.Poll_Scheduler()
+        self.prof = None
+
+        if profile:
+            import stage_timer
+            self.prof = stage_timer.Stage_Timer()
+
+        self.ring.prof = self.prof
+        self.mem = None
+
+        # True for the defaults, a gc threshold in bytes or a Mem_Manager
+        if mem_manage:
+            import mem_manager
+
+            if isinstance(mem_manage, mem_manager.Mem_Manager):
+                self.mem = mem_manage
+            elif mem_manage is True:
+                self.mem = mem_manager.Mem_Manager()
+            else:
+                self.mem = mem_manager.Mem_Manager(threshold=mem_manage)
+
+        self.max_pkt_len = 0
+        self.bad_pkt = bytearray(self.ring.carry_size)
+        self.bad_pkt_len = 0
+        self.bad_pkt_err = 0
+        self.bad_pkt_read = 0
+        self.cmds = gps_cmd.Cmd_Engine(self.write_cmds, self.errlog)
         self.init_cmds = init_cmds
-        self.cmd_wait_for = None
-        self.cmd_timeout = None
         self.time_mode = self.TIME_MODE_RTC
         self.state["have_fix"] = False
+        self.errlog_pending = {}
+        self.fix = gps_fix.GPS_Fix()
+        self.sats = gps_sats.Sat_Table()
+        # Created with the first fix
+        self.track = None
+        self.fences = None
+
+        # The logger mounted the SD card
+        if fence_file and self.backend.sd_root and gps_hal.file_exists(self.backend.sd_root + "/" + fence_file):
+            import geofence
+            self.fences = geofence.load(self.backend.sd_root + "/" + fence_file)
+
+            if self.fences is not None:
+                print(">> Loaded %d geofences, skipped %d bad lines" % (len(self.fences), self.fences.bad_lines))
+
+        self.keep_raw = keep_raw
+        self.aiding = None
+
+        if aiding and self.backend.state_root:
+            import gps_aiding
+            self.aiding = gps_aiding.GPS_Aiding(self.backend.state_root + "/last_fix.json")
+
+        self.uplink = None
+
+        # Batches wait on the SD card while offline
+        if uplink_url:
+            import uplink
+            spool_dir = self.backend.sd_root + "/uplink" if self.backend.sd_root else None
+            self.uplink = uplink.Uplink(uplink.transport_from_url(uplink_url), self.backend.network_up, self.errlog, spool_dir)
+            self.bus.add_idle_task(self.uplink.poll)
+
+        self.handlers = {}
+        self.dispatch = {}
+        self.register_handler("RMC", self.parse_rmc, 2) # Lat/Long "V" (Void) or "A" (Active)
+        self.register_handler("GLL", self.parse_gll, 6) # Lat/Long "V" (Void) or "A" (Active)
+        self.register_handler("GSV", self.parse_gsv, 2) # Multi-sequence packet
+        self.register_handler("ZDA", self.parse_zda)
+        self.register_handler("GGA", self.parse_gga)
+        self.register_handler("GSA", self.parse_gsa)
+        self.register_handler("VTG", self.parse_vtg)
+        self.register_handler("$PQVEL", self.parse_pqvel)
+        self.register_handler("$PMTK869", self.parse_easy)
 
         if time.localtime()[0] < 1981:
             self.time_mode = self.TIME_MODE_GPS_SEARCH
 
     def __str__(self):
+        self.flush_errlog()
         return self.__class__.__name__ + ":\n" + self.sorted_dict_str(self.__dict__)
 
     def sorted_dict_str(self, src, indent=""):
@@ -52,19 +132,69 @@ class GPS_Poller:
 
         return buf
 
-    def run(self, log_interval=10):
-        rtc = machine.RTC()
+    def run(self, log_interval=10, use_async=False, sleep_interval=None, fix_timeout=120, fast_start=False):
+        """
+        Configure the GPS and poll until interrupted
+
+        With use_async the reader, parser, command and logger run as separate
+        tasks, see gps_async. With sleep_interval the board logs one fix
+        (or fix_timeout) per wake and sleeps in between, see gps_duty. With
+        fast_start polling starts without waiting for NTP.
+        """
+        self.setup(fast_start)
+
+        stop_exception = None
+
+        try:
+            if sleep_interval:
+                import gps_duty
+                gps_duty.run(self, sleep_interval, fix_timeout)
+            elif use_async:
+                import gps_async
+                gps_async.run(self, log_interval)
+            else:
+                self.run_loop(log_interval)
+        except KeyboardInterrupt as e:
+            stop_exception = e
+            pass
+        except Exception as e:
+            stop_exception = e
+            pass
+
+        if self.uplink is not None:
+            self.uplink.close()
+
+        self.gps_log.log_stop(stop_exception)
+
+    def setup(self, fast_start=False):
+        rtc = self.backend.rtc()
 
         try:
             rtc.ntp_sync("pool.ntp.org", 3600)
         except:
             pass
 
-        for _ in range(5):
-            if not rtc.synced():
-                time.sleep(1)
-            else:
-                break
+        # NTP syncs in the background, until then the time comes from the GPS (TIME_MODE_GPS_SEARCH)
+        if not fast_start:
+            for _ in range(5):
+                if not rtc.synced():
+                    time.sleep(1)
+                else:
+                    break
+
+        # DNS cannot time out, look the uplink host up before the read loop if we can
+        if self.uplink is not None and self.backend.network_up():
+            self.uplink.resolve()
+
+        # Hot start from the last saved fix, ahead of the configuration
+        if self.aiding:
+            self.state["aiding"] = None
+
+            for cmd, wait_for in self.aiding.startup_cmds():
+                self.queue_cmd(cmd, wait_for)
+
+                if cmd.startswith("$PMTK74"):
+                    self.state["aiding"] = cmd[1:8]
 
         # Setup GPS
         self.queue_cmd("$PMTK314,1,1,1,1,1,1,0,0,0,0,0,0,0,0,0,0,0,1,0") # Report intervals
@@ -83,143 +213,246 @@ class GPS_Poller:
             for init_cmd in self.init_cmds:
                 self.queue_cmd(init_cmd[0], wait_for=init_cmd[1])
 
-        stop_exception = None
+    def run_loop(self, log_interval=10):
+        self.start_polling()
+        self.next_log_time = time.time() + log_interval
+
+        while True:
+            delay_ms = self.poll_once()
+
+            if time.time() >= self.next_log_time:
+                self.next_log_time = time.time() + log_interval
+                self.update_stats()
+                self.gps_log.log_state()
+
+            if delay_ms:
+                gps_hal.sleep_ms(delay_ms)
 
+    def start_polling(self):
+        self.state["reset_to_poll_ms"] = gps_hal.uptime_ms()
+        self.read_count = 0
+        self.max_buf_len = 0
+        self.last_large_buf = 0
+        self.count_large_buf = 0
+        self.on_sentence = self.handle_sentence
+
+        # The PIC RTC calibration holds the bus for ~100 pulses, keep it out of setup_sleep()
+        self.bus.defer(self.calibrate_rtc)
+
+    def calibrate_rtc(self):
         try:
-            self.run_loop(log_interval)
-        except KeyboardInterrupt as e:
-            stop_exception = e
-            pass
+            self.py.calibrate_rtc()
         except Exception as e:
-            stop_exception = e
-            pass
+            self.errlog("rtc_calibrate", "RTC calibration failed: {}", e)
 
-        self.gps_log.log_stop(stop_exception)
+    def read_gps(self, on_sentence):
+        """ Blink the LED, read the L76 into the ring buffer and account for the read, returns its length """
+        self.read_count += 1
+        rgb_color = (self.read_count % 2) * 0x000008
+        if self.state["have_fix"]:
+            rgb_color |= 0x000800
+        else:
+            rgb_color |= 0x080000
 
-    def run_loop(self, log_interval=10):
-        self.read_count = 0
-        self.next_log_time = time.time() + log_interval
+        self.backend.rgbled(rgb_color)
 
-        circular_buffer = b""
-        max_buf_len = 0
-        max_pkt_len = 0
-        last_large_buf = 0
-        count_large_buf = 0
+        buf_len = self.ring.fill(self.i2c, self.GPS_I2CADDR, on_sentence)
 
-        while True:
-            self.read_count += 1
-            rgb_color = (self.read_count % 2) * 0x000008
-            if self.state["have_fix"]:
-                rgb_color |= 0x000800
-            else:
-                rgb_color |= 0x080000
+        if buf_len > self.max_buf_len:
+            self.max_buf_len = buf_len
+            self.state["max_buf_len"] = buf_len
 
-            pycom.rgbled(rgb_color)
+        if buf_len > 55:
+            self.last_large_buf = self.read_count
+            self.count_large_buf += 1
 
-            buf = self.i2c.readfrom(self.GPS_I2CADDR, 255).lstrip(b"\n").rstrip(b"\n")
+        if buf_len > 0:
+            self.state["last_read_bytes"] = buf_len
+            self.state["last_large_buf"] = self.last_large_buf
+            self.state["count_large_buf"] = self.count_large_buf
 
-            if len(buf) > max_buf_len:
-                max_buf_len = len(buf)
-                self.state["max_buf_len"] = max_buf_len
+        return buf_len
 
-            if len(buf) > 55:
-                last_large_buf = self.read_count
-                count_large_buf += 1
+    def poll_once(self):
+        """ One L76 read plus command and idle work, returns the delay before the next read """
+        if self.mem is not None:
+            self.mem.iteration_start()
 
-            # If less than a full buffer we can try sending commands
-            if len(buf) < 254:
-                self.send_next_cmd()
+        buf_len = self.read_gps(self.on_sentence)
 
-            if len(buf) == 0:
-                continue
+        # If less than a full buffer we can try sending commands
+        if self.prof is not None:
+            cmd_start = gps_hal.ticks_us()
+            self.cmds.poll(can_write=buf_len < 254)
+            self.prof.add(self.prof.CMD_SEND, gps_hal.ticks_diff(gps_hal.ticks_us(), cmd_start))
+        else:
+            self.cmds.poll(can_write=buf_len < 254)
 
-            self.state["last_read_bytes"] = len(buf)
-            self.state["last_large_buf"] = last_large_buf
-            self.state["count_large_buf"] = count_large_buf
+        # Pycoproc work only while the L76 is not backing up
+        self.bus.run_idle(buf_len)
 
-            circular_buffer += buf
+        delay_ms = self.sched.next_delay_ms(buf_len, self.cmds.pending() > 0)
 
-            while True:
-                idx = circular_buffer.find(b"\r")
+        if self.mem is not None:
+            self.mem.iteration_end()
+            self.mem.idle(delay_ms)
 
-                if idx < 0:
-                    break
+        return delay_ms
 
-                # Extract and parse each packet
-                pkt = circular_buffer[:idx].decode("ascii")
-                ofs = 2 if circular_buffer[idx:idx+2] == b"\r\n" else 1
-                circular_buffer = circular_buffer[idx+ofs:]
+    def handle_sentence(self, buf, start, end):
+        if end - start > self.max_pkt_len:
+            self.max_pkt_len = end - start
+            self.state["max_pkt_len"] = self.max_pkt_len
 
-                if len(pkt) > max_pkt_len:
-                    max_pkt_len = len(pkt)
-                    self.state["max_pkt_len"] = max_pkt_len
+        if self.prof is not None:
+            check_start = gps_hal.ticks_us()
+            star = nmea.check_frame(buf, start, end)
+            self.prof.add(self.prof.CHECKSUM, gps_hal.ticks_diff(gps_hal.ticks_us(), check_start))
+        else:
+            star = nmea.check_frame(buf, start, end)
 
-                self.parse_pkt(pkt)
+        if star < 0:
+            if star != nmea.FRAME_NO_CHKSUM:
+                self.frame_error(star, buf, start, end)
+            return
 
-            if time.time() >= self.next_log_time:
-                self.next_log_time = time.time() + log_interval
-                self.gps_log.log_state()
+        if star == start:
+            return
 
-            if len(self.cmd_queue) > 0:
-                time.sleep(0.01)
+        self.parse_msg(buf[start:end].decode("ascii"), star - start)
+
+    def frame_error(self, err, buf, start, end):
+        """ Count a corrupt sentence and keep a copy for the next log record, without allocating """
+        err_key = self.FRAME_ERR_KEYS[err]
+        self.state[err_key] = self.state.get(err_key, 0) + 1
+
+        bad_len = min(end - start, len(self.bad_pkt))
+        i = 0
+        while i < bad_len:
+            byte = buf[start + i]
+            # Line noise, keep the copy printable ASCII so it always decodes
+            self.bad_pkt[i] = byte if 0x20 <= byte < 0x7F else 0x3F
+            i += 1
+
+        self.bad_pkt_len = bad_len
+        self.bad_pkt_err = err
+        self.bad_pkt_read = self.read_count
+
+    def flush_errlog(self):
+        for last_key, (read_count, err_msg, args) in self.errlog_pending.items():
+            self.state[last_key] = "@%d: %s" % (read_count, err_msg.format(*args))
+
+        self.errlog_pending = {}
+
+        if self.bad_pkt_len:
+            bad_pkt = self.bad_pkt[:self.bad_pkt_len].decode("ascii")
+
+            if self.bad_pkt_err == nmea.FRAME_BAD_CHKSUM:
+                self.state["last_chkerr"] = "@%d: Skipping invalid checksum: [%s]" % (self.bad_pkt_read, bad_pkt)
             else:
-                time.sleep(0.1)
+                self.state["last_split_err"] = "@%d: Split failed: %s" % (self.bad_pkt_read, bad_pkt)
+
+            self.bad_pkt_len = 0
+
+    def update_stats(self):
+        self.flush_errlog()
+
+        alloc_per_pkt = self.ring.alloc_per_pkt()
+
+        if alloc_per_pkt is not None:
+            self.state["alloc_per_pkt"] = alloc_per_pkt
+
+        if self.ring.overflow_count:
+            self.state["count_ring_overflow"] = self.ring.overflow_count
+
+        self.state.update(self.sched.stats())
+        self.state.update(self.cmds.stats())
+        self.state.update(self.battery.stats())
+        self.state.update(self.bus.stats())
+
+        if self.track is not None:
+            self.state.update(self.track.stats())
+
+        self.state.update(self.sats.stats())
+
+        if self.fences:
+            self.state.update(self.fences.stats())
+
+        if self.aiding:
+            self.aiding.save(self.fix)
+
+        if self.uplink is not None:
+            self.state.update(self.uplink.stats())
+
+        if self.mem is not None:
+            self.mem.log_check()
+            self.state.update(self.mem.stats())
 
     def parse_pkt(self, pkt):
-        if not "*" in pkt:
-            return
+        buf = pkt.encode("ascii")
+        self.handle_sentence(buf, 0, len(buf))
+
+    def parse_msg(self, pkt, star):
+        """ Parse a sentence whose framing and checksum were verified, star is the offset of the "*" """
+        self.cmds.response(pkt)
+
+        fields = pkt[:star].split(",")
+        key = fields[0]
 
         try:
-            msg, pkt_chksum = pkt.split('*')
-            pkt_chksum = int(pkt_chksum, 16)
-        except ValueError:
-            self.errlog("split_err", "Split failed: %s" % pkt)
-            return
+            handler = self.dispatch[key]
+        except KeyError:
+            handler = self.resolve_handler(key)
 
-        if len(msg) == 0:
-            return
+        if handler:
+            name, parse, suffix_field = handler
 
-        msg_chksum = 0
-        ofs = 1 if msg[0] == "$" else 0
-        for ch in msg[ofs:]:
-            msg_chksum ^= ord(ch)
+            try:
+                if parse and self.prof is not None:
+                    parse_start = gps_hal.ticks_us()
+                    parse(fields)
+                    self.prof.add_parse(name, gps_hal.ticks_diff(gps_hal.ticks_us(), parse_start))
+                elif parse:
+                    parse(fields)
+
+                # Some sentences are cached under a logical key, eg. GSV sequence or RMC/GLL status
+                if suffix_field and self.keep_raw:
+                    key += "-" + fields[suffix_field]
+            except (ValueError, IndexError):
+                self.errlog("parse_%s_fail" % name.lower(), "Failed to parse: " + pkt)
+
+        if self.keep_raw:
+            self.state[key] = pkt
+
+    def register_handler(self, sentence, parse, suffix_field=None):
+        """
+        Register parse(fields) for a sentence type
 
-        if msg_chksum != pkt_chksum:
-            self.errlog("chkerr", "Skipping invalid msg_chksum(%x) != pkt_chksum(%x): [%s]" % (msg_chksum, pkt_chksum, pkt))
-            return
+        sentence is either a type such as "RMC", matching every talker ($GP, $GL, $GN...),
+        or a full key such as "$PQVEL". suffix_field is the index of the field appended
+        to the state key the raw sentence is cached under.
+        """
+        self.handlers[sentence] = (sentence.lstrip("$"), parse, suffix_field)
+        self.dispatch = {}
 
-        self.check_cmd_response(pkt)
+    def resolve_handler(self, key):
+        handler = self.handlers.get(key)
 
-        key = pkt[:pkt.find(",")]
+        if handler is None and len(key) == 6:
+            handler = self.handlers.get(key[3:])
 
-        # Parse some keys out to logical keys
-        try:
-            if len(key) == 6:
-                sub_key = key[3:6]
-
-                if sub_key == "RMC":
-                    self.parse_rmc(pkt)
-                elif sub_key == "ZDA":
-                    self.parse_zda(pkt)
-                elif sub_key == "GLL":
-                    self.parse_gll(pkt)
-
-                if sub_key == "GSV": # Multi-sequence packet
-                    key += "-%s" % pkt.split(",")[2]
-                elif sub_key == "RMC": # Lat/Long "V" (Void) or "A" (Active)
-                    key += "-%s" % pkt.split(",")[2]
-                elif sub_key == "GLL": # Lat/Long "V" (Void) or "A" (Active)
-                    key += "-%s" % pkt.split(",")[6]
-        except:
-            pass
+        self.dispatch[key] = handler
 
-        self.state[key] = pkt
+        return handler
 
     def set_gps_time(self, new_time, source):
-        self.errlog("gps_time_" + source, "GPS Time {}: {} RTC: {}".format(source, new_time, time.localtime()[:6]))
+        self.errlog("gps_time_" + source, "GPS Time {}: {} RTC: {}", source, new_time, time.localtime()[:6])
+
+        if new_time[0] is not None:
+            self.fix.set_date(new_time[0], new_time[1], new_time[2])
 
         # Wait for cmd queue to drain before trying anything
-        if len(self.cmd_queue) > 0:
+        if self.cmds.pending() > 0:
             return
 
         # Never change the time if in RTC mode
@@ -234,13 +467,13 @@ class GPS_Poller:
         if new_time[0] <= 2010:
             return
 
-        self.state["clock_drift"] = abs(time.mktime(new_time[:-1] + (int(new_time[-1]),0,0)) - time.time())
+        self.state["clock_drift"] = abs(gps_hal.mktime(new_time[:-1] + (int(new_time[-1]),0,0)) - time.time())
 
         if self.state["clock_drift"] > 60:
             try:
                 ss = new_time[-1]
                 rtc_tm = new_time[:-1] + (int(ss),int((ss-int(ss))*1000000))
-                machine.RTC().init(rtc_tm)
+                self.backend.rtc().init(rtc_tm)
                 self.errlog("rtc_set", "RTC set to {} because drift is {}".format(rtc_tm, self.state["clock_drift"]))
             except:
                 pass
@@ -249,8 +482,26 @@ class GPS_Poller:
         if not self.state["have_fix"]:
             self.state["fix_start"] = "{} @ {}".format(fix_ll, fix_time)
 
+            if "reset_to_fix_ms" not in self.state:
+                self.state["reset_to_fix_ms"] = gps_hal.uptime_ms()
+
         self.state["have_fix"] = True
-        self.errlog("last_fix", "{} @ {}".format(fix_ll, fix_time))
+        epoch = self.fix.epoch
+        self.fix.set_position(fix_time, fix_ll)
+        self.errlog("last_fix", "{} @ {}", fix_ll, fix_time)
+
+        # Feed each epoch once, RMC and GLL both report it
+        if self.fix.epoch != epoch and fix_ll[0] is not None and fix_time[0] is not None:
+            tod = fix_time[0] * 3600 + fix_time[1] * 60 + fix_time[2]
+
+            if self.track is None:
+                import track_simplify
+                self.track = track_simplify.Track_Simplifier()
+
+            self.track.add(tod, fix_ll[0], fix_ll[1])
+
+            if self.fences:
+                self.fences.check(fix_ll[0], fix_ll[1], tod)
 
     def clear_fix(self, source):
         if self.state["have_fix"]:
@@ -258,34 +509,20 @@ class GPS_Poller:
             self.state["fix_end"] = "{} @ {}".format(source, self.read_count)
             self.errlog("clear_fix", source)
 
-    def parse_gps_utc(self, hhmmss):
-        try:
-            hh = int(hhmmss[0:2])
-            mm = int(hhmmss[2:4])
-            ss = float(hhmmss[4:])
-            return (hh, mm, ss)
-        except:
-            return (None, None, None)
+            if self.track is not None:
+                self.track.flush()
+
+        self.fix.valid = False
 
     def parse_ll_fix(self, ll):
         """ Parse Lat,Dir,Long,Dir """
         try:
-            latitude = float(ll[0][0:2]) + float(ll[0][2:]) / 60
-
-            if ll[1] == "S":
-                latitude *= -1
-
-            longitude = float(ll[2][0:3]) + float(ll[2][3:]) / 60
-
-            if ll[3] == "W":
-                longitude *= -1
-
-            return (latitude, longitude)
-        except:
+            return nmea.parse_ll(ll)
+        except (ValueError, IndexError):
             self.errlog("parse_ll_fix_error", "Error parsing: {}".format(ll))
             return (None, None)
 
-    def parse_rmc(self, pkt):
+    def parse_rmc(self, fields):
         """
                0      1          2 3         4 5          6 7    8      9      10 11 12
         Parse: $GNRMC,142323.000,A,3446.4447,N,11145.9536,W,0.00,206.73,280318,  ,  ,D*6D
@@ -300,29 +537,21 @@ class GPS_Poller:
             8	Magnetic variation in degrees
             9	The checksum data, always begins with *
          """
-        fields = pkt.split(',')
+        self.sched.epoch_start()
 
         if fields[2] != 'A':
             self.clear_fix("rmc")
             return
 
-        try:
-            fix_ll = self.parse_ll_fix(fields[3:7])
-            ddmmyy = fields[9]
-            dd = int(ddmmyy[0:2])
-            mm = int(ddmmyy[2:4])
-            yy = int(ddmmyy[4:])
-            if yy < 100:
-                yy += 2000
-            fix_time = self.parse_gps_utc(fields[1])
-            self.set_gps_time((yy, mm, dd) + fix_time, "rmc")
-            self.set_fix(fix_time, fix_ll, "rmc")
-        except:
-            self.errlog("parse_rmc_fail", "Failed to parse: " + pkt)
-
-        return
+        fix_ll = self.parse_ll_fix(fields[3:7])
+        fix_time = nmea.parse_utc(fields[1])
+        speed_kn = nmea.parse_float(fields[7])
+        self.fix.speed = speed_kn * self.fix.KNOTS_TO_MS if speed_kn is not None else None
+        self.fix.course = nmea.parse_float(fields[8])
+        self.set_gps_time(nmea.parse_date(fields[9]) + fix_time, "rmc")
+        self.set_fix(fix_time, fix_ll, "rmc")
 
-    def parse_gll(self, pkt):
+    def parse_gll(self, fields):
         """
                0      1         2 3          4 5          6 7
         Parse: $GNGLL,3324.8933,N,11200.4470,W,161732.000,A,A*57
@@ -335,20 +564,15 @@ class GPS_Poller:
             6	Fixed text "A" shows that data is valid
             7	The checksum data, always begins with *
         """
-        fields = pkt.split(',')
-
         if fields[6] != 'A':
             self.clear_fix("gll")
             return
 
-        try:
-            fix_ll = self.parse_ll_fix(fields[1:5])
-            fix_time = self.parse_gps_utc(fields[5])
-            self.set_fix(fix_time, fix_ll, "gll")
-        except:
-            self.errlog("parse_gll_fail", "Failed to parse: " + pkt)
+        fix_ll = self.parse_ll_fix(fields[1:5])
+        fix_time = nmea.parse_utc(fields[5])
+        self.set_fix(fix_time, fix_ll, "gll")
 
-    def parse_zda(self, pkt):
+    def parse_zda(self, fields):
         """
                0      1          2  3  4    5 6 7
         Parse: $GNZDA,142323.000,28,03,2018, ,  *4F
@@ -363,66 +587,132 @@ class GPS_Poller:
 
         Note: $GNZDA,000507.800,06,01,1980,,*45 - GPS Week 0 - Not valid date
         """
-        fields = pkt.split(',')
-
-        try:
-            tm = self.parse_gps_utc(fields[1])
-            dd = int(fields[2])
-            mm = int(fields[3])
-            yy = int(fields[4])
-            self.set_gps_time((yy, mm, dd) + tm, "zda")
-        except:
-            self.errlog("parse_zda_fail", "Failed to parse: " + pkt)
+        tm = nmea.parse_utc(fields[1])
+        dd = int(fields[2])
+        mm = int(fields[3])
+        yy = int(fields[4])
+        self.set_gps_time((yy, mm, dd) + tm, "zda")
 
-    def queue_cmd(self, cmd, wait_for=None, timeout=10):
-        self.cmd_queue.append((cmd, wait_for, timeout))
+    def parse_gga(self, fields):
+        """
+               0      1          2         3 4          5 6 7 8    9      10 11   12 13 14
+        Parse: $GPGGA,100059.000,3446.4447,N,11145.9536,W,1,9,0.92,1520.4,M,-26.5,M,  ,  *5E
+            6	Fix quality 0=invalid 1=GPS 2=DGPS 6=estimated
+            7	Number of satellites in use
+            8	HDOP
+            9	Altitude above mean sea level
+        """
+        self.fix.quality = int(fields[6])
+        self.fix.sats = nmea.parse_int(fields[7])
+        self.fix.hdop = nmea.parse_float(fields[8])
+        self.fix.alt = nmea.parse_float(fields[9])
 
-    def send_next_cmd(self, force=False):
-        if len(self.cmd_queue) == 0:
+    def parse_gsa(self, fields):
+        """
+               0      1 2 3-14         15   16   17
+        Parse: $GNGSA,A,3,10,20,...,,,1.21,0.92,0.79*17
+            2	Fix type 1=none 2=2D 3=3D
+            3-14	PRNs of satellites used
+            15	PDOP
+            16	HDOP
+            17	VDOP
+        """
+        self.fix.fix_type = int(fields[2])
+        self.fix.pdop = nmea.parse_float(fields[15])
+        self.fix.vdop = nmea.parse_float(fields[17])
+        self.sats.add_gsa(fields[0][1:3], fields)
+
+    def parse_gsv(self, fields):
+        """ One part of a GSV sequence, see gps_sats.Sat_Table.add_gsv """
+        if not self.sats.add_gsv(fields[0][1:3], fields):
             return
 
-        if self.cmd_wait_for and force == False:
-            return
+        # Raw parts past the end of a shorter sequence are stale
+        if self.keep_raw:
+            part = int(fields[1]) + 1
 
-        cmd, wait_for, timeout = self.cmd_queue[0]
+            while part <= 9:
+                self.state.pop("%s-%d" % (fields[0], part), None)
+                part += 1
 
-        chksum = 0
-        for ch in cmd[1:]:
-            chksum ^= ord(ch)
+    def parse_vtg(self, fields):
+        """
+               0      1      2 3 4 5    6 7     8 9
+        Parse: $GPVTG,139.09,T, ,M,9.75,N,18.07,K,N*05
+            1	Course over ground, degrees true
+            5	Speed over ground in knots
+            7	Speed over ground in km/h
+        """
+        self.fix.course = nmea.parse_float(fields[1])
+        speed_kmh = nmea.parse_float(fields[7])
+        self.fix.speed = speed_kmh / 3.6 if speed_kmh is not None else None
 
-        cmd += "*%02X\r\n" % chksum
+    def parse_pqvel(self, fields):
+        """
+               0      1         2        3
+        Parse: $PQVEL,-3.844606,3.321756,-0.130539*6D
+            1-3	Velocity east, north and up in m/s
 
-        self.i2c.writeto(self.GPS_I2CADDR, cmd.encode("ascii"))
+        The $PQVEL,W,OK reply to our own enable command is skipped.
+        """
+        if fields[1] == "W":
+            return
 
-        if wait_for == None: # By default expect a PMTK001,Cmd,3 (success)
-            wait_for = "$PMTK001,%s,3" % cmd[5:8]
+        self.fix.vel_e = float(fields[1])
+        self.fix.vel_n = float(fields[2])
+        self.fix.vel_u = float(fields[3])
 
-        # Retry command after timeout seconds
-        self.cmd_timeout = time.time() + timeout
+    def parse_easy(self, fields):
+        """
+               0        1 2 3
+        Parse: $PMTK869,2,1,3*29
+            1	2 = reply to the $PMTK869,0 query
+            2	EASY enabled
+            3	Days of orbit prediction left
+        """
+        if fields[1] != "2":
+            return
 
-        if len(wait_for) > 0:
-            self.cmd_wait_for = wait_for
-        else:
-            self.cmd_wait_for = None
-            self.cmd_queue.pop(0)
+        self.state["easy_enabled"] = fields[2] == "1"
+        self.state["easy_days"] = int(fields[3])
 
-    def check_cmd_response(self, pkt):
-        if not self.cmd_wait_for:
-            return
+    def queue_cmd(self, cmd, wait_for=None, timeout=10, retries=3):
+        """
+        Queue a command for the L76, see gps_cmd.Cmd_Engine
 
-        if pkt.startswith(self.cmd_wait_for):
-            self.cmd_wait_for = None
-            self.cmd_timeout = None
-            self.cmd_queue.pop(0)
-            self.send_next_cmd()
-            return
+        By default $PMTK commands wait for their $PMTK001,<cmd>,3 ack, otherwise
+        for a sentence starting with wait_for ("" to not wait at all).
+        """
+        self.cmds.add(cmd, wait_for, timeout, retries)
+
+        # Let the scheduler know the output rate we configure
+        try:
+            if cmd.startswith("$PMTK220,"):
+                self.sched.set_fix_interval(int(cmd[9:]))
+            elif cmd.startswith("$PMTK314,"):
+                self.sched.set_output_rates([int(rate) for rate in cmd[9:].split(",")])
+        except ValueError:
+            pass
 
-        if time.time() > self.cmd_timeout:
-            self.errlog("cmd_timeout", "Timeout sending %s" % self.cmd_queue[0][0])
-            self.send_next_cmd(force=True)
+    def write_cmds(self, data):
+        self.i2c.writeto(self.GPS_I2CADDR, data)
 
-    def errlog(self, err_type, err_msg):
-        self.state["last_" + err_type] = "@%d: %s" % (self.read_count, err_msg)
+    def errlog(self, err_type, err_msg, *args):
+        """
+        Record the last message and count of err_type
+
+        When args are given err_msg is a format string, formatting is deferred
+        until the state is logged to keep it out of the per-sentence path.
+        """
+        last_key = "last_" + err_type
+
+        if args:
+            if last_key not in self.state:
+                self.state[last_key] = None
+            self.errlog_pending[last_key] = (self.read_count, err_msg, args)
+        else:
+            self.errlog_pending.pop(last_key, None)
+            self.state[last_key] = "@%d: %s" % (self.read_count, err_msg)
 
         err_key = "errcnt_" + err_type
 
@@ -432,23 +722,48 @@ class GPS_Poller:
             self.state[err_key] = 1
 
 class GPS_SD_Logger:
-    def __init__(self, gps_poller, stdout_echo=False):
+    LOG_JSON = "json"
+    LOG_BIN = "bin"
+    LOG_DELTA = "delta"
+
+    def __init__(self, gps_poller, stdout_echo=False, backend=None, log_format=LOG_JSON, keyframe_interval=60, writer=None):
         self.gps_poller = gps_poller
+        self.backend = backend if backend else gps_poller.backend
+        self.log_format = log_format
+        self.binlog = None
+        self.delta = None
+
+        # Only load the encoder in use
+        if log_format == self.LOG_BIN:
+            import gps_binlog
+            self.binlog = gps_binlog.Binlog_Encoder()
+        elif log_format == self.LOG_DELTA:
+            import gps_delta
+            self.delta = gps_delta.Delta_Encoder(keyframe_interval)
         self.have_SD = False
         self.log_fh = None
+        self.writer = writer if writer else buffered_writer.Buffered_Writer()
         self.log_fn = None
         self.log_tag = None
         self.stdout_echo = stdout_echo
-        self.py = pytrack.Pytrack()
 
-        try:
-            os.listdir("/sd")
+        # Records are streamed to the sinks instead of built with json.dumps, only binary logs without echo skip it
+        self.encoder = None
+
+        if log_format != self.LOG_BIN or stdout_echo:
+            import json_stream
+            self.encoder = json_stream.JSON_Stream()
+
+        self.file_sinks = (self.writer.write_part,)
+        self.stdout_sinks = (gps_hal.stdout_write,)
+        self.both_sinks = (self.writer.write_part, gps_hal.stdout_write)
+
+        if self.backend.sd_mounted():
             self.have_SD = True
             print(">> SD Card already mounted")
-        except:
+        else:
             try:
-                sd = machine.SD()
-                os.mount(sd, "/sd") # pylint: disable=E1101
+                self.backend.mount_sd()
                 self.have_SD = True
                 print(">> Mounted SD card")
             except:
@@ -461,58 +776,147 @@ class GPS_SD_Logger:
         return str(self.__dict__)
 
     def log_state(self):
+        prof = self.gps_poller.prof
+        log_start = gps_hal.ticks_us() if prof is not None else 0
         tm = time.localtime()
         log_entry = {}
         log_entry["time"] = "%04d-%02d-%02d %02d:%02d:%02d UTC" % tm[:6]
         log_entry["battery"] = 0.0
         log_entry["battery_status"] = "ERROR"
 
-        try:
-            log_entry["battery"] = self.py.read_battery_voltage()
+        # Sampled by the poll loop, see battery_monitor
+        voltage = self.gps_poller.battery.voltage
+
+        if voltage is not None:
+            log_entry["battery"] = voltage
             log_entry["battery_status"] = "OK"
-        except:
-            pass
 
         log_entry["state"] = self.gps_poller.state
+
+        if "reset_to_logged_fix_ms" not in log_entry["state"] and self.gps_poller.fix.valid:
+            log_entry["state"]["reset_to_logged_fix_ms"] = gps_hal.uptime_ms()
+        log_entry["fix"] = self.gps_poller.fix.as_dict()
+        # No simplifier before the first fix
+        track = self.gps_poller.track
+        log_entry["track"] = track.take_points() if track is not None else []
+        log_entry["sats"] = self.gps_poller.sats.as_dict()
+
+        if self.gps_poller.fences:
+            log_entry["geofence"] = self.gps_poller.fences.take_events()
+
         log_entry["count"] = self.gps_poller.read_count
-        gc.collect()
-        log_entry["mem_free"] = gc.mem_free()
+
+        # With the memory manager collections happen in idle slots instead
+        if self.gps_poller.mem is None:
+            stage_start = gps_hal.ticks_us() if prof is not None else 0
+            gc.collect()
+
+            if prof is not None:
+                prof.add(prof.GC_COLLECT, gps_hal.ticks_diff(gps_hal.ticks_us(), stage_start))
+
+        log_entry["mem_free"] = gps_hal.mem_free()
+
+        if self.gps_poller.uplink is not None and self.gps_poller.fix.valid:
+            self.gps_poller.uplink.add(tm, self.gps_poller.fix, log_entry["battery"], log_entry["battery_status"] == "OK", log_entry["count"], log_entry["mem_free"])
+
+        # Stages timed since the previous entry, this log_state is in the next one
+        if prof is not None:
+            log_entry["timing"] = prof.summary()
 
         if not self.have_SD:
             log_entry["NOSDCARD"] = True
+        else:
+            log_entry["sd_writer"] = self.writer.stats()
+
+        # Figures of the previous record
+        if self.encoder is not None:
+            log_entry["json_stream"] = self.encoder.stats()
 
-        log_entry = json.dumps(log_entry) + "\n"
+        # A new file must start with a delta keyframe
+        if self.have_SD and self.open_log(tm) and self.delta:
+            self.delta.reset()
 
-        if self.have_SD:
-            # YYYYMMDDHH
-            log_tag = tm[0] * 1000000 + tm[1] * 10000 + tm[2] * 100 + tm[3]
+        stage_start = gps_hal.ticks_us() if prof is not None else 0
 
-            # Time for new file?
-            if self.log_tag != log_tag or not self.log_fh:
-                self.log_tag = log_tag
-                if self.log_fh:
-                    self.log_fh.close()
-                    self.log_fh = None
+        # JSON and delta records are streamed, the JSON log line is the stdout echo as well
+        if self.binlog:
+            record = self.binlog.encode(tm, self.gps_poller.fix, log_entry["battery"], log_entry["battery_status"] == "OK", log_entry["count"], log_entry["mem_free"])
+        elif self.delta:
+            record = self.delta.encode(log_entry)
+        else:
+            record = log_entry
+
+        echoed = False
 
-                self.log_fn = "/sd/gps-log-{}.json".format(self.log_tag)
-                try:
-                    self.log_fh = open(self.log_fn, "a", encoding="ascii")
-                    self.log_tag = log_tag
-                    print("** Logging to %s" % self.log_fn)
-                except Exception as e:
-                    sys.print_exception(e) # pylint: disable=E1101
-                    print("** failed to open %s: No SD card?" % self.log_fn)
+        if self.log_fh and not self.binlog:
+            echoed = self.stdout_echo and record is log_entry
+            self.encoder.dump(record, self.both_sinks if echoed else self.file_sinks)
 
-            if self.log_fh:
-                self.log_fh.write(log_entry)
-                self.log_fh.flush()
+        if prof is not None:
+            prof.add(prof.JSON_DUMPS, gps_hal.ticks_diff(gps_hal.ticks_us(), stage_start))
+            stage_start = gps_hal.ticks_us()
 
-        if self.stdout_echo:
-            print(log_entry, end='', flush=True)
+        if self.log_fh:
+            if self.binlog:
+                self.writer.write(record)
+            else:
+                self.writer.end_record()
+
+            if prof is not None:
+                prof.add(prof.SD_WRITE, gps_hal.ticks_diff(gps_hal.ticks_us(), stage_start))
+
+        if self.stdout_echo and not echoed:
+            self.encoder.dump(log_entry, self.stdout_sinks)
+
+        if prof is not None:
+            prof.add(prof.LOG_STATE, gps_hal.ticks_diff(gps_hal.ticks_us(), log_start))
+
+    def open_log(self, tm):
+        """ Open the log file for tm, returns True if a new file was opened """
+        # YYYYMMDDHH
+        log_tag = tm[0] * 1000000 + tm[1] * 10000 + tm[2] * 100 + tm[3]
+
+        # Time for new file?
+        if self.log_tag == log_tag and self.log_fh:
+            return False
+
+        self.log_tag = log_tag
+        self.writer.close()
+        self.log_fh = None
+
+        self.log_fn = "{}/gps-log-{}.{}".format(self.backend.sd_root, self.log_tag, self.log_format)
+        try:
+            self.log_fh = self.writer.open(self.log_fn)
+
+            if self.binlog:
+                self.align_binlog()
+
+            print("** Logging to %s" % self.log_fn)
+            return True
+        except Exception as e:
+            gps_hal.print_exception(e)
+            print("** failed to open %s: No SD card?" % self.log_fn)
+            return False
+
+    def align_binlog(self):
+        """ Write the header to a new file, pad a record cut short by a reset so later records stay aligned """
+        import gps_binlog
+        size = self.log_fh.tell()
+
+        if size == 0:
+            self.log_fh.write(gps_binlog.header())
+            return
+
+        partial = (size - gps_binlog.HEADER_SIZE) % gps_binlog.RECORD_SIZE
+
+        if size > gps_binlog.HEADER_SIZE and partial:
+            # The padded record fails its CRC and is skipped by the decoder
+            self.log_fh.write(bytes(gps_binlog.RECORD_SIZE - partial))
+            self.gps_poller.errlog("binlog_pad", "Padded partial record of {} bytes in {}", partial, self.log_fn)
 
     def log_stop(self, stop_exception):
         if stop_exception:
-            stop_out = uio.StringIO()
+            stop_out = gps_hal.StringIO()
 
             print(">" * 80, file=stop_out)
             print(" Stopped at " + str(time.localtime()[:6]), file=stop_out)
@@ -520,7 +924,7 @@ class GPS_SD_Logger:
 
             if stop_exception:
                 print("Exception: ", file=stop_out)
-                sys.print_exception(stop_exception, stop_out) # pylint: disable=E1101
+                gps_hal.print_exception(stop_exception, stop_out)
                 print("-" * 80, file=stop_out)
 
             print(str(self.gps_poller), end='', file=stop_out)
@@ -529,7 +933,7 @@ class GPS_SD_Logger:
             stop_msg = stop_out.getvalue()
 
             try:
-                with open("/sd/stoplog.txt", "a+") as fh:
+                with open(self.backend.sd_root + "/stoplog.txt", "a+") as fh:
                     print(stop_msg, file=fh)
             except:
                 pass
@@ -537,9 +941,18 @@ class GPS_SD_Logger:
             if self.stdout_echo:
                 print(stop_msg)
 
+        if not self.have_SD:
+            return
+
+        try:
+            self.writer.close()
+            self.log_fh = None
+        except Exception as e:
+            gps_hal.print_exception(e)
+
         try:
-            os.unmount("/sd") # pylint: disable=E1101
-            print("** Unmounted /sd")
+            self.backend.unmount_sd()
+            print("** Unmounted %s" % self.backend.sd_root)
         except:
             pass
 
@@ -0,0 +1,237 @@
+"""
+Satellites in view, assembled from multi-part GSV sequences
+
+Each constellation has two preallocated tables of MAX_SATS entries of
+ENTRY_SIZE bytes: prn, elevation (degrees), azimuth (2 bytes, little endian)
+and SNR (dB-Hz), NONE for a field without a value. The parts of a GSV
+sequence fill the back table, the final part swaps it with the front table,
+so readers only ever see complete sequences and a shorter sequence leaves
+nothing stale behind. A sequence with a missing or out of order part is
+dropped and counted in gsv_seq_errors.
+
+GSA sentences give the PRNs used in the solution per constellation. With a
+$GNGSA talker the constellation is taken from the NMEA 4.1 system id when
+present, otherwise from the PRN range (65-96 is GLONASS).
+"""
+import nmea
+
+MAX_SATS = 32
+ENTRY_SIZE = 5
+MAX_USED = 12
+NONE = 0xFF
+
+CONSTELLATIONS = ("gps", "glonass", "galileo", "beidou", "qzss")
+
+TALKERS = {
+    "GP": 0,
+    "GL": 1,
+    "GA": 2,
+    "GB": 3,
+    "BD": 3,
+    "GQ": 4,
+}
+
+# GSA system id (NMEA 4.1) -> constellation
+SYSTEM_IDS = {1: 0, 2: 1, 3: 2, 4: 3, 5: 4}
+
+class Constellation:
+    def __init__(self):
+        self.front = bytearray(MAX_SATS * ENTRY_SIZE)
+        self.back = bytearray(MAX_SATS * ENTRY_SIZE)
+        self.count = 0
+        self.back_count = 0
+        self.next_part = 1
+        self.used = bytearray(MAX_USED)
+        self.used_count = 0
+
+    def is_used(self, prn):
+        idx = 0
+
+        while idx < self.used_count:
+            if self.used[idx] == prn:
+                return True
+
+            idx += 1
+
+        return False
+
+class Sat_Table:
+    def __init__(self):
+        self.systems = [None] * len(CONSTELLATIONS)
+        self.sequences = 0
+        self.seq_errors = 0
+        self.truncated = 0
+
+    def system(self, idx):
+        system = self.systems[idx]
+
+        if system is None:
+            system = self.systems[idx] = Constellation()
+
+        return system
+
+    def add_gsv(self, talker, fields):
+        """
+               0      1 2 3  4  5  6   7  ... 4 blocks of prn,elev,az,snr [signal id]
+        Parse: $GPGSV,3,1,11,10,63,139,38,20,55,270,41,...
+            1	Number of parts
+            2	Part number
+            3	Satellites in view
+        Returns True when the sequence is complete.
+        """
+        idx = TALKERS.get(talker)
+
+        if idx is None:
+            return False
+
+        system = self.system(idx)
+        parts = int(fields[1])
+        part = int(fields[2])
+
+        if part == 1:
+            # A sequence cut short by a new one
+            if system.next_part != 1:
+                self.seq_errors += 1
+
+            system.back_count = 0
+        elif part != system.next_part:
+            self.seq_errors += 1
+            system.next_part = 1
+            return False
+
+        table = system.back
+        field = 4
+
+        while field + 3 < len(fields):
+            if fields[field] != "":
+                if system.back_count < MAX_SATS:
+                    offset = system.back_count * ENTRY_SIZE
+                    elevation = nmea.parse_int(fields[field + 1])
+                    azimuth = nmea.parse_int(fields[field + 2])
+                    snr = nmea.parse_int(fields[field + 3])
+
+                    if azimuth is None:
+                        azimuth = 0xFFFF
+
+                    table[offset] = int(fields[field])
+                    table[offset + 1] = elevation if elevation is not None else NONE
+                    table[offset + 2] = azimuth & 0xFF
+                    table[offset + 3] = azimuth >> 8
+                    table[offset + 4] = snr if snr is not None else NONE
+                    system.back_count += 1
+                else:
+                    self.truncated += 1
+
+            field += 4
+
+        if part < parts:
+            system.next_part = part + 1
+            return False
+
+        # Final part, publish the sequence
+        system.front, system.back = system.back, system.front
+        system.count = system.back_count
+        system.next_part = 1
+        self.sequences += 1
+        return True
+
+    def add_gsa(self, talker, fields):
+        """ Used PRNs from fields 3-14 of a GSA sentence """
+        idx = TALKERS.get(talker)
+
+        if len(fields) > 18 and fields[18] != "":
+            idx = SYSTEM_IDS.get(int(fields[18]), idx)
+        elif idx is None and fields[3] != "":
+            idx = 1 if 65 <= int(fields[3]) <= 96 else 0
+
+        if idx is None:
+            return
+
+        system = self.system(idx)
+        system.used_count = 0
+
+        for field in fields[3:3 + MAX_USED]:
+            if field != "":
+                system.used[system.used_count] = int(field)
+                system.used_count += 1
+
+    def satellites(self, idx):
+        """ [(prn, elevation, azimuth, snr, used)] of a constellation, None for missing values """
+        system = self.systems[idx]
+        sats = []
+
+        if system is None:
+            return sats
+
+        table = system.front
+        offset = 0
+
+        while offset < system.count * ENTRY_SIZE:
+            azimuth = table[offset + 2] | table[offset + 3] << 8
+            sats.append((
+                table[offset],
+                table[offset + 1] if table[offset + 1] != NONE else None,
+                azimuth if azimuth != 0xFFFF else None,
+                table[offset + 4] if table[offset + 4] != NONE else None,
+                system.is_used(table[offset]),
+            ))
+            offset += ENTRY_SIZE
+
+        return sats
+
+    def as_dict(self):
+        """ {constellation: [[prn, elevation, azimuth, snr, used 0/1], ...]} for the log """
+        out = {}
+
+        for idx, name in enumerate(CONSTELLATIONS):
+            if self.systems[idx] is not None and self.systems[idx].count:
+                out[name] = [[prn, elev, az, snr, 1 if used else 0] for prn, elev, az, snr, used in self.satellites(idx)]
+
+        return out
+
+    def stats(self):
+        stats = {
+            "gsv_sequences": self.sequences,
+            "gsv_seq_errors": self.seq_errors,
+            "gsv_truncated": self.truncated,
+        }
+        view_total = 0
+        used_total = 0
+        snr_sum = 0
+        snr_count = 0
+
+        for idx, name in enumerate(CONSTELLATIONS):
+            system = self.systems[idx]
+
+            if system is None:
+                continue
+
+            table = system.front
+            used = 0
+            sys_snr_sum = 0
+            sys_snr_count = 0
+            offset = 0
+
+            while offset < system.count * ENTRY_SIZE:
+                if system.is_used(table[offset]):
+                    used += 1
+
+                if table[offset + 4] != NONE:
+                    sys_snr_sum += table[offset + 4]
+                    sys_snr_count += 1
+
+                offset += ENTRY_SIZE
+
+            stats["sats_%s_view" % name] = system.count
+            stats["sats_%s_used" % name] = used
+            stats["sats_%s_snr" % name] = round(sys_snr_sum / sys_snr_count, 1) if sys_snr_count else None
+            view_total += system.count
+            used_total += used
+            snr_sum += sys_snr_sum
+            snr_count += sys_snr_count
+
+        stats["sats_view"] = view_total
+        stats["sats_used"] = used_total
+        stats["sats_snr_mean"] = round(snr_sum / snr_count, 1) if snr_count else None
+
+        return stats
@@ -0,0 +1,112 @@
+import gps_hal
+
+class I2C_Bus:
+    """
+    Single owner of the Pytrack I2C bus
+
+    The L76 and the Pycoproc PIC share I2C(0) on P22/P21. Each device talks
+    through its own I2C_Device proxy handed out by device(), which keeps
+    per-device bus time. The GPS always goes first: run_idle() is called
+    after each L76 read and only runs Pycoproc work (idle tasks such as the
+    battery monitor, one-shot jobs queued with defer() such as the Pycoproc
+    RTC calibration) when that read was below near_full bytes, ie. the L76
+    output buffer is not backing up.
+    """
+
+    def __init__(self, i2c, near_full=200):
+        self.i2c = i2c
+        self.near_full = near_full
+        self.devices = {}
+        self.idle_tasks = []
+        self.deferred = []
+        self.idle_runs = 0
+        self.idle_skips = 0
+
+    def device(self, name):
+        if name not in self.devices:
+            self.devices[name] = I2C_Device(self, name)
+
+        return self.devices[name]
+
+    def add_idle_task(self, task):
+        """ task() is called on every idle slot and must not block """
+        self.idle_tasks.append(task)
+
+    def defer(self, job):
+        """ Run job() once on the next idle slot """
+        self.deferred.append(job)
+
+    def run_idle(self, gps_read_len=0):
+        if gps_read_len >= self.near_full:
+            self.idle_skips += 1
+            return False
+
+        self.idle_runs += 1
+
+        # One deferred job per slot, they may hold the bus for a while
+        if self.deferred:
+            self.deferred.pop(0)()
+
+        for task in self.idle_tasks:
+            task()
+
+        return True
+
+    def stats(self):
+        stats = {
+            "bus_idle_runs": self.idle_runs,
+            "bus_idle_skips": self.idle_skips,
+            "bus_deferred": len(self.deferred),
+        }
+
+        for name, dev in self.devices.items():
+            stats["bus_us_" + name] = dev.bus_us
+            stats["bus_ops_" + name] = dev.ops
+
+        return stats
+
+class I2C_Device:
+    """
+    machine.I2C stand-in for one device on an I2C_Bus
+
+    deinit()/init() (Pycoproc.calibrate_rtc counting pulses on P21) release
+    and reclaim the shared bus, the time in between is booked to this device.
+    """
+
+    def __init__(self, bus, name):
+        self.bus = bus
+        self.name = name
+        self.bus_us = 0
+        self.ops = 0
+        self.released_us = None
+
+    def readfrom(self, addr, nbytes):
+        start = gps_hal.ticks_us()
+        data = self.bus.i2c.readfrom(addr, nbytes)
+        self.bus_us += gps_hal.ticks_diff(gps_hal.ticks_us(), start)
+        self.ops += 1
+        return data
+
+    def readfrom_into(self, addr, buf):
+        start = gps_hal.ticks_us()
+        self.bus.i2c.readfrom_into(addr, buf)
+        self.bus_us += gps_hal.ticks_diff(gps_hal.ticks_us(), start)
+        self.ops += 1
+
+    def writeto(self, addr, buf):
+        start = gps_hal.ticks_us()
+        nbytes = self.bus.i2c.writeto(addr, buf)
+        self.bus_us += gps_hal.ticks_diff(gps_hal.ticks_us(), start)
+        self.ops += 1
+        return nbytes
+
+    def deinit(self):
+        self.released_us = gps_hal.ticks_us()
+        self.bus.i2c.deinit()
+
+    def init(self, *args, **kwargs):
+        self.bus.i2c.init(*args, **kwargs)
+
+        if self.released_us is not None:
+            self.bus_us += gps_hal.ticks_diff(gps_hal.ticks_us(), self.released_us)
+            self.released_us = None
@@ -0,0 +1,126 @@
+"""
+Streaming JSON encoder for log records
+
+dump(obj, sinks) writes the same bytes as json.dumps(obj) + "\n" without
+ever holding the whole record: the structure is walked in place and the
+output is collected in a preallocated buffer of buf_size bytes that is
+handed to every sink(data) when full. Only scalars go through json.dumps,
+so float formatting and string escaping are exactly those of the port's
+json module. Sinks get a memoryview of the buffer that is reused once they
+return.
+
+The heap allocated during a dump (sampled at every chunk, relative to the
+start of the dump) is reported by stats() as json_heap_peak, with the
+largest seen as json_heap_peak_max. Both are None without gc.mem_alloc.
+"""
+import json
+import gps_hal
+
+class JSON_Stream:
+    def __init__(self, buf_size=256):
+        self.buf = bytearray(buf_size)
+        self.view = memoryview(self.buf)
+        self.buf_len = 0
+        self.sinks = ()
+        self.alloc_base = None
+        self.heap_peak = None
+        self.heap_peak_max = None
+        self.record_bytes = 0
+        self.dumps = 0
+
+    def stats(self):
+        return {
+            "json_dumps": self.dumps,
+            "json_record_bytes": self.record_bytes,
+            "json_heap_peak": self.heap_peak,
+            "json_heap_peak_max": self.heap_peak_max,
+        }
+
+    def dump(self, obj, sinks):
+        """ Write json.dumps(obj) + "\\n" to each of sinks in chunks """
+        self.sinks = sinks
+        self.record_bytes = 0
+        self.alloc_base = gps_hal.mem_alloc()
+        self.heap_peak = 0 if self.alloc_base is not None else None
+
+        try:
+            self.encode(obj)
+            self.put(b"\n")
+            self.flush()
+        finally:
+            self.buf_len = 0
+            self.sinks = ()
+
+        self.dumps += 1
+
+        if self.heap_peak is not None and (self.heap_peak_max is None or self.heap_peak > self.heap_peak_max):
+            self.heap_peak_max = self.heap_peak
+
+    def encode(self, value):
+        if value is None:
+            self.put(b"null")
+        elif value is True:
+            self.put(b"true")
+        elif value is False:
+            self.put(b"false")
+        elif isinstance(value, dict):
+            self.put(b"{")
+            first = True
+
+            for key, item in value.items():
+                if not first:
+                    self.put(b", ")
+
+                first = False
+                self.put(json.dumps(key if isinstance(key, str) else str(key)).encode())
+                self.put(b": ")
+                self.encode(item)
+
+            self.put(b"}")
+        elif isinstance(value, (list, tuple)):
+            self.put(b"[")
+            first = True
+
+            for item in value:
+                if not first:
+                    self.put(b", ")
+
+                first = False
+                self.encode(item)
+
+            self.put(b"]")
+        elif isinstance(value, int):
+            self.put(str(value).encode())
+        else:
+            self.put(json.dumps(value).encode())
+
+    def put(self, data):
+        data_len = len(data)
+
+        if self.buf_len + data_len > len(self.buf):
+            self.flush()
+
+            # Larger than the buffer, pass it through as is
+            if data_len > len(self.buf):
+                self.emit(data)
+                return
+
+        self.buf[self.buf_len:self.buf_len + data_len] = data
+        self.buf_len += data_len
+
+    def flush(self):
+        if self.buf_len:
+            self.emit(self.view[:self.buf_len])
+            self.buf_len = 0
+
+    def emit(self, data):
+        for sink in self.sinks:
+            sink(data)
+
+        self.record_bytes += len(data)
+
+        if self.alloc_base is not None:
+            allocated = gps_hal.mem_alloc() - self.alloc_base
+
+            if allocated > self.heap_peak:
+                self.heap_peak = allocated
@@ -0,0 +1,159 @@
+import gc
+import gps_hal
+
+class Mem_Manager:
+    """
+    Heap management for long runs
+
+    Sets gc.threshold(threshold) so an automatic collection never has much
+    to scan, and collects in idle slots instead: when the poll scheduler is
+    about to sleep for at least min_idle_ms and threshold / 2 bytes were
+    allocated since the last collection, so the automatic collection rarely
+    lands in the middle of an L76 burst. MicroPython's collector is not
+    incremental, frequent small collections are the nearest thing.
+
+    Also tracks the bytes allocated per poll iteration, the lowest mem_free
+    seen and the largest allocatable block (probed up to probe_max bytes on
+    every probe_every-th log record, and on every record while mem_low_alarm
+    is set, since the probe itself allocates). mem_low_alarm is raised in the state when mem_free
+    drops below low_watermark. Without gc.mem_alloc (CPython) every idle
+    slot collects and there are no allocation figures.
+    """
+
+    def __init__(self, threshold=32768, min_idle_ms=50, low_watermark=16384, probe_max=65536, probe_every=30):
+        self.threshold = threshold
+        self.min_idle_ms = min_idle_ms
+        self.low_watermark = low_watermark
+        self.probe_max = probe_max
+        self.probe_every = probe_every
+        self.probe_countdown = 0
+        self.threshold_set = gps_hal.gc_threshold(threshold)
+        self.track = gps_hal.mem_alloc() is not None
+        self.alloc_base = gps_hal.mem_alloc()
+        self.iter_mark = None
+        self.iter_count = 0
+        self.iter_total = 0
+        self.iter_max = 0
+        self.collect_count = 0
+        self.collect_us_last = 0
+        self.collect_us_max = 0
+        self.free_min = None
+        self.largest_free = None
+        self.low_alarm = False
+        self.low_count = 0
+
+    def stats(self):
+        stats = {
+            "mem_gc_threshold": self.threshold if self.threshold_set else None,
+            "mem_gc_idle": self.collect_count,
+            "mem_gc_us_last": self.collect_us_last,
+            "mem_gc_us_max": self.collect_us_max,
+            "mem_low_alarm": self.low_alarm,
+            "mem_low_count": self.low_count,
+        }
+
+        if self.track:
+            stats["mem_alloc_iter_avg"] = self.iter_total // self.iter_count if self.iter_count else 0
+            stats["mem_alloc_iter_max"] = self.iter_max
+            stats["mem_free_min"] = self.free_min
+            stats["mem_largest_free"] = self.largest_free
+
+        return stats
+
+    def iteration_start(self):
+        if self.track:
+            self.iter_mark = gps_hal.mem_alloc()
+
+    def iteration_end(self):
+        if self.iter_mark is None:
+            return
+
+        delta = gps_hal.mem_alloc() - self.iter_mark
+
+        # Negative when a collection ran during the iteration, the sample is lost
+        if delta >= 0:
+            self.iter_count += 1
+            self.iter_total += delta
+
+            if delta > self.iter_max:
+                self.iter_max = delta
+
+    def idle(self, delay_ms):
+        """ Called with the time until the next read, collects if it is worth it """
+        if delay_ms < self.min_idle_ms:
+            return False
+
+        if self.track:
+            allocated = gps_hal.mem_alloc() - self.alloc_base
+
+            # An automatic collection ran since, start counting from here
+            if allocated < 0:
+                self.alloc_base = gps_hal.mem_alloc()
+                return False
+
+            if allocated < self.threshold // 2:
+                return False
+
+        self.collect()
+        return True
+
+    def collect(self):
+        start = gps_hal.ticks_us()
+        gc.collect()
+        elapsed = gps_hal.ticks_diff(gps_hal.ticks_us(), start)
+
+        self.collect_count += 1
+        self.collect_us_last = elapsed
+
+        if elapsed > self.collect_us_max:
+            self.collect_us_max = elapsed
+
+        self.alloc_base = gps_hal.mem_alloc()
+        self.check_free()
+
+    def check_free(self):
+        free = gps_hal.mem_free()
+
+        if free is None:
+            return
+
+        if self.free_min is None or free < self.free_min:
+            self.free_min = free
+
+        if free < self.low_watermark:
+            if not self.low_alarm:
+                self.low_count += 1
+
+            self.low_alarm = True
+        else:
+            self.low_alarm = False
+
+    def log_check(self):
+        """ Called once per log record """
+        self.check_free()
+
+        if self.low_alarm or self.probe_countdown <= 0:
+            self.probe_largest_free()
+            self.probe_countdown = self.probe_every
+
+        self.probe_countdown -= 1
+
+    def probe_largest_free(self):
+        """ Binary search for the largest bytearray that can be allocated, up to probe_max """
+        if not self.track:
+            return None
+
+        low = 0
+        high = min(self.probe_max, gps_hal.mem_free())
+
+        while low < high:
+            size = (low + high + 1) // 2
+
+            try:
+                bytearray(size)
+                low = size
+            except MemoryError:
+                high = size - 1
+
+        self.largest_free = low
+        return low
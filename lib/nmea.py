@@ -0,0 +1,131 @@
+"""
+NMEA framing and field parsing shared by the poller and host side tools
+
+The field parsers take the already tokenized fields of a sentence and raise
+ValueError or IndexError on malformed input. The framing checks work on raw
+bytes so corrupt sentences are rejected before anything is decoded.
+"""
+
+def parse_utc(hhmmss):
+    """ hhmmss.sss -> (hh, mm, ss) """
+    try:
+        hh = int(hhmmss[0:2])
+        mm = int(hhmmss[2:4])
+        ss = float(hhmmss[4:])
+        return (hh, mm, ss)
+    except ValueError:
+        return (None, None, None)
+
+def parse_date(ddmmyy):
+    """ ddmmyy -> (yy, mm, dd) """
+    dd = int(ddmmyy[0:2])
+    mm = int(ddmmyy[2:4])
+    yy = int(ddmmyy[4:])
+
+    if yy < 100:
+        yy += 2000
+
+    return (yy, mm, dd)
+
+def parse_ll(ll):
+    """ Parse Lat,Dir,Long,Dir -> (latitude, longitude) in degrees """
+    latitude = float(ll[0][0:2]) + float(ll[0][2:]) / 60
+
+    if ll[1] == "S":
+        latitude *= -1
+
+    longitude = float(ll[2][0:3]) + float(ll[2][3:]) / 60
+
+    if ll[3] == "W":
+        longitude *= -1
+
+    return (latitude, longitude)
+
+def parse_float(field):
+    """ Optional numeric field, None when empty """
+    if field == "":
+        return None
+
+    return float(field)
+
+def parse_int(field):
+    """ Optional integer field, None when empty """
+    if field == "":
+        return None
+
+    return int(field)
+
+# check_frame() results below zero
+FRAME_NO_CHKSUM = -1
+FRAME_BAD = -2
+FRAME_BAD_CHKSUM = -3
+
+def checksum(buf, start, end):
+    """ XOR of the bytes buf[start:end] """
+    chksum = 0
+    i = start
+
+    while i < end:
+        chksum ^= buf[i]
+        i += 1
+
+    return chksum
+
+def check_frame(buf, start, end):
+    """
+    Validate [$]msg*hh framing and checksum of the raw bytes buf[start:end]
+
+    Returns the offset of the "*" on success or one of the FRAME_* codes,
+    without allocating.
+    """
+    i = start
+
+    if i < end and buf[i] == 0x24: # $
+        i += 1
+
+    chksum = 0
+
+    while i < end:
+        ch = buf[i]
+
+        if ch == 0x2A: # *
+            break
+
+        chksum ^= ch
+        i += 1
+
+    if i >= end:
+        return FRAME_NO_CHKSUM
+
+    star = i
+    pkt_chksum = 0
+    i += 1
+
+    # One or two hex digits
+    if i == end or end - i > 2:
+        return FRAME_BAD
+
+    while i < end:
+        ch = buf[i]
+
+        if 0x30 <= ch <= 0x39: # 0-9
+            ch -= 0x30
+        elif 0x41 <= ch <= 0x46: # A-F
+            ch -= 0x37
+        elif 0x61 <= ch <= 0x66: # a-f
+            ch -= 0x57
+        else:
+            return FRAME_BAD
+
+        pkt_chksum = (pkt_chksum << 4) | ch
+        i += 1
+
+    if pkt_chksum != chksum:
+        return FRAME_BAD_CHKSUM
+
+    return star
+
+try:
+    from nmea_viper import checksum, check_frame # pylint: disable=W0611
+except (ImportError, SyntaxError):
+    pass
@@ -0,0 +1,142 @@
+import gps_hal
+
+CR = 0x0D
+LF = 0x0A
+
+class NMEA_Ring_Buffer:
+    """
+    Preallocated receive buffer for the L76 I2C stream
+
+    The buffer is laid out as [carry | read window]. Every read lands in the
+    fixed read window and the unterminated tail of the previous read is kept
+    in the carry area right in front of it, so a sentence split across two
+    reads is contiguous without concatenating or slicing buffers. Nothing is
+    allocated until a complete sentence is handed to on_sentence.
+    """
+
+    def __init__(self, read_size=255, carry_size=256):
+        self.read_size = read_size
+        self.carry_size = carry_size
+        self.buf = bytearray(carry_size + read_size)
+        self.window = memoryview(self.buf)[carry_size:]
+        self.carry = 0
+        self.last_len = 0
+        self.pkt_count = 0
+        self.overflow_count = 0
+        self.track_alloc = gps_hal.mem_alloc() is not None
+        self.alloc_bytes = 0
+        # Stage_Timer, None unless profiling
+        self.prof = None
+
+    def alloc_per_pkt(self):
+        """ Bytes allocated by fill() itself per sentence, None if unknown """
+        if not self.track_alloc or self.pkt_count == 0:
+            return None
+
+        return self.alloc_bytes / self.pkt_count
+
+    def count_alloc(self, alloc_mark):
+        delta = gps_hal.mem_alloc() - alloc_mark
+
+        # A negative delta means a collection ran, the sample is lost
+        if delta > 0:
+            self.alloc_bytes += delta
+
+    def fill(self, i2c, addr, on_sentence):
+        """
+        Read once from the device and call on_sentence(buf, start, end) for
+        each complete sentence, line terminators excluded.
+
+        Returns the number of data bytes read, newline padding excluded.
+        """
+        alloc_mark = gps_hal.mem_alloc()
+        prof = self.prof
+
+        if prof is not None:
+            read_start = gps_hal.ticks_us()
+
+        i2c.readfrom_into(addr, self.window)
+
+        if prof is not None:
+            scan_start = gps_hal.ticks_us()
+            prof.add(prof.I2C_READ, gps_hal.ticks_diff(scan_start, read_start))
+            sentence_us = 0
+
+        buf = self.buf
+        base = self.carry_size
+        end = base + self.read_size
+
+        # The L76 pads the read with newlines, skip them on both sides
+        first = base
+        while first < end and buf[first] == LF:
+            first += 1
+
+        last = end
+        while last > first and buf[last - 1] == LF:
+            last -= 1
+
+        self.last_len = last - first
+
+        if first == last:
+            if prof is not None:
+                prof.add(prof.FRAMING, gps_hal.ticks_diff(gps_hal.ticks_us(), scan_start))
+            return 0
+
+        # Keep a partial sentence contiguous with the data that follows it
+        carry = self.carry
+        if carry and first > base:
+            i = 1
+            while i <= carry:
+                buf[first - i] = buf[base - i]
+                i += 1
+
+        pkt_start = first - carry
+        i = first
+
+        while i < last:
+            ch = buf[i]
+
+            if ch == CR or ch == LF:
+                if i > pkt_start:
+                    self.pkt_count += 1
+
+                    if alloc_mark is not None:
+                        self.count_alloc(alloc_mark)
+
+                    if prof is not None:
+                        sentence_start = gps_hal.ticks_us()
+                        on_sentence(buf, pkt_start, i)
+                        sentence_us += gps_hal.ticks_diff(gps_hal.ticks_us(), sentence_start)
+                    else:
+                        on_sentence(buf, pkt_start, i)
+
+                    if alloc_mark is not None:
+                        alloc_mark = gps_hal.mem_alloc()
+
+                pkt_start = i + 1
+
+            i += 1
+
+        # Move the unterminated tail in front of the read window
+        carry = last - pkt_start
+
+        if carry > self.carry_size:
+            self.overflow_count += 1
+            carry = 0
+
+        dst = base - carry
+        i = 0
+        while i < carry:
+            buf[dst + i] = buf[pkt_start + i]
+            i += 1
+
+        self.carry = carry
+
+        if alloc_mark is not None:
+            self.count_alloc(alloc_mark)
+
+        # Framing is the scan itself, the sentence handlers time themselves
+        if prof is not None:
+            prof.add(prof.FRAMING, gps_hal.ticks_diff(gps_hal.ticks_us(), scan_start) - sentence_us)
+
+        return self.last_len
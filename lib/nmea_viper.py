@@ -0,0 +1,68 @@
+"""
+Viper versions of the nmea.py byte loops
+
+Only importable where the viper emitter is available, nmea.py falls back
+to the pure Python versions otherwise. Results must match nmea.py exactly.
+"""
+import micropython
+
+@micropython.viper
+def checksum(buf, start: int, end: int) -> int:
+    p = ptr8(buf) # pylint: disable=E0602
+    chksum = 0
+    i = start
+
+    while i < end:
+        chksum ^= p[i]
+        i += 1
+
+    return chksum
+
+@micropython.viper
+def check_frame(buf, start: int, end: int) -> int:
+    p = ptr8(buf) # pylint: disable=E0602
+    i = start
+
+    if i < end and p[i] == 0x24:
+        i += 1
+
+    chksum = 0
+
+    while i < end:
+        ch = p[i]
+
+        if ch == 0x2A:
+            break
+
+        chksum ^= ch
+        i += 1
+
+    if i >= end:
+        return -1 # FRAME_NO_CHKSUM
+
+    star = i
+    pkt_chksum = 0
+    i += 1
+
+    if i == end or end - i > 2:
+        return -2 # FRAME_BAD
+
+    while i < end:
+        ch = p[i]
+
+        if ch >= 0x30 and ch <= 0x39:
+            ch -= 0x30
+        elif ch >= 0x41 and ch <= 0x46:
+            ch -= 0x37
+        elif ch >= 0x61 and ch <= 0x66:
+            ch -= 0x57
+        else:
+            return -2 # FRAME_BAD
+
+        pkt_chksum = (pkt_chksum << 4) | ch
+        i += 1
+
+    if pkt_chksum != chksum:
+        return -3 # FRAME_BAD_CHKSUM
+
+    return star
@@ -0,0 +1,103 @@
+import gps_hal
+
+class Poll_Scheduler:
+    """
+    Chooses the delay before the next L76 read
+
+    The L76 emits one burst of sentences per fix interval ($PMTK220). While
+    a burst is being drained (the bytes seen since the epoch started are
+    below what recent epochs produced) reads follow each other quickly, a
+    full read is drained immediately. Once the burst is in, the poller sleeps
+    until the next epoch is due. Before any epoch has been measured the burst
+    size is estimated from the sentences enabled with $PMTK314.
+    """
+
+    FULL_READ = 254
+    BYTES_PER_SENTENCE = 70
+
+    def __init__(self, fix_interval_ms=1000, min_delay_ms=10, burst_delay_ms=20, max_delay_ms=250, cmd_delay_ms=10):
+        self.fix_interval_ms = fix_interval_ms
+        self.min_delay_ms = min_delay_ms
+        self.burst_delay_ms = burst_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.cmd_delay_ms = cmd_delay_ms
+        self.epoch_start_ms = None
+        self.epoch_bytes = 0
+        self.expected_bytes = 12 * self.BYTES_PER_SENTENCE
+        self.measured = False
+        self.reads = 0
+        self.full_reads = 0
+        self.delay_ms = max_delay_ms
+        self.delay_ms_total = 0
+
+    def stats(self):
+        return {
+            "poll_interval_ms": self.delay_ms,
+            "poll_interval_avg_ms": self.delay_ms_total // self.reads if self.reads else 0,
+            "poll_overflow_rate": self.full_reads / self.reads if self.reads else 0.0,
+            "poll_epoch_bytes": self.expected_bytes,
+        }
+
+    def set_fix_interval(self, fix_interval_ms):
+        """ From $PMTK220,<ms> """
+        self.fix_interval_ms = fix_interval_ms
+
+    def set_output_rates(self, rates):
+        """ From $PMTK314, rates are the per-sentence output divisors (0 = off) """
+        if self.measured:
+            return
+
+        sentences = 0.0
+
+        for rate in rates:
+            if rate > 0:
+                sentences += 1.0 / rate
+
+        self.expected_bytes = int(sentences * self.BYTES_PER_SENTENCE)
+
+    def epoch_start(self):
+        """ Called when the first sentence of an epoch ($xxRMC) is seen """
+        now = gps_hal.ticks_ms()
+
+        if self.epoch_start_ms is not None:
+            # Several talkers ($GPRMC, $GNRMC) report the same epoch
+            if gps_hal.ticks_diff(now, self.epoch_start_ms) < self.fix_interval_ms // 2:
+                return
+
+            # Smooth the burst size over recent epochs
+            if self.measured:
+                self.expected_bytes = (self.expected_bytes * 3 + self.epoch_bytes) // 4
+            else:
+                self.expected_bytes = self.epoch_bytes
+                self.measured = True
+
+        self.epoch_start_ms = now
+        self.epoch_bytes = 0
+
+    def next_delay_ms(self, read_len, cmd_pending=False):
+        """ Account for a read of read_len bytes and return the delay before the next one """
+        self.reads += 1
+        self.epoch_bytes += read_len
+
+        if read_len >= self.FULL_READ:
+            self.full_reads += 1
+            delay = 0
+        elif self.epoch_start_ms is None:
+            delay = self.burst_delay_ms if read_len else self.max_delay_ms
+        else:
+            elapsed = gps_hal.ticks_diff(gps_hal.ticks_ms(), self.epoch_start_ms)
+
+            if read_len and self.epoch_bytes < self.expected_bytes and elapsed < self.fix_interval_ms:
+                delay = self.burst_delay_ms
+            else:
+                # Wait for the next epoch, wrapping if we are late
+                delay = self.fix_interval_ms - elapsed % self.fix_interval_ms
+                delay = max(self.min_delay_ms, min(delay, self.max_delay_ms))
+
+        if cmd_pending:
+            delay = min(delay, self.cmd_delay_ms)
+
+        self.delay_ms = delay
+        self.delay_ms_total += delay
+
+        return delay
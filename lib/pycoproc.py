@@ -80,7 +80,18 @@ class Pycoproc:
         self.sda = sda
         self.scl = scl
         self.clk_cal_factor = 1
+        self.rtc_calibrated = False
+        # Preallocated transfer buffers, register I/O must not allocate
         self.reg = bytearray(6)
+        self.cmd_buf = bytearray(1)
+        self.peek_buf = bytearray(3)
+        self.poke_buf = bytearray(4)
+        self.status_buf = bytearray(1)
+        self.read_buf1 = bytearray(2)
+        self.read_buf2 = bytearray(3)
+        self.adc_buf = bytearray(2)
+        self.sleep_buf = bytearray(3)
+        self.adc_pending = False
         self.wake_int = False
         self.wake_int_pin = False
         self.wake_int_pin_rising_edge = True
@@ -113,46 +124,84 @@ class Pycoproc:
         if wait:
             self._wait()
 
-    def _read(self, size):
-        return self.i2c.readfrom(I2C_SLAVE_ADDR, size + 1)[1:(size + 1)]
+    def _read_into(self, buf):
+        """ Read len(buf) - 1 bytes of reply into buf[1:], buf[0] is the status byte """
+        self.i2c.readfrom_into(I2C_SLAVE_ADDR, buf)
+        return buf
 
     def _wait(self):
         count = 0
         time.sleep_us(10)
-        while self.i2c.readfrom(I2C_SLAVE_ADDR, 1)[0] != 0xFF:
+        self.i2c.readfrom_into(I2C_SLAVE_ADDR, self.status_buf)
+        while self.status_buf[0] != 0xFF:
             time.sleep_us(100)
             count += 1
             if (count > 500):  # timeout after 50ms
                 raise Exception('Board timeout')
+            self.i2c.readfrom_into(I2C_SLAVE_ADDR, self.status_buf)
 
-    def _send_cmd(self, cmd):
-        self._write(bytes([cmd]))
+    def _send_cmd(self, cmd, wait=True):
+        self.cmd_buf[0] = cmd
+        self._write(self.cmd_buf, wait)
+
+    def _read_u16(self, cmd):
+        self._send_cmd(cmd)
+        d = self._read_into(self.read_buf2)
+        return (d[2] << 8) + d[1]
 
     def read_hw_version(self):
-        self._send_cmd(CMD_HW_VER)
-        d = self._read(2)
-        return (d[1] << 8) + d[0]
+        return self._read_u16(CMD_HW_VER)
 
     def read_fw_version(self):
-        self._send_cmd(CMD_FW_VER)
-        d = self._read(2)
-        return (d[1] << 8) + d[0]
+        return self._read_u16(CMD_FW_VER)
 
     def read_product_id(self):
-        self._send_cmd(CMD_PROD_ID)
-        d = self._read(2)
-        return (d[1] << 8) + d[0]
+        return self._read_u16(CMD_PROD_ID)
 
     def peek_memory(self, addr):
-        self._write(bytes([CMD_PEEK, addr & 0xFF, (addr >> 8) & 0xFF]))
-        return self._read(1)[0]
+        buf = self.peek_buf
+        buf[0] = CMD_PEEK
+        buf[1] = addr & 0xFF
+        buf[2] = (addr >> 8) & 0xFF
+        self._write(buf)
+        return self._read_into(self.read_buf1)[1]
+
+    def peek_memory_into(self, addrs, buf):
+        """ Read the registers at addrs into buf (len(buf) >= len(addrs)), returns buf """
+        idx = 0
+        count = len(addrs)
+        while idx < count:
+            buf[idx] = self.peek_memory(addrs[idx])
+            idx += 1
+        return buf
+
+    def peek_memory_range(self, addr, buf):
+        """ Read len(buf) consecutive registers starting at addr into buf, returns buf """
+        idx = 0
+        count = len(buf)
+        while idx < count:
+            buf[idx] = self.peek_memory(addr + idx)
+            idx += 1
+        return buf
 
     def poke_memory(self, addr, value):
-        self._write(bytes([CMD_POKE, addr & 0xFF, (addr >> 8) & 0xFF, value & 0xFF]))
+        buf = self.poke_buf
+        buf[0] = CMD_POKE
+        buf[1] = addr & 0xFF
+        buf[2] = (addr >> 8) & 0xFF
+        buf[3] = value & 0xFF
+        self._write(buf)
 
     def magic_write_read(self, addr, _and=0xFF, _or=0, _xor=0):
-        self._write(bytes([CMD_MAGIC, addr & 0xFF, (addr >> 8) & 0xFF, _and & 0xFF, _or & 0xFF, _xor & 0xFF]))
-        return self._read(1)[0]
+        reg = self.reg
+        reg[REG_CMD] = CMD_MAGIC
+        reg[REG_ADDRL] = addr & 0xFF
+        reg[REG_ADDRH] = (addr >> 8) & 0xFF
+        reg[REG_AND] = _and & 0xFF
+        reg[REG_OR] = _or & 0xFF
+        reg[REG_XOR] = _xor & 0xFF
+        self._write(reg)
+        return self._read_into(self.read_buf1)[1]
 
     def toggle_bits_in_memory(self, addr, bits):
         self.magic_write_read(addr, _xor=bits)
@@ -169,23 +218,24 @@ class Pycoproc:
 
     def get_sleep_remaining(self):
         """ returns the remaining time from sleep, as an interrupt (wakeup source) might have triggered """
-        c3 = self.peek_memory(WAKE_REASON_ADDR + 3)
-        c2 = self.peek_memory(WAKE_REASON_ADDR + 2)
-        c1 = self.peek_memory(WAKE_REASON_ADDR + 1)
-        time_device_s = (c3 << 16) + (c2 << 8) + c1
+        c = self.peek_memory_range(WAKE_REASON_ADDR + 1, self.sleep_buf)
+        time_device_s = (c[2] << 16) + (c[1] << 8) + c[0]
         # this time is from PIC internal oscilator, so it needs to be adjusted with the calibration value
-        try:
-            self.calibrate_rtc()
-        except Exception:
-            pass
+        # GPS_Poller calibrates in a bus idle slot, only block here if that has not happened yet
+        if not self.rtc_calibrated:
+            try:
+                self.calibrate_rtc()
+            except Exception:
+                pass
         time_s = int((time_device_s / self.clk_cal_factor) + 0.5) # 0.5 used for round
         return time_s
 
     def setup_sleep(self, time_s):
-        try:
-            self.calibrate_rtc()
-        except Exception:
-            pass
+        if not self.rtc_calibrated:
+            try:
+                self.calibrate_rtc()
+            except Exception:
+                pass
         time_s = int((time_s * self.clk_cal_factor) + 0.5)  # round to the nearest integer
         if time_s >= 2**(8*3):
             time_s = 2**(8*3)-1
@@ -222,7 +272,7 @@ class Pycoproc:
             self.mask_bits_in_memory(INTCON_ADDR, ~(1 << 1)) # clear INTF
             self.set_bits_in_memory(INTCON_ADDR, 1 << 4) # enable interrupt; set INTE)
 
-        self._write(bytes([CMD_GO_SLEEP]), wait=False)
+        self._send_cmd(CMD_GO_SLEEP, wait=False)
         # kill the run pin
         Pin('P3', mode=Pin.OUT, value=0)
 
@@ -231,7 +281,7 @@ class Pycoproc:
         # WDT has a frequency divider to generate 1 ms
         # and then there is a binary prescaler, e.g., 1, 2, 4 ... 512, 1024 ms
         # hence the need for the constant
-        self._write(bytes([CMD_CALIBRATE]), wait=False)
+        self._send_cmd(CMD_CALIBRATE, wait=False)
         self.i2c.deinit()
         Pin('P21', mode=Pin.IN)
         pulses = pycom.pulses_get('P21', 100)
@@ -249,17 +299,36 @@ class Pycoproc:
             self.clk_cal_factor = (EXP_RTC_PERIOD / period) * (1000 / 1024)
         if self.clk_cal_factor > 1.25 or self.clk_cal_factor < 0.75:
             self.clk_cal_factor = 1
+        self.rtc_calibrated = True
 
     def button_pressed(self):
         button = self.peek_memory(PORTA_ADDR) & (1 << 3)
         return not button
 
     def read_battery_voltage(self):
-        self.set_bits_in_memory(ADCON0_ADDR, _ADCON0_GO_nDONE_MASK)
+        self.adc_start()
         time.sleep_us(50)
-        while self.peek_memory(ADCON0_ADDR) & _ADCON0_GO_nDONE_MASK:
+        while not self.adc_ready():
             time.sleep_us(100)
-        adc_val = (self.peek_memory(ADRESH_ADDR) << 2) + (self.peek_memory(ADRESL_ADDR) >> 6)
+        return self.adc_collect()
+
+    def adc_start(self):
+        """ Start a battery ADC conversion without waiting for it """
+        self.set_bits_in_memory(ADCON0_ADDR, _ADCON0_GO_nDONE_MASK)
+        self.adc_pending = True
+
+    def adc_ready(self):
+        return not (self.peek_memory(ADCON0_ADDR) & _ADCON0_GO_nDONE_MASK)
+
+    def adc_collect(self):
+        """ Battery voltage of the conversion started by adc_start(), None if there is none or it is still running """
+        if not self.adc_pending or not self.adc_ready():
+            return None
+
+        self.adc_pending = False
+        # ADRESL and ADRESH are adjacent
+        d = self.peek_memory_range(ADRESL_ADDR, self.adc_buf)
+        adc_val = (d[1] << 2) + (d[0] >> 6)
         return (((adc_val * 3.3 * 280) / 1023) / 180) + 0.01    # add 10mV to compensate for the drop in the FET
 
     def setup_int_wake_up(self, rising, falling):
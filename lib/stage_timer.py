@@ -0,0 +1,139 @@
+"""
+Per-stage ticks_us timing histograms
+
+Instrumented code keeps a reference to the Stage_Timer (None when profiling
+is off, so the hot path only pays for an "is not None" test), reads
+ticks_us() around a stage and calls add(stage, us). Each stage has a fixed
+histogram of power of two buckets: bucket 0 counts 0 us, bucket b counts
+2^(b-1) .. 2^b - 1 us and the last bucket everything from 2^(BUCKETS-2) us
+up. Sentence parsers are timed per sentence type with add_parse(name, us).
+"""
+import array
+
+I2C_READ = 0
+FRAMING = 1
+CHECKSUM = 2
+CMD_SEND = 3
+LOG_STATE = 4
+JSON_DUMPS = 5
+SD_WRITE = 6
+GC_COLLECT = 7
+
+STAGE_NAMES = ["i2c_read", "framing", "checksum", "cmd_send", "log_state", "json_dumps", "sd_write", "gc_collect"]
+
+BUCKETS = 16
+
+class Stage_Timer:
+    # The stage ids again, so instrumented modules need not import this one unless profiling
+    I2C_READ = I2C_READ
+    FRAMING = FRAMING
+    CHECKSUM = CHECKSUM
+    CMD_SEND = CMD_SEND
+    LOG_STATE = LOG_STATE
+    JSON_DUMPS = JSON_DUMPS
+    SD_WRITE = SD_WRITE
+    GC_COLLECT = GC_COLLECT
+
+    def __init__(self):
+        self.names = list(STAGE_NAMES)
+        self.parse_stages = {}
+        self.counts = array.array("L")
+        self.totals = array.array("L")
+        self.maxes = array.array("L")
+        self.hist = array.array("L")
+
+        for _ in self.names:
+            self.add_stage()
+
+    def add_stage(self):
+        self.counts.append(0)
+        self.totals.append(0)
+        self.maxes.append(0)
+        self.hist.extend([0] * BUCKETS)
+
+    def add(self, stage, us):
+        if us < 0:
+            us = 0
+
+        self.counts[stage] += 1
+        self.totals[stage] += us
+
+        if us > self.maxes[stage]:
+            self.maxes[stage] = us
+
+        bucket = 0
+        while us and bucket < BUCKETS - 1:
+            us >>= 1
+            bucket += 1
+
+        self.hist[stage * BUCKETS + bucket] += 1
+
+    def add_parse(self, name, us):
+        stage = self.parse_stages.get(name)
+
+        if stage is None:
+            stage = self.parse_stages[name] = len(self.names)
+            self.names.append("parse_" + name)
+            self.add_stage()
+
+        self.add(stage, us)
+
+    def percentile(self, stage, fraction):
+        """ Upper bound in us of the bucket holding the fraction-th sample, at most the max seen """
+        target = self.counts[stage] * fraction
+        seen = 0
+        bucket = 0
+
+        while bucket < BUCKETS:
+            seen += self.hist[stage * BUCKETS + bucket]
+
+            if seen >= target and bucket < BUCKETS - 1:
+                return min((1 << bucket) - 1, self.maxes[stage])
+
+            bucket += 1
+
+        return self.maxes[stage]
+
+    def summary(self, reset=True):
+        """ {stage: {n, avg, p50, p99, max, hist}} of the stages that ran, hist trimmed after the last non-empty bucket """
+        out = {}
+        stage = 0
+
+        while stage < len(self.names):
+            count = self.counts[stage]
+
+            if count:
+                base = stage * BUCKETS
+                last = BUCKETS
+
+                while last > 0 and not self.hist[base + last - 1]:
+                    last -= 1
+
+                out[self.names[stage]] = {
+                    "n": count,
+                    "avg": self.totals[stage] // count,
+                    "p50": self.percentile(stage, 0.5),
+                    "p99": self.percentile(stage, 0.99),
+                    "max": self.maxes[stage],
+                    "hist": list(self.hist[base:base + last]),
+                }
+
+            stage += 1
+
+        if reset:
+            self.reset()
+
+        return out
+
+    def reset(self):
+        idx = 0
+        while idx < len(self.counts):
+            self.counts[idx] = 0
+            self.totals[idx] = 0
+            self.maxes[idx] = 0
+            idx += 1
+
+        idx = 0
+        while idx < len(self.hist):
+            self.hist[idx] = 0
+            idx += 1
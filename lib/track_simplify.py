@@ -0,0 +1,123 @@
+import array
+import math
+
+class Track_Simplifier:
+    """
+    Streaming line simplification of the fix track
+
+    The last emitted point is the anchor. Each new fix becomes the candidate
+    end of the segment from the anchor, as long as every fix in between is
+    within max_error meters of that segment it replaces them. When a fix in
+    between is off by more, the previous fix is emitted and becomes the new
+    anchor. At most window fixes are held (a bounded window Douglas-Peucker),
+    a full window emits its last fix so stationary or straight line periods
+    still get a point every window fixes. Distances use an equirectangular
+    projection around the anchor, fine for the few hundred meters a window
+    covers.
+
+    Emitted points are (seconds of day UTC, lat, lon) tuples collected until
+    take_points(), at most max_pending of them.
+    """
+
+    METERS_PER_DEGREE = 6371000.0 * math.pi / 180.0
+
+    def __init__(self, max_error=5.0, window=60, max_pending=64):
+        self.max_error = max_error
+        self.window = window
+        self.max_pending = max_pending
+        self.lat = array.array("d", [0.0] * window)
+        self.lon = array.array("d", [0.0] * window)
+        self.tod = array.array("d", [0.0] * window)
+        self.count = 0
+        self.anchor = None
+        self.points = []
+        self.points_in = 0
+        self.points_out = 0
+        self.dropped = 0
+
+    def stats(self):
+        return {
+            "track_in": self.points_in,
+            "track_out": self.points_out,
+            "track_dropped": self.dropped,
+        }
+
+    def add(self, tod, lat, lon):
+        self.points_in += 1
+
+        if self.anchor is None:
+            self.emit(tod, lat, lon)
+            return
+
+        if self.count and not self.within(lat, lon):
+            last = self.count - 1
+            self.emit(self.tod[last], self.lat[last], self.lon[last])
+
+        if self.count == self.window:
+            self.emit(tod, lat, lon)
+            return
+
+        self.lat[self.count] = lat
+        self.lon[self.count] = lon
+        self.tod[self.count] = tod
+        self.count += 1
+
+    def flush(self):
+        """ Emit the held end of the current segment, eg. when the fix is lost """
+        if self.count:
+            last = self.count - 1
+            self.emit(self.tod[last], self.lat[last], self.lon[last])
+
+        self.anchor = None
+
+    def take_points(self):
+        points = self.points
+        self.points = []
+        return points
+
+    def emit(self, tod, lat, lon):
+        self.anchor = (tod, lat, lon)
+        self.count = 0
+        self.points_out += 1
+
+        if len(self.points) >= self.max_pending:
+            self.points.pop(0)
+            self.dropped += 1
+
+        self.points.append(self.anchor)
+
+    def within(self, lat, lon):
+        """ True when all held fixes are within max_error of the anchor -> (lat, lon) segment """
+        a_lat = self.anchor[1]
+        a_lon = self.anchor[2]
+        scale_y = self.METERS_PER_DEGREE
+        scale_x = scale_y * math.cos(math.radians(a_lat))
+
+        end_x = (lon - a_lon) * scale_x
+        end_y = (lat - a_lat) * scale_y
+        seg_len2 = end_x * end_x + end_y * end_y
+        max_err2 = self.max_error * self.max_error
+        idx = 0
+
+        while idx < self.count:
+            px = (self.lon[idx] - a_lon) * scale_x
+            py = (self.lat[idx] - a_lat) * scale_y
+
+            # Distance to the closest point of the segment
+            if seg_len2 > 0.0:
+                t = (px * end_x + py * end_y) / seg_len2
+
+                if t < 0.0:
+                    t = 0.0
+                elif t > 1.0:
+                    t = 1.0
+
+                px -= t * end_x
+                py -= t * end_y
+
+            if px * px + py * py > max_err2:
+                return False
+
+            idx += 1
+
+        return True
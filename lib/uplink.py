@@ -0,0 +1,559 @@
+"""
+Batched telemetry uplink with store-and-forward
+
+Every logged fix is packed as a gps_binlog record into a preallocated batch
+buffer. A batch is sealed when it holds batch_records fixes or its oldest
+fix is batch_interval seconds old, deflated where the port can compress
+(when that makes it smaller) and framed as
+
+    magic "GPSU", version, flags, record size, record count, sequence
+    (little endian "<4sBBHHI") followed by the records
+
+Sealed batches are sent from the poller's idle slots, at most one per slot
+and min_gap seconds apart, while backend.network_up(). Batches that cannot
+go out are spooled one file per batch to spool_dir and drained oldest first
+once the network is back. A failed send closes the connection and backs off
+exponentially from retry_interval up to retry_max seconds. The spool is
+bounded by spool_max_bytes, or by spool_ram_bytes (a few batches) when it
+has to live in RAM without an SD card, the oldest batches are dropped
+beyond that. close() spools the batch to send and saves the fixes of an
+unfinished batch to spool_dir/partial.bin, loaded again on the next start,
+so duty cycles still fill whole batches. The last sequence number is kept
+in spool_dir/seq so the receiver sees no restart even with an empty spool.
+
+Transports are created from a URL:
+    udp://host:port             one datagram per batch
+    mqtt://host:port/topic      MQTT 3.1.1 QoS 0 PUBLISH per batch
+
+They run in the poller's idle slots. The host is resolved once with
+resolve() and kept, GPS_Poller.setup() does it ahead of the read loop when
+the network is already up. A failed lookup backs off by retry_max instead
+of retry_interval since getaddrinfo() cannot be given a timeout. Sockets get
+their short timeout before connect() or sendto().
+
+tools/gpslog/uplink.py is a stand-in receiver for both and decodes batches.
+"""
+import os
+import struct
+import gps_hal
+import gps_binlog
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+MAGIC = b"GPSU"
+VERSION = 1
+HEADER_FORMAT = "<4sBBHHI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+FLAG_DEFLATE = 0x01
+
+SPOOL_SUFFIX = ".upl"
+PARTIAL_FILE = "partial.bin"
+SEQ_FILE = "seq"
+
+def send_all(sock, data):
+    """ sock.send() until all of data is written, send() may take only part of it """
+    view = memoryview(data)
+    sent = 0
+
+    while sent < len(view):
+        nbytes = sock.send(view[sent:])
+
+        if not nbytes:
+            raise OSError("Connection closed")
+
+        sent += nbytes
+
+def recv_exactly(sock, nbytes):
+    data = b""
+
+    while len(data) < nbytes:
+        part = sock.recv(nbytes - len(data))
+
+        if not part:
+            raise OSError("Connection closed after %d of %d bytes" % (len(data), nbytes))
+
+        data += part
+
+    return data
+
+class UDP_Transport:
+    def __init__(self, host, port, timeout=0.2):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.addr = None
+
+    def resolve(self):
+        if self.addr is None:
+            self.addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+
+        return self.addr
+
+    def send(self, payload):
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.settimeout(self.timeout)
+
+        self.sock.sendto(payload, self.resolve())
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+class MQTT_Transport:
+    """ Just enough MQTT 3.1.1 to CONNECT and PUBLISH at QoS 0, keepalive off """
+
+    def __init__(self, host, port, topic, client_id="pytrack", timeout=0.5):
+        self.host = host
+        self.port = port
+        self.topic = topic.encode("utf-8")
+        self.client_id = client_id.encode("utf-8")
+        self.timeout = timeout
+        self.sock = None
+        self.addr = None
+
+    @staticmethod
+    def remaining_length(length):
+        out = bytearray()
+
+        while True:
+            byte = length & 0x7F
+            length >>= 7
+            out.append(byte | 0x80 if length else byte)
+
+            if not length:
+                return out
+
+    def resolve(self):
+        if self.addr is None:
+            self.addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+
+        return self.addr
+
+    def connect(self):
+        addr = self.resolve()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+
+        try:
+            sock.connect(addr)
+            body = b"\x00\x04MQTT\x04\x02\x00\x00" + struct.pack(">H", len(self.client_id)) + self.client_id
+            send_all(sock, b"\x10" + self.remaining_length(len(body)) + body)
+            connack = recv_exactly(sock, 4)
+
+            if connack[0] != 0x20 or connack[3] != 0:
+                raise OSError("MQTT connect refused: %r" % connack)
+        except Exception:
+            sock.close()
+            raise
+
+        self.sock = sock
+
+    def send(self, payload):
+        if self.sock is None:
+            self.connect()
+
+        header = struct.pack(">H", len(self.topic)) + self.topic
+        send_all(self.sock, b"\x30" + self.remaining_length(len(header) + len(payload)) + header)
+        send_all(self.sock, payload)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.send(b"\xe0\x00")
+            except OSError:
+                pass
+
+            self.sock.close()
+            self.sock = None
+
+def transport_from_url(url):
+    """ udp://host:port or mqtt://host[:port]/topic, raises ValueError for a bad URL """
+    scheme, _, rest = url.partition("://")
+    hostport, _, topic = rest.partition("/")
+    host, _, port = hostport.partition(":")
+
+    if scheme not in ("udp", "mqtt"):
+        raise ValueError("Unsupported uplink URL: %s" % url)
+
+    if not host:
+        raise ValueError("Uplink URL has no host: %s" % url)
+
+    if scheme == "udp" and not port:
+        raise ValueError("Uplink URL needs a port, eg. udp://host:9999: %s" % url)
+
+    try:
+        port = int(port) if port else 1883
+    except ValueError:
+        raise ValueError("Bad port in uplink URL: %s" % url)
+
+    if scheme == "udp":
+        return UDP_Transport(host, port)
+
+    return MQTT_Transport(host, port, topic or "pytrack")
+
+class Spool:
+    """ Queue of sealed batches, one file per batch named by sequence number, in RAM without a directory """
+
+    def __init__(self, path=None, max_bytes=262144, ram_bytes=8192):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ram_bytes = ram_bytes
+        self.seqs = []
+        self.sizes = {}
+        self.mem = {}
+        self.bytes = 0
+        self.dropped = 0
+        self.dropped_records = 0
+
+        if path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            os.mkdir(self.path)
+        except OSError:
+            pass
+
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            # No SD card after all
+            self.path = None
+            return
+
+        for name in names:
+            if not name.endswith(SPOOL_SUFFIX):
+                continue
+
+            try:
+                seq = int(name[:-len(SPOOL_SUFFIX)])
+                size = os.stat(self.filename(seq))[6]
+            except (ValueError, OSError):
+                continue
+
+            self.seqs.append(seq)
+            self.sizes[seq] = size
+            self.bytes += size
+
+        self.seqs.sort()
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def filename(self, seq):
+        return "%s/%08d%s" % (self.path, seq, SPOOL_SUFFIX)
+
+    def last_seq(self):
+        """ Highest sequence number spooled or recorded by save_seq(), 0 if none """
+        seq = self.seqs[-1] if self.seqs else 0
+
+        if self.path is not None:
+            try:
+                with open(self.path + "/" + SEQ_FILE, "r") as fh:
+                    seq = max(seq, int(fh.read()))
+            except (OSError, ValueError):
+                pass
+
+        return seq
+
+    def save_seq(self, seq):
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path + "/" + SEQ_FILE, "w") as fh:
+                fh.write(str(seq))
+        except OSError:
+            pass
+
+    def limit(self):
+        return self.max_bytes if self.path is not None else self.ram_bytes
+
+    def push(self, seq, payload):
+        if self.path is None:
+            self.mem[seq] = bytes(payload)
+        else:
+            try:
+                with open(self.filename(seq), "wb") as fh:
+                    fh.write(payload)
+            except OSError:
+                # SD card full or gone, the batch is lost
+                self.dropped += 1
+                self.dropped_records += batch_records(payload)
+                return
+
+        self.seqs.append(seq)
+        self.seqs.sort()
+        self.sizes[seq] = len(payload)
+        self.bytes += len(payload)
+
+        while self.bytes > self.limit() and len(self.seqs) > 1:
+            self.dropped += 1
+            self.dropped_records += batch_records(self.peek())
+            self.pop()
+
+    def peek(self):
+        """ Payload of the oldest batch, None if empty """
+        if not self.seqs:
+            return None
+
+        seq = self.seqs[0]
+
+        if self.path is None:
+            return self.mem[seq]
+
+        with open(self.filename(seq), "rb") as fh:
+            return fh.read()
+
+    def pop(self):
+        seq = self.seqs.pop(0)
+        self.bytes -= self.sizes.pop(seq)
+
+        if self.path is None:
+            del self.mem[seq]
+        else:
+            try:
+                os.remove(self.filename(seq))
+            except OSError:
+                pass
+
+def batch_records(payload):
+    """ Number of fixes in a sealed batch """
+    return struct.unpack_from(HEADER_FORMAT, payload, 0)[4] if payload else 0
+
+class Uplink:
+    def __init__(self, transport, network_up, errlog, spool_dir=None, batch_records=20, batch_interval=300,
+                 spool_max_bytes=262144, spool_ram_bytes=8192, min_gap=0.2, retry_interval=5, retry_max=300, compress=True):
+        self.transport = transport
+        self.network_up = network_up
+        self.errlog = errlog
+        self.batch_records = batch_records
+        self.batch_interval_ms = int(batch_interval * 1000)
+        self.min_gap_ms = int(min_gap * 1000)
+        self.retry_interval_ms = int(retry_interval * 1000)
+        self.retry_max_ms = int(retry_max * 1000)
+        self.compress = compress
+        self.encoder = gps_binlog.Binlog_Encoder()
+        self.batch = bytearray(HEADER_SIZE + batch_records * gps_binlog.RECORD_SIZE)
+        self.batch_len = 0
+        self.batch_start = None
+        self.spool = Spool(spool_dir, spool_max_bytes, spool_ram_bytes)
+        self.seq = self.spool.last_seq()
+        self.ready = None
+        self.next_try = None
+        self.backoff_ms = 0
+        self.drain_start = None
+        self.drain_bytes = 0
+        self.fixes = 0
+        self.batches = 0
+        self.raw_bytes = 0
+        self.sealed_bytes = 0
+        self.sent = 0
+        self.sent_records = 0
+        self.sent_bytes = 0
+        self.errors = 0
+        self.drain_bps = None
+        self.partial_saved = False
+        self.load_partial()
+
+    def stats(self):
+        return {
+            "uplink_fixes": self.fixes,
+            "uplink_batches": self.batches,
+            "uplink_sent": self.sent,
+            "uplink_sent_bytes": self.sent_bytes,
+            "uplink_bytes_per_fix": round(self.sent_bytes / self.sent_records, 1) if self.sent_records else None,
+            "uplink_compression": round(self.sealed_bytes / self.raw_bytes, 3) if self.raw_bytes else None,
+            "uplink_errors": self.errors,
+            "uplink_spooled": len(self.spool),
+            "uplink_spool_bytes": self.spool.bytes,
+            "uplink_dropped": self.spool.dropped_records,
+            "uplink_drain_bps": self.drain_bps,
+        }
+
+    def add(self, tm, fix, battery, battery_ok, count, mem_free):
+        """ Queue a fix, see gps_binlog.Binlog_Encoder.encode() """
+        if self.batch_len == 0:
+            self.batch_start = gps_hal.ticks_ms()
+
+        record = self.encoder.encode(tm, fix, battery, battery_ok, count, mem_free)
+        offset = HEADER_SIZE + self.batch_len * gps_binlog.RECORD_SIZE
+        self.batch[offset:offset + gps_binlog.RECORD_SIZE] = record
+        self.batch_len += 1
+        self.fixes += 1
+
+        if self.batch_len >= self.batch_records:
+            self.seal()
+
+    def seal(self):
+        """ Frame the current batch and queue it for sending """
+        if self.batch_len == 0:
+            return
+
+        self.seq += 1
+        self.spool.save_seq(self.seq)
+        records_len = self.batch_len * gps_binlog.RECORD_SIZE
+        records = memoryview(self.batch)[HEADER_SIZE:HEADER_SIZE + records_len]
+        flags = 0
+        packed = gps_hal.compress(records) if self.compress else None
+
+        if packed is not None and len(packed) < records_len:
+            flags |= FLAG_DEFLATE
+            payload = struct.pack(HEADER_FORMAT, MAGIC, VERSION, flags, gps_binlog.RECORD_SIZE, self.batch_len, self.seq) + packed
+        else:
+            struct.pack_into(HEADER_FORMAT, self.batch, 0, MAGIC, VERSION, flags, gps_binlog.RECORD_SIZE, self.batch_len, self.seq)
+            payload = bytes(memoryview(self.batch)[:HEADER_SIZE + records_len])
+
+        # Still running after close(), the saved fixes are in this batch
+        if self.partial_saved:
+            self.partial_saved = False
+
+            try:
+                os.remove(self.partial_filename())
+            except OSError:
+                pass
+
+        self.batches += 1
+        self.raw_bytes += HEADER_SIZE + records_len
+        self.sealed_bytes += len(payload)
+        self.batch_len = 0
+
+        # Keep the newest batch in RAM while the link keeps up, spool the rest
+        if self.ready is None and not len(self.spool):
+            self.ready = (self.seq, payload)
+        else:
+            self.spool.push(self.seq, payload)
+
+    def poll(self):
+        """ Idle slot work: seal an old batch and send at most one batch """
+        now = gps_hal.ticks_ms()
+
+        if self.batch_len and gps_hal.ticks_diff(now, self.batch_start) >= self.batch_interval_ms:
+            self.seal()
+
+        if self.ready is None and not len(self.spool):
+            return
+
+        if self.next_try is not None and gps_hal.ticks_diff(now, self.next_try) < 0:
+            return
+
+        if not self.network_up():
+            self.spool_ready()
+            self.next_try = gps_hal.ticks_add(now, self.retry_interval_ms)
+            return
+
+        if not self.resolve():
+            self.spool_ready()
+            self.next_try = gps_hal.ticks_add(now, self.retry_max_ms)
+            return
+
+        if self.ready is not None:
+            payload = self.ready[1]
+        else:
+            payload = self.spool.peek()
+
+        try:
+            self.transport.send(payload)
+        except Exception as e:
+            self.errors += 1
+            self.transport.close()
+            self.spool_ready()
+            self.backoff_ms = min(self.backoff_ms * 2 if self.backoff_ms else self.retry_interval_ms, self.retry_max_ms)
+            self.next_try = gps_hal.ticks_add(now, self.backoff_ms)
+            self.drain_start = None
+            self.errlog("uplink_send", "Sending batch failed: {}", e)
+            return
+
+        self.backoff_ms = 0
+        self.next_try = gps_hal.ticks_add(gps_hal.ticks_ms(), self.min_gap_ms)
+        self.sent += 1
+        self.sent_records += batch_records(payload)
+        self.sent_bytes += len(payload)
+
+        if self.ready is not None:
+            self.ready = None
+            return
+
+        self.spool.pop()
+
+        # Drain throughput from the first spooled batch sent to the spool running empty
+        if self.drain_start is None:
+            self.drain_start = now
+            self.drain_bytes = 0
+
+        self.drain_bytes += len(payload)
+
+        if not len(self.spool):
+            elapsed = gps_hal.ticks_diff(gps_hal.ticks_ms(), self.drain_start)
+            self.drain_bps = int(self.drain_bytes * 1000 // elapsed) if elapsed > 0 else None
+            self.drain_start = None
+
+    def resolve(self):
+        """ Look up the host, the transport keeps it. False (and counted as an error) if the lookup failed """
+        try:
+            self.transport.resolve()
+        except Exception as e:
+            self.errors += 1
+            self.errlog("uplink_resolve", "Resolving {} failed: {}", self.transport.host, e)
+            return False
+
+        return True
+
+    def spool_ready(self):
+        if self.ready is not None:
+            self.spool.push(self.ready[0], self.ready[1])
+            self.ready = None
+
+    def partial_filename(self):
+        return self.spool.path + "/" + PARTIAL_FILE if self.spool.path is not None else None
+
+    def load_partial(self):
+        filename = self.partial_filename()
+
+        if filename is None:
+            return
+
+        try:
+            with open(filename, "rb") as fh:
+                data = fh.read()
+
+            os.remove(filename)
+        except OSError:
+            return
+
+        count = min(len(data) // gps_binlog.RECORD_SIZE, self.batch_records)
+
+        if count:
+            self.batch[HEADER_SIZE:HEADER_SIZE + count * gps_binlog.RECORD_SIZE] = data[:count * gps_binlog.RECORD_SIZE]
+            self.batch_len = count
+            self.batch_start = gps_hal.ticks_ms()
+
+    def save_partial(self):
+        filename = self.partial_filename()
+
+        if not self.batch_len or filename is None:
+            return False
+
+        try:
+            with open(filename, "wb") as fh:
+                fh.write(memoryview(self.batch)[HEADER_SIZE:HEADER_SIZE + self.batch_len * gps_binlog.RECORD_SIZE])
+        except OSError:
+            return False
+
+        self.partial_saved = True
+        return True
+
+    def close(self):
+        """ Spool the batch waiting to be sent, an unfinished batch is saved for the next start instead of sealed """
+        if not self.save_partial():
+            self.seal()
+
+        self.spool_ready()
+        self.transport.close()
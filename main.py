@@ -1,5 +1,6 @@
+import config
 from gps_poller import GPS_Poller
 
 print("** Starting poller **")
-GPS_Poller().run()
+GPS_Poller(uplink_url=getattr(config, "UPLINK_URL", None)).run(fast_start=getattr(config, "FAST_BOOT", False))
 print("** Poller stopped **")
@@ -0,0 +1,12 @@
+"""
+The poller runs on CPython against the simulated backend, lib/ and tools/
+are put on sys.path the way they are on the board and for the host tools.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in (os.path.join(ROOT, "lib"), os.path.join(ROOT, "tools")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,42 @@
+"""
+Shared helpers for the tests that drive GPS_Poller against the simulated backend
+"""
+import glob
+import json
+import os
+
+import gps_hal
+import gps_poller
+import nmea
+
+def framed(msg):
+    data = msg.encode("ascii")
+    return "%s*%02X" % (msg, nmea.checksum(data, 1, len(data)))
+
+def make_poller(sd_root, lines=None, **kwargs):
+    l76 = gps_hal.Sim_L76(lines, speed=20)
+    return l76, gps_poller.GPS_Poller(backend=gps_hal.Sim_Backend(l76, sd_root=sd_root), **kwargs)
+
+def run_until(poller, monkeypatch, done, max_sleeps=2000):
+    """ GPS_Poller.run() until done() holds, stopped through the sleep between reads """
+    real_sleep = gps_hal.sleep_ms
+    sleeps = [0]
+
+    def sleep_ms(ms):
+        sleeps[0] += 1
+
+        if done() or sleeps[0] >= max_sleeps:
+            raise KeyboardInterrupt()
+
+        real_sleep(min(ms, 10))
+
+    monkeypatch.setattr(gps_hal, "sleep_ms", sleep_ms)
+    poller.run(log_interval=0)
+    assert sleeps[0] < max_sleeps
+
+def read_log(sd_root):
+    filenames = glob.glob(os.path.join(sd_root, "gps-log-*.json"))
+    assert len(filenames) == 1
+
+    with open(filenames[0]) as fh:
+        return [json.loads(line) for line in fh]
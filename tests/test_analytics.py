@@ -0,0 +1,61 @@
+import glob
+import json
+import os
+
+import pytest
+
+from gpslog import analytics
+
+from sim_helpers import framed, make_poller, run_until
+
+def write_raw_log(sd_root, monkeypatch):
+    """ Simulator keep_raw log rewritten without the parsed "fix", like logs of older pollers """
+    _, poller = make_poller(sd_root, keep_raw=True)
+    run_until(poller, monkeypatch, lambda: poller.fix.valid and poller.gps_log.log_tag and poller.read_count > 40)
+
+    log_fn = glob.glob(os.path.join(sd_root, "gps-log-*.json"))[0]
+    raw_fn = log_fn.replace(".json", "-raw.json")
+
+    with open(log_fn) as fh, open(raw_fn, "w") as out:
+        for line in fh:
+            entry = json.loads(line)
+            del entry["fix"]
+            out.write(json.dumps(entry) + "\n")
+
+    return log_fn, raw_fn
+
+def test_stale_raw_sentences_without_fix_are_ignored():
+    state = {
+        "have_fix": False,
+        "$GNRMC-A": framed("$GNRMC,100057.000,A,3446.4447,N,11145.9536,W,9.45,137.90,130318,,,A"),
+    }
+    row = analytics.entry_row({"state": state})
+
+    assert row.get("lat") is None
+
+    state["have_fix"] = True
+    row = analytics.entry_row({"state": state})
+
+    assert abs(row["lat"] - 34.774078) < 1e-5
+    assert abs(row["lon"] + 111.765893) < 1e-5
+
+def test_load_save_summary(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    log_fn, raw_fn = write_raw_log(str(tmp_path), monkeypatch)
+
+    arrays = analytics.load([log_fn, raw_fn], processes=1)
+    parsed = arrays["file_index"] == 0
+    raw = arrays["file_index"] == 1
+
+    assert parsed.sum() == raw.sum() > 0
+    assert np.isfinite(arrays["lat"][parsed]).any()
+    np.testing.assert_allclose(arrays["lat"][raw], arrays["lat"][parsed], equal_nan=True)
+    np.testing.assert_allclose(arrays["lon"][raw], arrays["lon"][parsed], equal_nan=True)
+
+    npz = str(tmp_path / "fleet.npz")
+    analytics.save(npz, arrays)
+    reloaded = analytics.reload(npz)
+
+    assert sorted(reloaded) == sorted(arrays)
+    np.testing.assert_array_equal(reloaded["lat"], arrays["lat"])
+    assert "entries from 2 files" in analytics.summary(reloaded)
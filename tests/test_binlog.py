@@ -0,0 +1,48 @@
+import io
+import os
+
+import gps_binlog
+import gps_fix
+from gpslog import binlog
+
+from sim_helpers import make_poller
+
+TM = (2018, 3, 13, 10, 0, 57)
+
+def record(count):
+    fix = gps_fix.GPS_Fix()
+    return bytes(gps_binlog.Binlog_Encoder().encode(TM, fix, 4.1, True, count, 50000))
+
+def decode(data):
+    stats = {}
+    counts = [rec["count"] for rec in binlog.iter_records(io.BytesIO(data), stats)]
+    return counts, stats
+
+def test_decoder_resyncs_after_partial_record():
+    data = gps_binlog.header() + record(0) + record(1)[:20] + record(2) + record(3)
+    counts, stats = decode(data)
+
+    assert counts == [0, 2, 3]
+    assert stats["crc_errors"] == 1
+
+def test_open_log_pads_partial_record(tmp_path):
+    sd_root = str(tmp_path)
+    _, poller = make_poller(sd_root, log_format="bin")
+    poller.start_polling()
+    log_fn = os.path.join(sd_root, "gps-log-2018031310.bin")
+
+    with open(log_fn, "wb") as fh:
+        fh.write(gps_binlog.header() + record(0) + record(1)[:20])
+
+    assert poller.gps_log.open_log(TM)
+    poller.gps_log.writer.write(record(2))
+    poller.gps_log.writer.close()
+
+    assert (os.path.getsize(log_fn) - gps_binlog.HEADER_SIZE) % gps_binlog.RECORD_SIZE == 0
+
+    with open(log_fn, "rb") as fh:
+        counts, stats = decode(fh.read())
+
+    assert counts == [0, 2]
+    assert stats["crc_errors"] == 1
+    assert stats["resync_bytes"] == gps_binlog.RECORD_SIZE
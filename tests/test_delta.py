@@ -0,0 +1,45 @@
+import glob
+import io
+import json
+import os
+
+import gps_delta
+from gpslog import delta
+
+from sim_helpers import make_poller, run_until
+
+ENTRIES = [
+    {"count": 1, "fix": {"valid": False, "lat": None}, "state": {"read_count": 10, "last_chkerr": "x"}},
+    {"count": 2, "fix": {"valid": True, "lat": 34.77}, "state": {"read_count": 20, "last_chkerr": "x"}},
+    {"count": 3, "fix": {"valid": True, "lat": 34.78}, "state": {"read_count": 30}, "geofence": [["enter", "home", 57]]},
+    {"count": 4, "fix": None, "state": {"read_count": 40, "mem_low": True}},
+    {"count": 5, "fix": {"valid": True, "lat": 34.79}, "state": {"read_count": 40, "mem_low": True}},
+    {"count": 6, "fix": {"valid": True, "lat": 34.79}, "state": {"read_count": 50, "mem_low": True}},
+]
+
+def test_round_trip():
+    encoder = gps_delta.Delta_Encoder(keyframe_interval=3)
+    lines = "".join([json.dumps(encoder.encode(entry)) + "\n" for entry in ENTRIES])
+
+    assert list(delta.iter_snapshots(io.StringIO(lines))) == ENTRIES
+    assert lines.count(gps_delta.KEYFRAME) == 2
+
+def test_reader_waits_for_keyframe():
+    reader = gps_delta.Delta_Reader()
+
+    assert reader.apply({"count": 2}) is None
+    assert reader.apply({"count": 3, gps_delta.KEYFRAME: True}) == {"count": 3}
+
+def test_run_loop_delta_log(tmp_path, monkeypatch):
+    sd_root = str(tmp_path)
+    _, poller = make_poller(sd_root, log_format="delta")
+
+    run_until(poller, monkeypatch, lambda: poller.fix.valid and poller.gps_log.delta.since_keyframe > 3)
+
+    filenames = glob.glob(os.path.join(sd_root, "gps-log-*.delta"))
+    snapshots = list(delta.iter_files(filenames))
+
+    assert len(snapshots) > 4
+    assert [snapshot["count"] for snapshot in snapshots] == list(range(snapshots[0]["count"], snapshots[0]["count"] + len(snapshots)))
+    assert snapshots[-1]["fix"]["valid"]
+    assert abs(snapshots[-1]["fix"]["lat"] - 34.774078) < 1e-5
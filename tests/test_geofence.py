@@ -0,0 +1,24 @@
+import geofence
+
+def test_bad_lines_are_skipped_and_counted(tmp_path):
+    fence_file = tmp_path / "fences.txt"
+    fence_file.write_text(
+        "# name,lat,lon,...\n"
+        "\n"
+        "home,34.77,-111.77,34.78,-111.77,34.78,-111.76,34.77,-111.76\n"
+        "typo,34.77,-111.77,34.78,oops,34.78,-111.76\n"
+        "line,34.77,-111.77,34.78,-111.77\n"
+        "odd,34.77,-111.77,34.78,-111.77,34.78\n"
+        "work,34.80,-111.80,34.81,-111.80,34.81,-111.79\n"
+    )
+
+    index = geofence.load(str(fence_file))
+
+    assert index.names == ["home", "work"]
+    assert index.stats()["geofence_bad_lines"] == 3
+
+    index.check(34.775, -111.765, "100057")
+    assert index.take_events() == [("enter", "home", "100057")]
+
+def test_missing_file():
+    assert geofence.load("/nonexistent/fences.txt") is None
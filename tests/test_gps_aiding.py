@@ -0,0 +1,44 @@
+import json
+
+import gps_aiding
+import gps_fix
+import gps_hal
+
+def make_fix(lat, lon):
+    fix = gps_fix.GPS_Fix()
+    fix.valid = True
+    fix.lat = lat
+    fix.lon = lon
+    return fix
+
+def test_parked_fix_is_not_rewritten(tmp_path, monkeypatch):
+    filename = str(tmp_path / "last_fix.json")
+    now = [0]
+    monkeypatch.setattr(gps_hal, "ticks_ms", lambda: now[0])
+    aiding = gps_aiding.GPS_Aiding(filename, save_interval=300, min_move_m=100)
+
+    assert aiding.save(make_fix(34.774078, -111.765893))
+
+    # Due again, but only a few meters away
+    now[0] += 300000
+    assert not aiding.save(make_fix(34.774100, -111.765900))
+    assert aiding.skipped == 1
+
+    # Moved about 150 m
+    now[0] += 300000
+    assert aiding.save(make_fix(34.775428, -111.765893))
+
+    # A forced save before sleeping always goes out
+    assert aiding.save(make_fix(34.775428, -111.765893), resume_in=300, force=True)
+
+    with open(filename) as fh:
+        assert json.load(fh)["lat"] == 34.775428
+
+def test_saved_position_survives_restart(tmp_path):
+    filename = str(tmp_path / "last_fix.json")
+    gps_aiding.GPS_Aiding(filename).save(make_fix(34.774078, -111.765893))
+
+    aiding = gps_aiding.GPS_Aiding(filename, save_interval=0)
+
+    assert not aiding.save(make_fix(34.774078, -111.765893))
+    assert aiding.save(make_fix(34.784078, -111.765893))
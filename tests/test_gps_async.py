@@ -0,0 +1,33 @@
+import asyncio
+
+import gps_async
+
+from sim_helpers import make_poller
+
+class Done(Exception):
+    pass
+
+def test_reader_accounts_reads_like_poll_once(tmp_path):
+    _, poller = make_poller(str(tmp_path))
+    runner = gps_async.GPS_Async_Runner(poller, log_interval=0.05)
+
+    async def watch():
+        for _ in range(2000):
+            if poller.fix.valid and poller.read_count > 20:
+                raise Done()
+
+            await asyncio.sleep(0.005)
+
+    async def main():
+        await asyncio.gather(runner.run(), watch())
+
+    try:
+        asyncio.run(main())
+    except Done:
+        pass
+
+    assert poller.fix.valid
+    assert abs(poller.fix.lat - 34.774078) < 1e-5
+    assert poller.state["max_buf_len"] > 0
+    assert poller.state["last_read_bytes"] > 0
+    assert poller.state["count_large_buf"] >= 1
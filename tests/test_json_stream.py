@@ -0,0 +1,60 @@
+import json
+
+import json_stream
+
+from sim_helpers import make_poller, run_until
+
+ENTRY = {
+    "time": [2018, 3, 13, 10, 0, 57, 1, 72],
+    "fix": {"valid": True, "lat": 34.774078333333335, "lon": -111.76589333333334, "alt": None, "speed": 4.86149583},
+    "state": {"errcnt_chkerr": 3, "last_chkerr": "@12: Skipping invalid checksum: [$GPRMC,??*00]", "quote": "a \"b\"\n\t\\ é", 7: "int key"},
+    "geofence": [["enter", "home", 36057], ("exit", "work", 36058)],
+    "empty": {},
+    "nested": [[], [[1.5e-07, 1e+22, -0.0, True, False, None]]],
+}
+
+def dump(obj, buf_size):
+    """ (bytes written, chunks as handed to the sink) """
+    chunks = []
+    json_stream.JSON_Stream(buf_size).dump(obj, (lambda data: chunks.append(bytes(data)),))
+    return b"".join(chunks), chunks
+
+def test_matches_json_dumps():
+    expected = (json.dumps(ENTRY) + "\n").encode()
+
+    # Down to a buffer smaller than most scalars, those pass through unbuffered
+    for buf_size in (4, 16, 64, 256, 4096):
+        data, chunks = dump(ENTRY, buf_size)
+
+        assert data == expected
+        assert len(chunks) > 1 or buf_size >= len(expected)
+
+def test_every_sink_gets_the_record():
+    first = []
+    second = []
+    stream = json_stream.JSON_Stream(8)
+    stream.dump({"a": list(range(20))}, (lambda data: first.append(bytes(data)), lambda data: second.append(bytes(data))))
+    expected = (json.dumps({"a": list(range(20))}) + "\n").encode()
+
+    assert b"".join(first) == b"".join(second) == expected
+    assert stream.stats()["json_record_bytes"] == len(expected)
+
+def test_log_lines_are_json_dumps_of_the_entry(tmp_path, monkeypatch):
+    sd_root = str(tmp_path)
+    _, poller = make_poller(sd_root)
+    encoder = poller.gps_log.encoder
+    real_dump = encoder.dump
+    expected = []
+
+    def dump(obj, sinks):
+        expected.append(json.dumps(obj) + "\n")
+        real_dump(obj, sinks)
+
+    monkeypatch.setattr(encoder, "dump", dump)
+    run_until(poller, monkeypatch, lambda: poller.fix.valid and poller.read_count > 20)
+
+    with open(next(tmp_path.glob("gps-log-*.json"))) as fh:
+        lines = fh.readlines()
+
+    assert len(lines) > 0
+    assert lines == expected[:len(lines)]
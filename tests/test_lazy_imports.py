@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+from sim_helpers import make_poller, read_log, run_until
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+
+OPTIONAL = ("stage_timer", "gps_aiding", "track_simplify", "json_stream", "mem_manager", "geofence", "gps_binlog", "gps_delta", "uplink")
+
+def test_optional_modules_are_not_imported_with_the_poller():
+    code = "import sys, gps_poller; print(' '.join(sorted(set(%r) & set(sys.modules))))" % (OPTIONAL,)
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=LIB_DIR, env=dict(os.environ, PYTHONPATH=LIB_DIR))
+
+    assert out.decode().strip() == ""
+
+def test_profiled_run_loop(tmp_path, monkeypatch):
+    sd_root = str(tmp_path)
+    _, poller = make_poller(sd_root, profile=True)
+    run_until(poller, monkeypatch, lambda: poller.fix.valid and poller.read_count > 20)
+
+    timing = read_log(sd_root)[-1]["timing"]
+
+    assert {"i2c_read", "framing", "checksum", "cmd_send"} <= set(timing)
+    assert read_log(sd_root)[-2]["timing"]["log_state"]["n"] == 1
+    assert poller.track is not None
+
+VOID_CAPTURE = [
+    "$GNRMC,100057.000,V,,,,,,,130318,,,N",
+    "$GNGLL,,,,,100057.000,V,N",
+]
+
+def test_log_records_before_the_first_fix(tmp_path, monkeypatch):
+    for log_format in ("json", "bin", "delta"):
+        for sd_root in (str(tmp_path / log_format), None):
+            if sd_root:
+                os.mkdir(sd_root)
+
+            _, poller = make_poller(sd_root, VOID_CAPTURE, log_format=log_format)
+            run_until(poller, monkeypatch, lambda: poller.read_count > 10)
+
+            assert not poller.fix.valid
+            assert poller.track is None
+
+    entries = read_log(str(tmp_path / "json"))
+
+    assert len(entries) > 5
+    assert entries[-1]["track"] == []
@@ -0,0 +1,41 @@
+import gps_hal
+import mem_manager
+
+from sim_helpers import make_poller
+
+def counting_probes(mem):
+    probes = []
+    mem.probe_largest_free = lambda: probes.append(mem.low_alarm)
+    return probes
+
+def test_probe_is_rate_limited(monkeypatch):
+    monkeypatch.setattr(gps_hal, "mem_free", lambda: 100000)
+    mem = mem_manager.Mem_Manager(probe_every=10)
+    probes = counting_probes(mem)
+
+    for _ in range(25):
+        mem.log_check()
+
+    assert len(probes) == 3
+
+def test_probe_every_record_while_low(monkeypatch):
+    monkeypatch.setattr(gps_hal, "mem_free", lambda: 1000)
+    mem = mem_manager.Mem_Manager(probe_every=10)
+    probes = counting_probes(mem)
+
+    for _ in range(5):
+        mem.log_check()
+
+    assert probes == [True] * 5
+    assert mem.stats()["mem_low_count"] == 1
+
+def test_poller_mem_manage_argument(tmp_path):
+    _, poller = make_poller(str(tmp_path), mem_manage=True)
+    assert poller.mem.threshold == 32768
+
+    _, poller = make_poller(str(tmp_path), mem_manage=8192)
+    assert poller.mem.threshold == 8192
+
+    mem = mem_manager.Mem_Manager(threshold=4096, low_watermark=2048)
+    _, poller = make_poller(str(tmp_path), mem_manage=mem)
+    assert poller.mem is mem
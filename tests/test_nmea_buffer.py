@@ -0,0 +1,53 @@
+import nmea_buffer
+
+class Chunked_I2C:
+    """ Returns data in chunks of at most read_size - 1 bytes, padded with newlines like the L76 """
+
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+
+    def readfrom_into(self, addr, buf):
+        part = self.data[:self.chunk]
+        self.data = self.data[self.chunk:]
+        buf[:len(part)] = part
+        buf[len(part):] = b"\n" * (len(buf) - len(part))
+
+def collect(data, chunk, **kwargs):
+    ring = nmea_buffer.NMEA_Ring_Buffer(**kwargs)
+    i2c = Chunked_I2C(data, chunk)
+    out = []
+
+    while i2c.data:
+        ring.fill(i2c, 0x10, lambda buf, start, end: out.append(bytes(buf[start:end])))
+
+    return ring, out
+
+SENTENCES = [
+    b"$GNRMC,100057.000,A,3446.4447,N,11145.9536,W,9.45,137.90,130318,,,A*6B",
+    b"$GPVTG,139.09,T,,M,9.75,N,18.07,K,A*3E",
+    b"$GPGGA,100057.000,3446.4447,N,11145.9536,W,1,9,0.92,1520.4,M,-26.5,M,,*5F",
+]
+
+def test_sentences_split_across_reads():
+    data = b"".join([sentence + b"\r\n" for sentence in SENTENCES]) * 5
+
+    for chunk in (7, 31, 64, 254):
+        ring, out = collect(data, chunk)
+
+        assert out == SENTENCES * 5
+        assert ring.carry == 0
+        assert ring.overflow_count == 0
+
+def test_unterminated_tail_is_carried():
+    ring, out = collect(SENTENCES[0] + b"\r\n" + SENTENCES[1][:10], 254)
+
+    assert out == [SENTENCES[0]]
+    assert ring.carry == 10
+
+def test_overlong_line_is_dropped_and_counted():
+    data = b"$" + b"X" * 600 + b"\r\n" + SENTENCES[1] + b"\r\n"
+    ring, out = collect(data, 200, carry_size=256)
+
+    assert ring.overflow_count >= 1
+    assert out[-1] == SENTENCES[1]
@@ -0,0 +1,78 @@
+import os
+
+from sim_helpers import framed, make_poller, read_log, run_until
+
+def test_run_loop_logs_fix_and_acks_commands(tmp_path, monkeypatch):
+    sd_root = str(tmp_path)
+    l76, poller = make_poller(sd_root)
+
+    # The battery is sampled in bus idle slots, which a busy L76 can hold off for a while
+    run_until(poller, monkeypatch, lambda: poller.fix.valid and not poller.cmds.pending() and poller.battery.voltage is not None and poller.read_count > 20)
+
+    assert "$PMTK314,1,1,1,1,1,1,0,0,0,0,0,0,0,0,0,0,0,1,0" in l76.commands
+    assert "$PQVEL,W,1,1" in l76.commands
+
+    entries = read_log(sd_root)
+    last = entries[-1]
+
+    assert last["fix"]["valid"]
+    assert abs(last["fix"]["lat"] - 34.774078) < 1e-5
+    assert abs(last["fix"]["lon"] + 111.765893) < 1e-5
+    assert last["fix"]["sats"] == 9
+    assert last["state"]["cmd_failed"] == 0
+    assert last["state"]["cmd_sent"] >= 12
+    assert last["battery_status"] == "OK"
+    assert poller.py.calibrations == 1
+    assert poller.bus.stats()["bus_deferred"] == 0
+
+    # log_stop() ran on the KeyboardInterrupt
+    assert os.path.exists(os.path.join(sd_root, "stoplog.txt"))
+
+def test_parse_pkt_updates_fix(tmp_path):
+    _, poller = make_poller(str(tmp_path))
+    poller.start_polling()
+
+    poller.parse_pkt(framed("$GNRMC,100057.000,A,3446.4447,S,11145.9536,E,9.45,137.90,130318,,,A"))
+    poller.parse_pkt(framed("$GPGGA,100057.000,3446.4447,S,11145.9536,E,1,7,1.50,12.5,M,-26.5,M,,"))
+
+    assert poller.fix.valid
+    assert abs(poller.fix.lat + 34.774078) < 1e-5
+    assert abs(poller.fix.lon - 111.765893) < 1e-5
+    assert poller.fix.sats == 7
+    assert poller.fix.hdop == 1.5
+    assert (poller.fix.year, poller.fix.month, poller.fix.day) == (2018, 3, 13)
+
+def test_bad_checksum_is_counted(tmp_path):
+    _, poller = make_poller(str(tmp_path))
+    poller.start_polling()
+
+    poller.parse_pkt("$GNRMC,100057.000,A,3446.4447,N,11145.9536,W,9.45,137.90,130318,,,A*00")
+    poller.update_stats()
+
+    assert not poller.fix.valid
+    assert poller.state["errcnt_chkerr"] == 1
+
+def test_non_ascii_corrupt_sentence(tmp_path):
+    _, poller = make_poller(str(tmp_path))
+    poller.start_polling()
+
+    pkt = bytearray(b"$GPRMC,\xff\xfe*00")
+    poller.handle_sentence(pkt, 0, len(pkt))
+    poller.update_stats()
+
+    assert poller.state["errcnt_chkerr"] == 1
+    assert poller.state["last_chkerr"].endswith("[$GPRMC,??*00]")
+    assert "last_chkerr" in str(poller)
+
+def test_parse_failures_keep_their_log_keys(tmp_path):
+    _, poller = make_poller(str(tmp_path))
+    poller.start_polling()
+
+    # Cut short, the parsers index past the end
+    poller.parse_pkt(framed("$GNRMC,100057.000,A"))
+    poller.parse_pkt(framed("$GNGLL,3446.4447,N"))
+    poller.update_stats()
+
+    assert poller.state["errcnt_parse_rmc_fail"] == 1
+    assert poller.state["errcnt_parse_gll_fail"] == 1
+    assert poller.state["last_parse_rmc_fail"].startswith("@0: Failed to parse: $GNRMC")
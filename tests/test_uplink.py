@@ -0,0 +1,223 @@
+import io
+import time
+
+import pytest
+
+import gps_fix
+import uplink
+from gpslog import uplink as receiver_tool
+
+TM = (2018, 3, 13, 10, 0, 57)
+
+class List_Transport:
+    host = "list"
+
+    def __init__(self):
+        self.payloads = []
+
+    def resolve(self):
+        return ("127.0.0.1", 0)
+
+    def send(self, payload):
+        self.payloads.append(bytes(payload))
+
+    def close(self):
+        pass
+
+class Trickle_Socket:
+    """ A socket whose send() and recv() move at most 3 bytes at a time """
+
+    def __init__(self, incoming=b""):
+        self.sent = b""
+        self.incoming = incoming
+
+    def send(self, data):
+        self.sent += bytes(data[:3])
+        return min(3, len(data))
+
+    def recv(self, nbytes):
+        part = self.incoming[:min(3, nbytes)]
+        self.incoming = self.incoming[len(part):]
+        return part
+
+class Fake_Socket_Module:
+    """ Records the socket calls, getaddrinfo() and connect() fail while fail is set """
+
+    AF_INET = 2
+    SOCK_DGRAM = 2
+    SOCK_STREAM = 1
+
+    def __init__(self):
+        self.calls = []
+        self.lookups = 0
+        self.fail_lookup = False
+        self.fail_connect = False
+
+    def getaddrinfo(self, host, port):
+        self.lookups += 1
+
+        if self.fail_lookup:
+            raise OSError("no DNS")
+
+        return [(self.AF_INET, self.SOCK_STREAM, 0, "", ("10.0.0.1", port))]
+
+    def socket(self, family, kind):
+        return Fake_Socket(self)
+
+class Fake_Socket:
+    def __init__(self, module):
+        self.module = module
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def connect(self, addr):
+        self.module.calls.append(("connect", addr, self.timeout))
+
+        if self.module.fail_connect:
+            raise OSError("unreachable")
+
+    def sendto(self, payload, addr):
+        self.module.calls.append(("sendto", addr, self.timeout))
+
+    def close(self):
+        pass
+
+def add_fixes(link, count):
+    fix = gps_fix.GPS_Fix()
+
+    for idx in range(count):
+        fix.valid = True
+        fix.lat = 34.774078 + idx * 1e-4
+        fix.lon = -111.765893
+        link.add(TM, fix, 4.1, True, idx, 50000)
+
+def test_transport_from_url():
+    assert uplink.transport_from_url("udp://127.0.0.1:9999").port == 9999
+
+    mqtt = uplink.transport_from_url("mqtt://broker")
+    assert (mqtt.port, mqtt.topic) == (1883, b"pytrack")
+
+    for url in ("udp://host", "udp://host:", "udp://host:abc", "mqtt://:1883/t", "http://host:80"):
+        with pytest.raises(ValueError):
+            uplink.transport_from_url(url)
+
+def test_partial_send_and_recv():
+    sock = Trickle_Socket(b"\x20\x02\x00\x00rest")
+    uplink.send_all(sock, b"0123456789")
+
+    assert sock.sent == b"0123456789"
+    assert uplink.recv_exactly(sock, 4) == b"\x20\x02\x00\x00"
+
+    with pytest.raises(OSError):
+        uplink.recv_exactly(sock, 8)
+
+def test_ram_spool_is_small():
+    link = uplink.Uplink(List_Transport(), lambda: False, lambda *args: None, batch_records=5, compress=False)
+
+    for _ in range(40):
+        add_fixes(link, 5)
+        link.poll()
+
+    assert link.spool.path is None
+    assert 0 < link.spool.bytes <= 8192
+    assert link.stats()["uplink_dropped"] > 0
+
+def test_sequence_survives_empty_spool(tmp_path):
+    spool_dir = str(tmp_path / "uplink")
+    transport = List_Transport()
+    link = uplink.Uplink(transport, lambda: True, lambda *args: None, spool_dir, batch_records=5, min_gap=0)
+    add_fixes(link, 10)
+    link.poll()
+    link.poll()
+
+    assert len(transport.payloads) == 2
+    assert not len(link.spool)
+
+    link = uplink.Uplink(transport, lambda: True, lambda *args: None, spool_dir, batch_records=5, min_gap=0)
+    add_fixes(link, 5)
+    link.poll()
+
+    assert [receiver_tool.decode_batch(payload)[0] for payload in transport.payloads] == [1, 2, 3]
+
+def test_mqtt_to_stand_in_broker():
+    out = io.StringIO()
+    receiver = receiver_tool.Receiver(out)
+    servers = receiver_tool.serve(receiver, mqtt_port=0, host="127.0.0.1")
+
+    try:
+        port = servers[0].server_address[1]
+        link = uplink.Uplink(uplink.transport_from_url("mqtt://127.0.0.1:%d/fleet" % port), lambda: True, lambda *args: None, batch_records=5, min_gap=0)
+        add_fixes(link, 10)
+        link.poll()
+        link.poll()
+        link.close()
+
+        # The broker decodes in its own thread
+        for _ in range(100):
+            if receiver.records == 10:
+                break
+
+            time.sleep(0.01)
+
+        assert receiver.batches == 2
+        assert receiver.records == 10
+        assert link.stats()["uplink_errors"] == 0
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+def test_host_is_resolved_once_and_sockets_time_out(monkeypatch):
+    fake = Fake_Socket_Module()
+    monkeypatch.setattr(uplink, "socket", fake)
+
+    udp = uplink.transport_from_url("udp://tracker.example:9999")
+    udp.send(b"1")
+    udp.close()
+    udp.send(b"2")
+
+    assert fake.lookups == 1
+    assert fake.calls == [("sendto", ("10.0.0.1", 9999), 0.2)] * 2
+
+    fake.fail_connect = True
+    mqtt = uplink.transport_from_url("mqtt://broker.example/fleet")
+
+    for _ in range(2):
+        with pytest.raises(OSError):
+            mqtt.send(b"3")
+
+    assert fake.lookups == 2
+    assert fake.calls[-1] == ("connect", ("10.0.0.1", 1883), 0.5)
+
+def test_failures_back_off(monkeypatch):
+    fake = Fake_Socket_Module()
+    monkeypatch.setattr(uplink, "socket", fake)
+    now = [0]
+    monkeypatch.setattr(uplink.gps_hal, "ticks_ms", lambda: now[0])
+    link = uplink.Uplink(uplink.transport_from_url("mqtt://broker.example/fleet"), lambda: True, lambda *args: None,
+                         batch_records=5, retry_interval=5, retry_max=300)
+    add_fixes(link, 5)
+
+    # A failed lookup waits retry_max before the next one
+    fake.fail_lookup = True
+    link.poll()
+    now[0] += 299000
+    link.poll()
+
+    assert fake.lookups == 1
+    assert len(link.spool) == 1
+
+    # Lookup works, the broker is unreachable: back off from retry_interval
+    fake.fail_lookup = False
+    fake.fail_connect = True
+    now[0] += 1000
+    link.poll()
+    link.poll()
+    now[0] += 5000
+    link.poll()
+
+    assert [call[0] for call in fake.calls] == ["connect", "connect"]
+    assert link.backoff_ms == 10000
+    assert link.stats()["uplink_errors"] == 3
@@ -0,0 +1,13 @@
+"""
+Host side tools for pytrack-poller logs
+
+The on-device modules in lib/ are put on sys.path so the log formats and
+NMEA parsing rules are shared with the poller rather than duplicated.
+"""
+import os
+import sys
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "lib")
+
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
@@ -0,0 +1,286 @@
+"""
+Columnar analytics over gps-log-YYYYMMDDHH.json / .delta archives
+
+    python -m gpslog.analytics --out fleet.npz -j 8 logs/*/gps-log-*.json
+    python -m gpslog.analytics --summary fleet.npz
+
+Log entries are streamed file by file and flattened into one row each:
+entry time, fix time, lat, lon, speed, course, battery, mem_free, read count
+and every errcnt_* counter. Entries written by the current poller carry the
+parsed "fix", for older logs (and keep_raw logs) the raw $xxRMC / $xxGLL /
+$PQVEL sentences in "state" are parsed with the same lib/nmea rules the
+poller uses, checksum check included. Files are spread over a process pool
+and the rows end up as NumPy columns, saved with np.savez_compressed so a
+reload is a single np.load.
+"""
+import argparse
+import calendar
+import json
+import sys
+
+from . import LIB_DIR # pylint: disable=W0611
+from . import delta
+import nmea
+import gps_fix
+
+FLOAT_COLUMNS = ("time", "fix_time", "lat", "lon", "speed", "course", "battery")
+INT_COLUMNS = ("mem_free", "count", "battery_ok")
+ERRCNT_PREFIX = "errcnt_"
+
+def iter_entries(filename):
+    """ Full log entries of a JSON lines or delta log file """
+    if filename.endswith(".delta"):
+        for entry in delta.iter_files([filename]):
+            yield entry
+        return
+
+    with open(filename) as fh:
+        for line in fh:
+            line = line.strip()
+
+            if line:
+                yield json.loads(line)
+
+def parse_time(log_time):
+    """ "YYYY-MM-DD HH:MM:SS UTC" -> unix seconds """
+    try:
+        return float(calendar.timegm((
+            int(log_time[0:4]), int(log_time[5:7]), int(log_time[8:10]),
+            int(log_time[11:13]), int(log_time[14:16]), int(log_time[17:19]), 0, 0, 0)))
+    except (TypeError, ValueError):
+        return None
+
+def fix_time(year, month, day, hour, minute, second):
+    if None in (year, month, day, hour, minute, second):
+        return None
+
+    if year < 100:
+        year += 2000
+
+    return calendar.timegm((year, month, day, hour, minute, 0, 0, 0, 0)) + second
+
+def sentence_fields(sentence):
+    """ Checksum checked fields of a raw sentence, None if it does not verify """
+    data = sentence.encode("ascii")
+    star = nmea.check_frame(data, 0, len(data))
+
+    if star < 0 and star != nmea.FRAME_NO_CHKSUM:
+        return None
+
+    return sentence[:star if star > 0 else len(sentence)].split(",")
+
+def fix_from_raw(state, row):
+    """ Fill row from the raw sentences kept in state, following GPS_Poller.parse_rmc/parse_gll/parse_pqvel """
+    # Raw sentences stay in state after the fix is lost
+    if not state.get("have_fix"):
+        return
+
+    rmc = gll = pqvel = None
+
+    for key, value in state.items():
+        if not isinstance(value, str) or key[:1] != "$":
+            continue
+
+        kind = key[3:6]
+
+        if kind == "RMC" and rmc is None:
+            fields = sentence_fields(value)
+
+            if fields and len(fields) > 9 and fields[2] == "A":
+                rmc = fields
+        elif kind == "GLL" and gll is None:
+            fields = sentence_fields(value)
+
+            if fields and len(fields) > 6 and fields[6] == "A":
+                gll = fields
+        elif key == "$PQVEL":
+            fields = sentence_fields(value)
+
+            if fields and len(fields) > 3 and fields[1] != "W":
+                pqvel = fields
+
+    try:
+        if rmc:
+            row["lat"], row["lon"] = nmea.parse_ll(rmc[3:7])
+            speed_kn = nmea.parse_float(rmc[7])
+            row["speed"] = speed_kn * gps_fix.GPS_Fix.KNOTS_TO_MS if speed_kn is not None else None
+            row["course"] = nmea.parse_float(rmc[8])
+            row["fix_time"] = fix_time(*(nmea.parse_date(rmc[9]) + nmea.parse_utc(rmc[1])))
+        elif gll:
+            row["lat"], row["lon"] = nmea.parse_ll(gll[1:5])
+    except (ValueError, IndexError):
+        pass
+
+    if pqvel and row.get("speed") is None:
+        try:
+            row["speed"] = (float(pqvel[1]) ** 2 + float(pqvel[2]) ** 2) ** 0.5
+        except ValueError:
+            pass
+
+def entry_row(entry):
+    """ Flatten a log entry into a dict of scalar columns """
+    state = entry.get("state") or {}
+    row = {
+        "time": parse_time(entry.get("time")),
+        "battery": entry.get("battery"),
+        "battery_ok": 1 if entry.get("battery_status") == "OK" else 0,
+        "mem_free": entry.get("mem_free"),
+        "count": entry.get("count"),
+    }
+
+    fix = entry.get("fix")
+
+    if fix:
+        if fix.get("valid"):
+            row["lat"] = fix.get("lat")
+            row["lon"] = fix.get("lon")
+
+        row["speed"] = fix.get("speed")
+        row["course"] = fix.get("course")
+        row["fix_time"] = fix_time(fix.get("year"), fix.get("month"), fix.get("day"),
+                                   fix.get("hour"), fix.get("minute"), fix.get("second"))
+    else:
+        fix_from_raw(state, row)
+
+    for key, value in state.items():
+        if key.startswith(ERRCNT_PREFIX):
+            row[key] = value
+
+    return row
+
+def load_file(filename):
+    """ Column lists of one file: {name: [values]}, rows missing a column hold None """
+    columns = {}
+    rows = 0
+
+    for entry in iter_entries(filename):
+        for key, value in entry_row(entry).items():
+            column = columns.get(key)
+
+            if column is None:
+                column = columns[key] = [None] * rows
+
+            column.append(value)
+
+        rows += 1
+
+        for column in columns.values():
+            if len(column) < rows:
+                column.append(None)
+
+    return filename, rows, columns
+
+def load(filenames, processes=None):
+    """
+    Load log files into a dict of NumPy columns
+
+    Missing floats are NaN, missing ints -1 and missing error counters 0.
+    processes=1 loads in this process, otherwise files are spread over a
+    multiprocessing pool (None = one worker per CPU).
+    """
+    import numpy as np
+
+    if processes == 1 or len(filenames) < 2:
+        results = [load_file(filename) for filename in filenames]
+    else:
+        import multiprocessing
+
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(load_file, filenames, chunksize=max(1, len(filenames) // (8 * (processes or multiprocessing.cpu_count()))))
+
+    names = set(FLOAT_COLUMNS + INT_COLUMNS)
+
+    for _, _, columns in results:
+        names.update(columns)
+
+    total = sum([rows for _, rows, _ in results])
+    arrays = {}
+
+    for name in sorted(names):
+        if name.startswith(ERRCNT_PREFIX):
+            dtype, missing = np.int64, 0
+        elif name in INT_COLUMNS:
+            dtype, missing = np.int64, -1
+        else:
+            dtype, missing = np.float64, np.nan
+
+        out = np.empty(total, dtype=dtype)
+        pos = 0
+
+        for _, rows, columns in results:
+            values = columns.get(name)
+
+            if values is None:
+                out[pos:pos + rows] = missing
+            else:
+                out[pos:pos + rows] = [missing if value is None else value for value in values]
+
+            pos += rows
+
+        arrays[name] = out
+
+    file_index = np.empty(total, dtype=np.int32)
+    pos = 0
+
+    for idx, (_, rows, _) in enumerate(results):
+        file_index[pos:pos + rows] = idx
+        pos += rows
+
+    # Not "file", that is the path argument of np.savez_compressed
+    arrays["file_index"] = file_index
+    arrays["files"] = np.array([filename for filename, _, _ in results])
+
+    return arrays
+
+def save(path, arrays):
+    import numpy as np
+    np.savez_compressed(path, **arrays)
+
+def reload(path):
+    import numpy as np
+
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+def summary(arrays):
+    import numpy as np
+
+    lines = ["%d entries from %d files" % (len(arrays["time"]), len(arrays["files"]))]
+    has_fix = ~np.isnan(arrays["lat"])
+    lines.append("with fix: %d (%.1f%%)" % (has_fix.sum(), 100.0 * has_fix.mean() if len(has_fix) else 0.0))
+
+    for name in ("speed", "battery", "mem_free"):
+        values = arrays[name].astype(np.float64)
+        values = values[~np.isnan(values) & (values >= 0)]
+
+        if len(values):
+            lines.append("%s: min %.3f mean %.3f max %.3f" % (name, values.min(), values.mean(), values.max()))
+
+    for name in sorted(arrays):
+        if name.startswith(ERRCNT_PREFIX):
+            lines.append("%s: max %d" % (name, arrays[name].max()))
+
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar analytics over JSON/delta GPS logs")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--out", help="save the columns to this .npz file")
+    parser.add_argument("--summary", help="print the summary of a saved .npz file")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    if args.summary:
+        arrays = reload(args.summary)
+    elif args.files:
+        arrays = load(args.files, args.processes)
+
+        if args.out:
+            save(args.out, arrays)
+    else:
+        parser.error("no log files given")
+
+    sys.stdout.write(summary(arrays) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Decode binary gps-log-YYYYMMDDHH.bin files
+
+    python -m gpslog.binlog gps-log-2018031310.bin [...]               # JSON lines to stdout
+    python -m gpslog.binlog --npy out.npy gps-log-2018031310.bin [...] # NumPy structured array
+"""
+import argparse
+import json
+import sys
+
+from . import LIB_DIR # pylint: disable=W0611
+import gps_binlog
+
+def iter_records(fh, stats=None):
+    """
+    Stream decoded records from a binary log file object
+
+    Records failing their CRC are skipped and counted in stats["crc_errors"].
+    After a failure the decoder slides one byte at a time until a record
+    checks out again, so a record cut short by a reset does not shift every
+    record after it. The bytes skipped are counted in stats["resync_bytes"].
+    """
+    record_size = gps_binlog.check_header(fh.read(gps_binlog.HEADER_SIZE))
+    data = fh.read(record_size)
+    resyncing = False
+
+    while len(data) == record_size:
+        record = gps_binlog.decode_record(data)
+
+        if record is None:
+            if stats is not None:
+                if not resyncing:
+                    stats["crc_errors"] = stats.get("crc_errors", 0) + 1
+                stats["resync_bytes"] = stats.get("resync_bytes", 0) + 1
+
+            resyncing = True
+            data = data[1:] + fh.read(1)
+            continue
+
+        resyncing = False
+        yield record
+        data = fh.read(record_size)
+
+def iter_files(filenames, stats=None):
+    for filename in filenames:
+        with open(filename, "rb") as fh:
+            for record in iter_records(fh, stats):
+                yield record
+
+def numpy_dtype():
+    import numpy as np
+
+    fields = []
+
+    for name, typ, scale in gps_binlog.RECORD_FIELDS:
+        if name == "flags":
+            fields.append(("valid", "?"))
+            fields.append(("battery_ok", "?"))
+        elif scale == 1 and typ in "BH":
+            fields.append((name, "<i4"))
+        elif scale == 1:
+            fields.append((name, "<i8"))
+        else:
+            fields.append((name, "<f8"))
+
+    return np.dtype(fields)
+
+def to_numpy(filenames, stats=None):
+    """ Load binary logs into a NumPy structured array, missing values are -1 or NaN """
+    import numpy as np
+
+    dtype = numpy_dtype()
+    rows = []
+
+    for record in iter_files(filenames, stats):
+        record["battery_ok"] = record.pop("battery_status") == "OK"
+        rows.append(tuple([_missing(record[name], dtype[name]) for name in dtype.names]))
+
+    return np.array(rows, dtype=dtype)
+
+def _missing(value, field_dtype):
+    if value is not None:
+        return value
+
+    return float("nan") if field_dtype.kind == "f" else -1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode binary GPS logs")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--npy", help="write a NumPy structured array instead of JSON lines")
+    args = parser.parse_args(argv)
+
+    stats = {}
+
+    if args.npy:
+        import numpy as np
+        np.save(args.npy, to_numpy(args.files, stats))
+    else:
+        for record in iter_files(args.files, stats):
+            sys.stdout.write(json.dumps(record) + "\n")
+
+    if stats.get("crc_errors"):
+        sys.stderr.write("** %d records failed CRC\n" % stats["crc_errors"])
+
+if __name__ == "__main__":
+    main()
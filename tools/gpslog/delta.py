@@ -0,0 +1,43 @@
+"""
+Rebuild full records from delta encoded gps-log-YYYYMMDDHH.delta files
+
+    python -m gpslog.delta gps-log-2018031310.delta [...] # JSON lines to stdout
+"""
+import argparse
+import json
+import sys
+
+from . import LIB_DIR # pylint: disable=W0611
+import gps_delta
+
+def iter_snapshots(fh):
+    """ Stream full records from a delta log file object """
+    reader = gps_delta.Delta_Reader()
+
+    for line in fh:
+        line = line.strip()
+
+        if not line:
+            continue
+
+        snapshot = reader.apply(json.loads(line))
+
+        if snapshot is not None:
+            yield snapshot
+
+def iter_files(filenames):
+    for filename in filenames:
+        with open(filename) as fh:
+            for snapshot in iter_snapshots(fh):
+                yield snapshot
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild full records from delta GPS logs")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+
+    for snapshot in iter_files(args.files):
+        sys.stdout.write(json.dumps(snapshot) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Stand-in receiver for the telemetry uplink
+
+    python -m gpslog.uplink --udp 9999       # GPS_Poller(uplink_url="udp://<host>:9999")
+    python -m gpslog.uplink --mqtt 1883      # GPS_Poller(uplink_url="mqtt://<host>:1883/pytrack")
+
+Decodes every batch and writes its fixes as JSON lines to stdout, each with
+the batch "seq". The MQTT side is a minimal broker: it accepts CONNECT and
+QoS 0 PUBLISH, answers PINGREQ and ignores everything else. Gaps in the
+batch sequence numbers are reported on stderr.
+"""
+import argparse
+import json
+import socketserver
+import struct
+import sys
+import threading
+import zlib
+
+from . import LIB_DIR # pylint: disable=W0611
+import gps_binlog
+import uplink
+
+def decode_batch(payload):
+    """ (seq, [record dicts]) of an uplink batch, records failing their CRC are left out """
+    magic, version, flags, record_size, count, seq = struct.unpack_from(uplink.HEADER_FORMAT, payload, 0)
+
+    if magic != uplink.MAGIC:
+        raise ValueError("Not an uplink batch")
+
+    if version > uplink.VERSION:
+        raise ValueError("Unsupported uplink batch version %d" % version)
+
+    data = payload[uplink.HEADER_SIZE:]
+
+    if flags & uplink.FLAG_DEFLATE:
+        data = zlib.decompress(data)
+
+    records = []
+
+    for idx in range(count):
+        record = gps_binlog.decode_record(data[idx * record_size:(idx + 1) * record_size])
+
+        if record is not None:
+            records.append(record)
+
+    return seq, records
+
+class Receiver:
+    """ Collects decoded batches, thread safe so UDP and MQTT can share one """
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.lock = threading.Lock()
+        self.last_seq = None
+        self.batches = 0
+        self.records = 0
+        self.bytes = 0
+
+    def batch(self, payload):
+        try:
+            seq, records = decode_batch(payload)
+        except (ValueError, struct.error, zlib.error) as e:
+            sys.stderr.write("bad batch: %s\n" % e)
+            return
+
+        with self.lock:
+            if self.last_seq is not None and seq != self.last_seq + 1:
+                sys.stderr.write("batch %d follows %d\n" % (seq, self.last_seq))
+
+            self.last_seq = seq
+            self.batches += 1
+            self.records += len(records)
+            self.bytes += len(payload)
+
+            for record in records:
+                record["seq"] = seq
+                self.out.write(json.dumps(record) + "\n")
+
+            self.out.flush()
+
+def read_exactly(rfile, nbytes):
+    data = rfile.read(nbytes)
+
+    if len(data) < nbytes:
+        raise EOFError()
+
+    return data
+
+def read_packet(rfile):
+    """ (packet type and flags byte, body) of the next MQTT packet """
+    first = read_exactly(rfile, 1)[0]
+    length = 0
+    shift = 0
+
+    while True:
+        byte = read_exactly(rfile, 1)[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            break
+
+    return first, read_exactly(rfile, length)
+
+class MQTT_Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            while True:
+                first, body = read_packet(self.rfile)
+                kind = first >> 4
+
+                if kind == 1: # CONNECT
+                    self.wfile.write(b"\x20\x02\x00\x00")
+                elif kind == 3: # PUBLISH
+                    topic_len = struct.unpack_from(">H", body, 0)[0]
+                    offset = 2 + topic_len
+
+                    # QoS 1 and 2 carry a packet id
+                    if first & 0x06:
+                        offset += 2
+
+                    self.server.receiver.batch(body[offset:])
+                elif kind == 12: # PINGREQ
+                    self.wfile.write(b"\xd0\x00")
+                elif kind == 14: # DISCONNECT
+                    return
+        except EOFError:
+            return
+
+class UDP_Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.receiver.batch(self.request[0])
+
+class Threading_TCP_Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+def serve(receiver, udp_port=None, mqtt_port=None, host="0.0.0.0"):
+    """ Start the servers in background threads, returns them """
+    servers = []
+
+    if udp_port is not None:
+        servers.append(socketserver.UDPServer((host, udp_port), UDP_Handler))
+
+    if mqtt_port is not None:
+        servers.append(Threading_TCP_Server((host, mqtt_port), MQTT_Handler))
+
+    for server in servers:
+        server.receiver = receiver
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    return servers
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive and decode GPS uplink batches")
+    parser.add_argument("--udp", type=int, help="UDP port to listen on")
+    parser.add_argument("--mqtt", type=int, help="MQTT port to listen on")
+    parser.add_argument("--host", default="0.0.0.0")
+    args = parser.parse_args(argv)
+
+    if args.udp is None and args.mqtt is None:
+        parser.error("give --udp and/or --mqtt")
+
+    receiver = Receiver()
+    servers = serve(receiver, args.udp, args.mqtt, args.host)
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+    for server in servers:
+        server.shutdown()
+
+    sys.stderr.write("%d batches, %d fixes, %d bytes (%.1f bytes/fix)\n" % (
+        receiver.batches, receiver.records, receiver.bytes, receiver.bytes / receiver.records if receiver.records else 0.0))
+
+if __name__ == "__main__":
+    main()